@@ -0,0 +1,288 @@
+"""
+Benchmark the populate/analysis engines on synthetic rasters.
+
+Runs every registered engine across grid sizes, discharge counts, worker counts and
+backends against a local stand-in database (default: river_architect_bench), and
+appends one JSON record per case to a results file. Compare two result files with
+--baseline to flag throughput regressions between releases.
+
+The derived-raster store (derived_cache) is off unless --derived-cache is given, so a
+repeat computes its rasters instead of hard-linking those of the previous repeat.
+
+Example:
+    python Benchmarks/run_benchmarks.py --sizes 512,2048 --discharges 8 --out bench.jsonl
+"""
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+# Ensure project root is on sys.path so sibling packages import cleanly
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+import config
+import fGl
+from Database import input_condition_database as db_setup
+from Module_Services import derived_cache, populate_features, storage
+from synthetic_rasters import make_condition_stack
+
+# Engine name -> callable(condition_name, conn, **options). Register new engines here.
+ENGINES = {
+    "bed_shear": populate_features.calculate_bed_shear_stress,
+    "bed_shield": populate_features.calculate_bed_shield_stress,
+}
+
+BENCH_DB = "river_architect_bench"
+REGRESSION_THRESHOLD = 0.10
+
+
+class PeakRssSampler:
+    """Poll the process RSS on a background thread and keep the maximum."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = fGl.current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, fGl.current_rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, fGl.current_rss_bytes())
+        return False
+
+
+def _io_counters():
+    """Return (read_bytes, write_bytes) of this process, or None without psutil."""
+    try:
+        import psutil
+        counters = psutil.Process().io_counters()
+        return counters.read_bytes, counters.write_bytes
+    except (ImportError, AttributeError, OSError):
+        return None
+
+
+def _connect(db_name: str, storage_backend: str, workdir: str):
+    if storage_backend == "sqlite":
+        # No server needed: the benchmark database is a file next to the synthetic inputs.
+        return storage.connect("sqlite", os.path.join(workdir, db_name + ".sqlite"))
+    db_setup.ensure_database_exists(db_name)
+    db_setup.ensure_tables(db_name)
+    return storage.connect(
+        "postgres",
+        dbname=db_name,
+        user=db_setup.DB_USER,
+        password=db_setup.DB_PASSWORD,
+        host=db_setup.DB_HOST,
+        port=db_setup.DB_PORT,
+    )
+
+
+def _register_condition(conn, name: str, stack: dict, output_root: str):
+    """Insert or refresh the benchmark condition row pointing at a synthetic stack."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO condition (
+            condition_name, unit, depth_rasters, velocity_rasters,
+            digital_elevation_model, grain_size_raster, condition_output_path
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (condition_name) DO UPDATE SET
+            unit = EXCLUDED.unit,
+            depth_rasters = EXCLUDED.depth_rasters,
+            velocity_rasters = EXCLUDED.velocity_rasters,
+            digital_elevation_model = EXCLUDED.digital_elevation_model,
+            grain_size_raster = EXCLUDED.grain_size_raster,
+            condition_output_path = EXCLUDED.condition_output_path;
+        """,
+        (
+            name,
+            "SI Units",
+            ";".join(stack["depth_paths"]),
+            ";".join(stack["vel_paths"]),
+            stack["dem_path"],
+            stack["grain_path"],
+            os.path.join(output_root, f"{name}_outputs"),
+        ),
+    )
+    conn.commit()
+    cur.close()
+
+
+def _engine_options(engine, workers, backend):
+    """Keep only the options an engine accepts; return None if a requested one is unsupported."""
+    params = inspect.signature(engine).parameters
+    options = {}
+    for key, value in (("workers", workers), ("backend", backend)):
+        if value is None:
+            continue
+        if key not in params:
+            return None
+        options[key] = value
+    return options
+
+
+def run_case(conn, engine_name, stack, condition_name, rows, cols, workers, backend):
+    """Run one engine on one stack and return the measurement record."""
+    engine = ENGINES[engine_name]
+    options = _engine_options(engine, workers, backend)
+    if options is None:
+        return None
+    inputs = stack["depth_paths"] + stack["vel_paths"] + [stack["grain_path"]]
+    io_before = _io_counters()
+    hits_before = derived_cache.fetch_counts()["hits"]
+    with PeakRssSampler() as sampler:
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        outputs = engine(condition_name, conn, **options)
+        seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+    io_after = _io_counters()
+    cache_hits = derived_cache.fetch_counts()["hits"] - hits_before
+    if io_before and io_after:
+        bytes_read, bytes_written = io_after[0] - io_before[0], io_after[1] - io_before[1]
+        io_source = "psutil"
+    else:
+        bytes_read, bytes_written = fGl.file_bytes(inputs), fGl.file_bytes(outputs)
+        io_source = "file_sizes"
+    n_discharges = len(stack["depth_paths"])
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "engine": engine_name,
+        "rows": rows,
+        "cols": cols,
+        "discharges": n_discharges,
+        "workers": workers,
+        "backend": backend,
+        "seconds": round(seconds, 4),
+        "cpu_seconds": round(cpu_seconds, 4),
+        "mpixels_per_s": round(rows * cols * n_discharges / seconds / 1e6, 3) if seconds > 0 else None,
+        "peak_rss_bytes": sampler.peak,
+        "bytes_read": bytes_read,
+        "bytes_written": bytes_written,
+        "io_source": io_source,
+        "derived_cache": bool(config.derived_cache_enabled),
+        "derived_cache_hits": cache_hits,
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def _case_key(record):
+    return (
+        record["engine"], record["rows"], record["cols"], record["discharges"], record["workers"], record["backend"],
+        record.get("derived_cache", False),
+    )
+
+
+def compare_with_baseline(records, baseline_path: str, threshold: float = REGRESSION_THRESHOLD):
+    """Print cases whose throughput dropped by more than `threshold` against a baseline file."""
+    baseline = {}
+    with open(baseline_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                rec = json.loads(line)
+                baseline[_case_key(rec)] = rec
+    regressions = 0
+    for rec in records:
+        old = baseline.get(_case_key(rec))
+        if not old or not old.get("mpixels_per_s") or not rec.get("mpixels_per_s"):
+            continue
+        change = rec["mpixels_per_s"] / old["mpixels_per_s"] - 1.0
+        flag = "REGRESSION" if change < -threshold else "ok"
+        regressions += flag == "REGRESSION"
+        print(f"{flag:>10}  {rec['engine']} {rec['rows']}x{rec['cols']} q={rec['discharges']} "
+              f"workers={rec['workers']} backend={rec['backend']}: "
+              f"{old['mpixels_per_s']} -> {rec['mpixels_per_s']} Mpx/s ({change:+.1%})")
+    return regressions
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def _opt_list(text, cast=str):
+    """Parse a comma list; an empty string means 'engine default' (None)."""
+    values = [cast(v) for v in text.split(",") if v.strip()]
+    return values or [None]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark River Architect raster engines.")
+    parser.add_argument("--sizes", default="512,1024", help="Square grid sizes in cells, comma separated.")
+    parser.add_argument("--discharges", default="4", help="Discharge counts, comma separated.")
+    parser.add_argument("--workers", default="", help="Worker counts (only for engines that accept them).")
+    parser.add_argument("--backends", default="", help="Backends (only for engines that accept them).")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Engines to run, comma separated.")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join(config.dir2cache, "benchmarks"))
+    parser.add_argument("--db-name", default=BENCH_DB)
+    parser.add_argument("--storage", choices=storage.BACKENDS, default="postgres",
+                        help="Database of the benchmark conditions; sqlite needs no server.")
+    parser.add_argument("--derived-cache", action="store_true",
+                        help="Serve repeated cases from the derived-raster store (measures cache hits).")
+    parser.add_argument("--out", default=os.path.join(BASE_DIR, "Benchmarks", "results.jsonl"))
+    parser.add_argument("--baseline", help="Earlier results file to compare throughput against.")
+    args = parser.parse_args(argv)
+
+    engines = [e for e in args.engines.split(",") if e.strip()]
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        parser.error(f"Unknown engine(s): {', '.join(unknown)}. Known: {', '.join(ENGINES)}")
+
+    config.derived_cache_enabled = args.derived_cache
+    os.makedirs(args.workdir, exist_ok=True)
+    conn = _connect(args.db_name, args.storage, args.workdir)
+    records = []
+    try:
+        for size in _int_list(args.sizes):
+            for n_q in _int_list(args.discharges):
+                stack = make_condition_stack(os.path.join(args.workdir, "inputs"), size, size, n_q, seed=args.seed)
+                condition_name = f"bench_{size}x{size}_q{n_q}"
+                _register_condition(conn, condition_name, stack, os.path.join(args.workdir, "outputs"))
+                for engine_name in engines:
+                    for workers in _opt_list(args.workers, int):
+                        for backend in _opt_list(args.backends):
+                            for _ in range(args.repeat):
+                                rec = run_case(conn, engine_name, stack, condition_name, size, size, workers, backend)
+                                if rec is None:
+                                    print(f"skip {engine_name}: does not accept workers/backend options")
+                                    break
+                                records.append(rec)
+                                print(f"{engine_name:>12} {size}x{size} q={n_q} workers={workers} backend={backend}: "
+                                      f"{rec['seconds']:.2f} s, {rec['mpixels_per_s']} Mpx/s, "
+                                      f"peak RSS {rec['peak_rss_bytes'] / 2**20:.0f} MiB, "
+                                      f"{rec['derived_cache_hits']} derived-cache hit(s)")
+    finally:
+        conn.close()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "a", encoding="utf-8") as fh:
+        for rec in records:
+            fh.write(json.dumps(rec) + "\n")
+    print(f"Wrote {len(records)} result(s) to {args.out}")
+
+    if args.baseline:
+        return 1 if compare_with_baseline(records, args.baseline) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Synthetic condition stacks (depth, velocity, DEM, grain size) for benchmarks.
+
+The terrain is a sloping valley with a sinuous channel. Each discharge raises the
+water surface, so low flows wet only the channel and high flows spill onto the
+floodplain. Dry cells and the area outside the model domain are NoData, as in
+hydrodynamic model exports.
+"""
+import json
+import os
+
+import arcpy
+import numpy as np
+
+import fGl
+
+NODATA = -9999.0
+DEFAULT_WKID = 26910  # NAD83 / UTM zone 10N
+
+
+def discharge_series(n_discharges: int):
+    """Return `n_discharges` increasing discharge values (geometric spacing)."""
+    return [int(round(10 * 1.6 ** i)) for i in range(n_discharges)]
+
+
+def _write(array, path, cell_size, sr):
+    data = np.where(np.isfinite(array), array, NODATA).astype(np.float32)
+    raster = arcpy.NumPyArrayToRaster(data, arcpy.Point(0.0, 0.0), cell_size, cell_size, NODATA)
+    if arcpy.Exists(path):
+        arcpy.management.Delete(path)
+    raster.save(path)
+    arcpy.management.DefineProjection(path, sr)
+
+
+def make_condition_stack(
+    out_dir: str,
+    rows: int,
+    cols: int,
+    n_discharges: int,
+    cell_size: float = 1.0,
+    seed: int = 0,
+    wkid: int = DEFAULT_WKID,
+) -> dict:
+    """
+    Create (or reuse) a synthetic stack in `out_dir`/<rows>x<cols>_q<n>_s<seed>.
+
+    Returns
+    -------
+    dict
+        depth_paths, vel_paths (lists, one per discharge), dem_path, grain_path, folder.
+    """
+    folder = os.path.join(out_dir, f"{rows}x{cols}_q{n_discharges}_s{seed}")
+    manifest = os.path.join(folder, "stack.json")
+    if os.path.exists(manifest):
+        with open(manifest, "r", encoding="utf-8") as fh:
+            stack = json.load(fh)
+        if all(os.path.exists(p) for p in stack["depth_paths"] + stack["vel_paths"]):
+            return stack
+    os.makedirs(folder, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    sr = arcpy.SpatialReference(wkid)
+    y, x = np.mgrid[0:rows, 0:cols].astype(np.float64)
+
+    # Valley floor sloping along x, channel meandering around the valley axis.
+    centre = rows / 2.0 + 0.15 * rows * np.sin(4.0 * np.pi * x / max(cols, 1))
+    lateral = np.abs(y - centre) / max(rows, 1)
+    slope = 0.002
+    dem = 100.0 + slope * (cols - x) * cell_size + 12.0 * lateral ** 1.5 + rng.normal(0.0, 0.03, (rows, cols))
+    thalweg = 100.0 + slope * (cols - x) * cell_size
+    domain = lateral < 0.45
+    dem[~domain] = np.nan
+
+    grain = 0.02 + 0.08 * np.exp(-lateral * 8.0) + rng.gamma(2.0, 0.005, (rows, cols))
+    grain[~domain] = np.nan
+
+    stack = {"folder": folder, "depth_paths": [], "vel_paths": []}
+    stack["dem_path"] = os.path.join(folder, "dem.tif")
+    stack["grain_path"] = os.path.join(folder, "grain.tif")
+    _write(dem, stack["dem_path"], cell_size, sr)
+    _write(grain, stack["grain_path"], cell_size, sr)
+
+    for q in discharge_series(n_discharges):
+        stage = 0.4 * q ** 0.4
+        depth = thalweg + stage - dem
+        wet = domain & (depth > 0.0)
+        depth = np.where(wet, depth, np.nan)
+        manning_n = 0.035
+        velocity = np.where(
+            wet,
+            depth ** (2.0 / 3.0) * np.sqrt(slope) / manning_n * rng.uniform(0.85, 1.15, (rows, cols)),
+            np.nan,
+        )
+        q_str = fGl.write_Q_str(q)
+        depth_path = os.path.join(folder, f"h{q_str}.tif")
+        vel_path = os.path.join(folder, f"u{q_str}.tif")
+        _write(depth, depth_path, cell_size, sr)
+        _write(velocity, vel_path, cell_size, sr)
+        stack["depth_paths"].append(depth_path)
+        stack["vel_paths"].append(vel_path)
+
+    with open(manifest, "w", encoding="utf-8") as fh:
+        json.dump(stack, fh, indent=2)
+    return stack
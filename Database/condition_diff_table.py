@@ -0,0 +1,60 @@
+import psycopg2
+from psycopg2 import Error
+
+DB_NAME = "river_architect"
+DB_USER = "postgres"
+DB_PASSWORD = "database"
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+# class_counts holds the cell counts of change classes -3 .. 3 (see Module_Services/condition_diff.py).
+CONDITION_DIFF_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS condition_diff (
+    pre_condition TEXT NOT NULL
+        REFERENCES condition(condition_name)
+        ON DELETE CASCADE,
+    post_condition TEXT NOT NULL
+        REFERENCES condition(condition_name)
+        ON DELETE CASCADE,
+    product TEXT NOT NULL,
+    q_str TEXT NOT NULL,
+    q_value DOUBLE PRECISION,
+    identical BOOLEAN DEFAULT FALSE,
+    compared_count BIGINT,
+    changed_count BIGINT,
+    class_counts BIGINT[],
+    min_diff DOUBLE PRECISION,
+    max_diff DOUBLE PRECISION,
+    mean_diff DOUBLE PRECISION,
+    tiles_total INTEGER,
+    tiles_skipped INTEGER,
+    diff_path TEXT,
+    class_path TEXT,
+    computed_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (pre_condition, post_condition, product, q_str)
+);
+"""
+
+
+def ensure_condition_diff_table():
+    """Create condition_diff table (pre/post comparison summaries) linked to condition."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
+    cur = conn.cursor()
+    cur.execute(CONDITION_DIFF_TABLE_SQL)
+    conn.commit()
+    cur.close()
+    conn.close()
+    print("Table 'condition_diff' is ready and linked to condition.condition_name.")
+
+
+if __name__ == "__main__":
+    try:
+        ensure_condition_diff_table()
+    except (Exception, Error) as e:
+        print("Error while preparing condition_diff table:", e)
@@ -7,6 +7,19 @@ DB_PASSWORD = "database"
 DB_HOST = "localhost"
 DB_PORT = "5432"
 
+CONDITION_OUTPUT_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS condition_output (
+    condition_name TEXT PRIMARY KEY
+        REFERENCES condition(condition_name)
+        ON DELETE CASCADE,
+    bed_shield_paths TEXT,
+    shear_paths TEXT,
+    depth_to_wt_paths TEXT,
+    morph_unit_paths TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+"""
+
 
 def ensure_condition_output_table():
     """Create condition_output table and link condition_name to condition table."""
@@ -18,20 +31,7 @@ def ensure_condition_output_table():
         port=DB_PORT,
     )
     cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS condition_output (
-            condition_name TEXT PRIMARY KEY
-                REFERENCES condition(condition_name)
-                ON DELETE CASCADE,
-            bed_shield_paths TEXT,
-            shear_paths TEXT,
-            depth_to_wt_paths TEXT,
-            morph_unit_paths TEXT,
-            created_at TIMESTAMPTZ DEFAULT NOW()
-        );
-        """
-    )
+    cur.execute(CONDITION_OUTPUT_TABLE_SQL)
     conn.commit()
     cur.close()
     conn.close()
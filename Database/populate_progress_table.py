@@ -0,0 +1,51 @@
+import psycopg2
+from psycopg2 import Error
+
+DB_NAME = "river_architect"
+DB_USER = "postgres"
+DB_PASSWORD = "database"
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+POPULATE_PROGRESS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS populate_progress (
+    condition_name TEXT NOT NULL
+        REFERENCES condition(condition_name)
+        ON DELETE CASCADE,
+    product TEXT NOT NULL,
+    q_str TEXT NOT NULL,
+    run_id TEXT,
+    input_key TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    tile_rows INTEGER,
+    tiles_done INTEGER NOT NULL DEFAULT 0,
+    tile_count INTEGER,
+    output_path TEXT,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (condition_name, product, q_str)
+);
+"""
+
+
+def ensure_populate_progress_table():
+    """Create populate_progress table (per-discharge checkpoints of populate runs) linked to condition."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
+    cur = conn.cursor()
+    cur.execute(POPULATE_PROGRESS_TABLE_SQL)
+    conn.commit()
+    cur.close()
+    conn.close()
+    print("Table 'populate_progress' is ready and linked to condition.condition_name.")
+
+
+if __name__ == "__main__":
+    try:
+        ensure_populate_progress_table()
+    except (Exception, Error) as e:
+        print("Error while preparing populate_progress table:", e)
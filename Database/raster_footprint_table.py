@@ -0,0 +1,54 @@
+import psycopg2
+from psycopg2 import Error
+
+DB_NAME = "river_architect"
+DB_USER = "postgres"
+DB_PASSWORD = "database"
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+# footprint is a native box with a GiST (R-tree style) index; no PostGIS required.
+RASTER_FOOTPRINT_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS raster_footprint (
+    condition_name TEXT NOT NULL
+        REFERENCES condition(condition_name)
+        ON DELETE CASCADE,
+    raster_path TEXT NOT NULL,
+    role TEXT NOT NULL,
+    q_str TEXT,
+    footprint BOX NOT NULL,
+    sr_name TEXT,
+    sr_code INTEGER,
+    cell_w DOUBLE PRECISION,
+    cell_h DOUBLE PRECISION,
+    n_rows INTEGER,
+    n_cols INTEGER,
+    recorded_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (condition_name, raster_path)
+);
+CREATE INDEX IF NOT EXISTS raster_footprint_box_idx ON raster_footprint USING gist (footprint);
+"""
+
+
+def ensure_raster_footprint_table():
+    """Create raster_footprint table (raster extents with a spatial index) linked to condition."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
+    cur = conn.cursor()
+    cur.execute(RASTER_FOOTPRINT_TABLE_SQL)
+    conn.commit()
+    cur.close()
+    conn.close()
+    print("Table 'raster_footprint' is ready and linked to condition.condition_name.")
+
+
+if __name__ == "__main__":
+    try:
+        ensure_raster_footprint_table()
+    except (Exception, Error) as e:
+        print("Error while preparing raster_footprint table:", e)
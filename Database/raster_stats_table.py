@@ -0,0 +1,54 @@
+import psycopg2
+from psycopg2 import Error
+
+DB_NAME = "river_architect"
+DB_USER = "postgres"
+DB_PASSWORD = "database"
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+RASTER_STATS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS raster_stats (
+    raster_path TEXT PRIMARY KEY,
+    condition_name TEXT NOT NULL
+        REFERENCES condition(condition_name)
+        ON DELETE CASCADE,
+    product TEXT,
+    q_str TEXT,
+    total_count BIGINT,
+    valid_count BIGINT,
+    wet_count BIGINT,
+    min_value DOUBLE PRECISION,
+    max_value DOUBLE PRECISION,
+    mean_value DOUBLE PRECISION,
+    std_value DOUBLE PRECISION,
+    histogram BIGINT[],
+    histogram_edges DOUBLE PRECISION[],
+    computed_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS raster_stats_condition_idx ON raster_stats (condition_name, product);
+"""
+
+
+def ensure_raster_stats_table():
+    """Create raster_stats table (per-raster statistics recorded at write time) linked to condition."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
+    cur = conn.cursor()
+    cur.execute(RASTER_STATS_TABLE_SQL)
+    conn.commit()
+    cur.close()
+    conn.close()
+    print("Table 'raster_stats' is ready and linked to condition.condition_name.")
+
+
+if __name__ == "__main__":
+    try:
+        ensure_raster_stats_table()
+    except (Exception, Error) as e:
+        print("Error while preparing raster_stats table:", e)
@@ -0,0 +1,58 @@
+import psycopg2
+from psycopg2 import Error
+
+try:
+    from Database.condition_output_table import CONDITION_OUTPUT_TABLE_SQL
+except ImportError:  # run as a script from the Database folder
+    from condition_output_table import CONDITION_OUTPUT_TABLE_SQL
+
+DB_NAME = "river_architect"
+DB_USER = "postgres"
+DB_PASSWORD = "database"
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+RUN_LOG_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS run_log (
+    id BIGSERIAL PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    condition_name TEXT NOT NULL
+        REFERENCES condition_output(condition_name)
+        ON DELETE CASCADE,
+    product TEXT,
+    q_str TEXT,
+    stage TEXT NOT NULL,
+    status TEXT,
+    wall_s DOUBLE PRECISION,
+    cpu_s DOUBLE PRECISION,
+    bytes BIGINT,
+    peak_rss_bytes BIGINT,
+    started_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS run_log_condition_run_idx ON run_log (condition_name, run_id);
+"""
+
+
+def ensure_run_log_table():
+    """Create run_log table (per-stage spans of populate runs) linked to condition_output."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
+    cur = conn.cursor()
+    cur.execute(CONDITION_OUTPUT_TABLE_SQL)
+    cur.execute(RUN_LOG_TABLE_SQL)
+    conn.commit()
+    cur.close()
+    conn.close()
+    print("Table 'run_log' is ready and linked to condition_output.condition_name.")
+
+
+if __name__ == "__main__":
+    try:
+        ensure_run_log_table()
+    except (Exception, Error) as e:
+        print("Error while preparing run_log table:", e)
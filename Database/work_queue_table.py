@@ -0,0 +1,65 @@
+import psycopg2
+from psycopg2 import Error
+
+DB_NAME = "river_architect"
+DB_USER = "postgres"
+DB_PASSWORD = "database"
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+WORK_QUEUE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS raster_task (
+    id BIGSERIAL PRIMARY KEY,
+    condition_name TEXT NOT NULL
+        REFERENCES condition(condition_name)
+        ON DELETE CASCADE,
+    product TEXT NOT NULL,
+    q_str TEXT NOT NULL,
+    tile_index INTEGER NOT NULL DEFAULT 0,
+    tile_count INTEGER NOT NULL DEFAULT 1,
+    storage_mode TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    heartbeat_at TIMESTAMPTZ,
+    result TEXT,
+    error TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    finished_at TIMESTAMPTZ,
+    UNIQUE (condition_name, product, q_str, tile_index, tile_count)
+);
+CREATE INDEX IF NOT EXISTS raster_task_status_idx ON raster_task (status, id);
+
+CREATE TABLE IF NOT EXISTS raster_worker (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    started_at TIMESTAMPTZ DEFAULT NOW(),
+    heartbeat_at TIMESTAMPTZ DEFAULT NOW(),
+    current_task BIGINT
+);
+"""
+
+
+def ensure_work_queue_tables():
+    """Create raster_task (job queue) and raster_worker (worker heartbeats)."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
+    cur = conn.cursor()
+    cur.execute(WORK_QUEUE_TABLE_SQL)
+    conn.commit()
+    cur.close()
+    conn.close()
+    print("Tables 'raster_task' and 'raster_worker' are ready.")
+
+
+if __name__ == "__main__":
+    try:
+        ensure_work_queue_tables()
+    except (Exception, Error) as e:
+        print("Error while preparing work queue tables:", e)
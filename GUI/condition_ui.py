@@ -155,6 +155,14 @@ def create_condition_tab(window):
     create_condition_btn.setMinimumWidth(150)
     create_condition_btn.clicked.connect(lambda checked=False: condition_features.create_condition(window))
     button_layout.addWidget(create_condition_btn)
+    import_manifest_btn = QPushButton("Import Manifest…")
+    import_manifest_btn.clicked.connect(lambda checked=False: condition_features.bulk_import_conditions(window))
+    button_layout.addWidget(import_manifest_btn)
+    import_folder_btn = QPushButton("Import Folder…")
+    import_folder_btn.clicked.connect(
+        lambda checked=False: condition_features.bulk_import_conditions(window, from_folder=True)
+    )
+    button_layout.addWidget(import_folder_btn)
     # Proceed button placed below the create box
     proceed_btn = QPushButton("Proceed to Analysis")
     proceed_btn.setMinimumWidth(150)
@@ -19,7 +19,6 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
-import psycopg2
 from psycopg2 import Error
 
 # Ensure project root is on sys.path so sibling packages (Module_Services, GUI) import cleanly
@@ -29,7 +28,8 @@ if BASE_DIR not in sys.path:
 
 from populate_ui import create_populate_condition_widget
 from condition_ui import create_condition_tab
-from Module_Services import condition_features, populate_features
+from view_db_ui import ThumbnailPanel, condition_thumbnail_entries
+from Module_Services import condition_features, populate_features, raster_stats, run_log, spatial_index, storage
 
 
 
@@ -156,6 +156,7 @@ class RiverArchitectWindow(QMainWindow):
         container, refs = create_populate_condition_widget(self)
         # Keep handy references for later use
         self.interpolation_method_combo = refs.get("interpolation_method_combo")
+        self.storage_mode_combo = refs.get("storage_mode_combo")
         self.populate_info_text = refs.get("info_text")
         self.populate_buttons = refs.get("buttons", {})
 
@@ -166,6 +167,7 @@ class RiverArchitectWindow(QMainWindow):
             shield_btn = btns.get("shield")
             depth_btn = btns.get("depth")
             morph_btn = btns.get("morph")
+            report_btn = btns.get("report")
             if shear_btn:
                 shear_btn.clicked.connect(lambda _=False: self.run_bed_shear())
             if shield_btn:
@@ -182,6 +184,8 @@ class RiverArchitectWindow(QMainWindow):
                         "Morphological unit rasters", "morphological_unit_rasters_folder"
                     )
                 )
+            if report_btn:
+                report_btn.clicked.connect(lambda _=False: self.show_run_report())
 
         self.content_layout.addWidget(container, 1)
 
@@ -193,6 +197,15 @@ class RiverArchitectWindow(QMainWindow):
         left_layout = QVBoxLayout()
         left_frame.setLayout(left_layout)
 
+        # Spatial filter: conditions whose rasters intersect a box (or contain a point)
+        filter_layout = QHBoxLayout()
+        bbox_edit = QLineEdit()
+        bbox_edit.setPlaceholderText("xmin, ymin, xmax, ymax  or  x, y")
+        filter_btn = QPushButton("Filter by Area")
+        filter_layout.addWidget(bbox_edit)
+        filter_layout.addWidget(filter_btn)
+        left_layout.addLayout(filter_layout)
+
         listw = QListWidget()
         self.db_list_widget = listw
         left_layout.addWidget(listw)
@@ -208,6 +221,8 @@ class RiverArchitectWindow(QMainWindow):
         right_frame = QGroupBox("Condition Details")
         right_layout = QVBoxLayout()
         right_frame.setLayout(right_layout)
+        thumbs = ThumbnailPanel()
+        right_layout.addWidget(thumbs)
         details = QTextEdit()
         details.setReadOnly(True)
         right_layout.addWidget(details)
@@ -287,6 +302,27 @@ class RiverArchitectWindow(QMainWindow):
                 add_condition_item(n)
             # keep details pane clean if selection now missing
             details.clear()
+            thumbs.clear()
+
+        def filter_list():
+            text = bbox_edit.text().strip()
+            if not text:
+                refresh_list()
+                return
+            try:
+                names = spatial_index.conditions_in_bbox(self.db_connection, spatial_index.parse_bbox(text))
+            except ValueError as e:
+                QMessageBox.warning(self, "Filter by Area", str(e))
+                return
+            except (Exception, Error) as e:
+                self.db_connection.rollback()
+                QMessageBox.critical(self, "Filter by Area", f"Could not query raster footprints:\n{e}")
+                return
+            listw.clear()
+            for n in names:
+                add_condition_item(n)
+            details.clear()
+            thumbs.clear()
 
         # populate directly from the database to ensure freshness
         if not self.db_connection:
@@ -310,6 +346,7 @@ class RiverArchitectWindow(QMainWindow):
         def show_details(item):
             if not item:
                 details.clear()
+                thumbs.clear()
                 return
             name = item.text()
             try:
@@ -375,8 +412,18 @@ class RiverArchitectWindow(QMainWindow):
                         f"\n\nDepth to Water Table Rasters Folder:\n{depth_to_water_table_rasters_folder or ''}"
                         f"\n\nMorphological Unit Rasters Folder:\n{morphological_unit_rasters_folder or ''}"
                     )
+                    try:
+                        stats_text = raster_stats.format_condition_stats(
+                            raster_stats.condition_stats(self.db_connection, name)
+                        )
+                    except (Exception, Error) as e:
+                        self.db_connection.rollback()
+                        stats_text = f"Could not read statistics: {e}"
+                    details.append(f"\nOutput Statistics:\n{stats_text}")
+                    thumbs.show_rasters(condition_thumbnail_entries(self.db_connection, name))
                 else:
                     details.setPlainText(f"No record for {name}")
+                    thumbs.clear()
             except (Exception, Error) as e:
                 details.setPlainText(f"Error reading DB: {e}")
 
@@ -396,6 +443,8 @@ class RiverArchitectWindow(QMainWindow):
 
         load_btn.clicked.connect(on_load)
         refresh_btn.clicked.connect(refresh_list)
+        filter_btn.clicked.connect(filter_list)
+        bbox_edit.returnPressed.connect(filter_list)
         listw.currentItemChanged.connect(lambda cur, prev: show_details(cur))
 
         self.content_layout.addWidget(left_frame, 2)
@@ -441,6 +490,16 @@ class RiverArchitectWindow(QMainWindow):
                 except Exception:
                     pass
 
+    def selected_storage_mode(self):
+        """Return the storage mode chosen on the Populate page (None -> config default)."""
+        combo = getattr(self, "storage_mode_combo", None)
+        if combo is None:
+            return None
+        try:
+            return combo.currentText() or None
+        except Exception:
+            return None
+
     def run_bed_shear(self):
         """Run bed shear stress calculation and save rasters to the shear folder."""
         condition_name = getattr(self, "active_condition", None)
@@ -455,7 +514,9 @@ class RiverArchitectWindow(QMainWindow):
                 info_target.append("\n⚠ Database connection not available.")
             return
         try:
-            outputs = populate_features.calculate_bed_shear_stress(condition_name, self.db_connection)
+            outputs = populate_features.calculate_bed_shear_stress(
+                condition_name, self.db_connection, storage_mode=self.selected_storage_mode()
+            )
             if info_target:
                 info_target.append(f"\n✓ Created {len(outputs)} bed shear raster(s).\n" + "\n".join(outputs))
         except populate_features.InputError as exc:
@@ -479,7 +540,9 @@ class RiverArchitectWindow(QMainWindow):
                 info_target.append("\n⚠ Database connection not available.")
             return
         try:
-            outputs = populate_features.calculate_bed_shield_stress(condition_name, self.db_connection)
+            outputs = populate_features.calculate_bed_shield_stress(
+                condition_name, self.db_connection, storage_mode=self.selected_storage_mode()
+            )
             if info_target:
                 info_target.append(f"\n✓ Created {len(outputs)} bed Shields raster(s).\n" + "\n".join(outputs))
         except populate_features.InputError as exc:
@@ -489,14 +552,31 @@ class RiverArchitectWindow(QMainWindow):
             if info_target:
                 info_target.append(f"\n⚠ Error creating bed Shields rasters: {exc}")
      
+    def show_run_report(self):
+        """Show the per-stage timing summary of the latest run for the active condition."""
+        condition_name = getattr(self, "active_condition", None)
+        info_target = getattr(self, "populate_info_text", None) or getattr(self, "info_text", None)
+        if not info_target:
+            return
+        if not condition_name:
+            info_target.append("\n⚠ Select or create a condition first.")
+            return
+        if not self.db_connection:
+            info_target.append("\n⚠ Database connection not available.")
+            return
+        try:
+            info_target.append("\n" + run_log.format_run_report(self.db_connection, condition_name))
+        except Exception as exc:
+            info_target.append(f"\n⚠ Could not read run log: {exc}")
+            try:
+                self.db_connection.rollback()
+            except Exception:
+                pass
+
     def init_db(self):
         try:
-            connection = psycopg2.connect(
-                port="5432",
-                database="river_architect",
-                user="postgres",
-                password="database"
-            )
+            # PostgreSQL, or the embedded SQLite file with config.storage_backend = "sqlite"
+            connection = storage.connect()
             try:
                 cursor = connection.cursor()
                 cursor.execute("ALTER TABLE IF EXISTS condition ADD COLUMN IF NOT EXISTS unit TEXT;")
@@ -514,7 +594,7 @@ class RiverArchitectWindow(QMainWindow):
                 pass
             return connection
         except (Exception, Error) as error:
-            self.info_text.append(f"\nError while connecting to PostgreSQL: {error}")
+            self.info_text.append(f"\nError while connecting to the database: {error}")
             return None
 
     def view_database(self):
@@ -8,6 +8,8 @@ from PyQt5.QtWidgets import (
     QTextEdit,
 )
 
+import config
+
 
 def create_populate_condition_widget(parent=None):
     """
@@ -52,6 +54,23 @@ def create_populate_condition_widget(parent=None):
     interp_layout.addStretch()
     actions_layout.addWidget(interp_box)
 
+    storage_box = QGroupBox("Output Storage")
+    storage_layout = QHBoxLayout()
+    storage_box.setLayout(storage_layout)
+    storage_label = QLabel("Derived raster storage:")
+    storage_mode_combo = QComboBox()
+    storage_mode_combo.addItems(["full", "float32", "int16", "uint16"])
+    storage_mode_combo.setCurrentText((config.derived_raster_storage or "full").strip().lower())
+    storage_mode_combo.setToolTip(
+        "full: unchanged float output\n"
+        "float32: single precision (relative error <= 6e-8)\n"
+        "int16/uint16: scaled integers, max error = scale / 2 (recorded in <raster>.quant.json)"
+    )
+    storage_layout.addWidget(storage_label)
+    storage_layout.addWidget(storage_mode_combo, 1)
+    storage_layout.addStretch()
+    actions_layout.addWidget(storage_box)
+
     depth_btn = QPushButton("Create Depth to Water table Rasters")
     depth_btn.setMinimumHeight(40)
     actions_layout.addWidget(depth_btn)
@@ -60,6 +79,10 @@ def create_populate_condition_widget(parent=None):
     morph_btn.setMinimumHeight(40)
     actions_layout.addWidget(morph_btn)
 
+    report_btn = QPushButton("Show Last Run Report")
+    report_btn.setToolTip("Per-stage timing (read, compute, write, db) of the latest run for this condition.")
+    actions_layout.addWidget(report_btn)
+
     actions_layout.addStretch()
 
     # Right: info placeholder
@@ -76,12 +99,14 @@ def create_populate_condition_widget(parent=None):
 
     refs = {
         "interpolation_method_combo": interpolation_method_combo,
+        "storage_mode_combo": storage_mode_combo,
         "info_text": info_text,
         "buttons": {
             "shear": shear_btn,
             "shield": shield_btn,
             "depth": depth_btn,
             "morph": morph_btn,
+            "report": report_btn,
         },
     }
 
@@ -0,0 +1,135 @@
+from PyQt5.QtWidgets import (
+    QGroupBox,
+    QGridLayout,
+    QLabel,
+    QVBoxLayout,
+    QWidget,
+)
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+from Module_Services import storage, thumbnails
+
+THUMB_SIZE = 200
+
+_arcpy_pool = None
+
+
+def arcpy_thread_pool():
+    """
+    Single-thread pool for thumbnails read through arcpy. arcpy is not thread-safe, so
+    these reads run one at a time, but still off the GUI thread.
+    """
+    global _arcpy_pool
+    if _arcpy_pool is None:
+        _arcpy_pool = QThreadPool()
+        _arcpy_pool.setMaxThreadCount(1)
+    return _arcpy_pool
+
+
+class _ThumbnailSignals(QObject):
+    done = pyqtSignal(int, int, object, str)
+
+
+class _ThumbnailJob(QRunnable):
+    """Read (or fetch from cache) and colour one thumbnail on a pool thread."""
+
+    def __init__(self, generation, slot, path, signals):
+        super().__init__()
+        self.generation = generation
+        self.slot = slot
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        try:
+            rgba = thumbnails.render_rgba(thumbnails.thumbnail(self.path, THUMB_SIZE))
+            h, w = rgba.shape[:2]
+            image = QImage(rgba.tobytes(), w, h, 4 * w, QImage.Format_RGBA8888).copy()
+            self.signals.done.emit(self.generation, self.slot, image, "")
+        except Exception as e:
+            self.signals.done.emit(self.generation, self.slot, None, str(e))
+
+
+class ThumbnailPanel(QGroupBox):
+    """
+    Grid of quick-look thumbnails for the View Database details pane.
+    Rendering happens on the global thread pool, except for rasters read through arcpy
+    (not thread-safe), which go to the single-thread arcpy_thread_pool; results for a
+    previously selected condition are dropped.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__("Quick Look", parent)
+        self._layout = QGridLayout()
+        self.setLayout(self._layout)
+        self._cells = []
+        self._generation = 0
+        self._signals = _ThumbnailSignals()
+        self._signals.done.connect(self._on_done)
+
+    def clear(self):
+        self._generation += 1
+        for cell in self._cells:
+            cell.setParent(None)
+            cell.deleteLater()
+        self._cells = []
+
+    def show_rasters(self, entries):
+        """Show thumbnails for [(title, path)]; entries without a path are skipped."""
+        self.clear()
+        pool = QThreadPool.globalInstance()
+        for title, path in [(t, p) for t, p in entries if p]:
+            cell = QWidget()
+            cell_layout = QVBoxLayout()
+            cell_layout.setContentsMargins(2, 2, 2, 2)
+            image = QLabel("loading…")
+            image.setAlignment(Qt.AlignCenter)
+            image.setFixedSize(THUMB_SIZE, THUMB_SIZE)
+            image.setToolTip(path)
+            caption = QLabel(title)
+            caption.setAlignment(Qt.AlignCenter)
+            cell_layout.addWidget(image)
+            cell_layout.addWidget(caption)
+            cell.setLayout(cell_layout)
+            slot = len(self._cells)
+            self._layout.addWidget(cell, slot // 3, slot % 3)
+            self._cells.append(cell)
+            job = _ThumbnailJob(self._generation, slot, path, self._signals)
+            (pool if thumbnails.thread_safe(path) else arcpy_thread_pool()).start(job)
+
+    def _on_done(self, generation, slot, image, error):
+        if generation != self._generation or slot >= len(self._cells):
+            return
+        label = self._cells[slot].layout().itemAt(0).widget()
+        if image is None:
+            label.setText("unavailable")
+            label.setToolTip(f"{label.toolTip()}\n{error}")
+            return
+        label.setPixmap(
+            QPixmap.fromImage(image).scaled(THUMB_SIZE, THUMB_SIZE, Qt.KeepAspectRatio, Qt.FastTransformation)
+        )
+
+
+def condition_thumbnail_entries(conn, condition_name):
+    """
+    Return [(title, path)] of the rasters to preview for a condition: the first depth
+    and velocity rasters, DEM, grain size and the first shear / Shields outputs.
+    """
+    # The whole row, so output columns that have not been added to the table yet are just missing.
+    rec = storage.Repository(conn).get_condition(condition_name)
+    if not rec:
+        return []
+
+    def first(column):
+        paths = [p for p in (rec.get(column) or "").split(";") if p.strip()]
+        return paths[0] if paths else None
+
+    return [
+        ("Depth", first("depth_rasters")),
+        ("Velocity", first("velocity_rasters")),
+        ("DEM", rec.get("digital_elevation_model")),
+        ("Grain Size", rec.get("grain_size_raster")),
+        ("Bed Shear (tb)", first("bed_shear_rasters")),
+        ("Shields (ts)", first("bed_shield_rasters")),
+    ]
@@ -1,3 +1,41 @@
-from . import condition_features, populate_features
+"""
+River Architect services. Submodules are imported on first use, so importing one
+(e.g. Module_Services.storage) does not load arcpy and every engine with it.
+"""
+import importlib
 
-__all__ = ["condition_features", "populate_features"]
+__all__ = [
+    "ascii_grid",
+    "autotune",
+    "bulk_import",
+    "checkpoints",
+    "compute_precision",
+    "condition_diff",
+    "condition_features",
+    "derived_cache",
+    "discharge_catalog",
+    "expressions",
+    "grain_terms",
+    "pipeline",
+    "populate_features",
+    "raster_alignment",
+    "raster_io",
+    "raster_stats",
+    "raster_storage",
+    "raster_validation",
+    "run_log",
+    "sampling",
+    "shear_kernels",
+    "spatial_index",
+    "storage",
+    "thumbnails",
+    "virtual_rasters",
+    "wet_index",
+    "work_queue",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
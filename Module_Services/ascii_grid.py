@@ -0,0 +1,238 @@
+"""
+ESRI ASCII grids (.asc) with a binary cache.
+
+Hydraulic models often export depth and velocity as ESRI ASCII grids, which are slow
+to parse, and arcpy parses them again on every window read. Here a grid is parsed
+once, on first use. The file is streamed in large byte blocks, and each block is
+converted in one vectorised numpy call. Values may wrap across lines in any way. The
+result is a memory-mapped .npy array in <dir2cache>/ascii/, keyed by the file
+fingerprint, with NoData as NaN. Every later read of that discharge, in this or any
+later run, slices the array instead of parsing text (see raster_io.read_window). At
+most MAX_OPEN arrays stay mapped per process.
+
+The cache stores config.ascii_cache_dtype. float32 is the precision arcpy reads these
+grids in, and the caches of edited or deleted grids are removed by `clean`:
+
+    python -m Module_Services.ascii_grid convert h100.asc u100.asc ...   # build caches ahead of a run
+    python -m Module_Services.ascii_grid clean
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import numpy as np
+
+import config
+import fGl
+
+_CACHE_DIR = os.path.join(config.dir2cache, "ascii")
+_KEY_VERSION = "v1"
+_BLOCK_BYTES = 16 * 1024 ** 2
+# Cached arrays kept open per process (memory-mapped; least recently used are closed first).
+MAX_OPEN = 64
+_HEADER_KEYS = ("ncols", "nrows", "xllcorner", "xllcenter", "yllcorner", "yllcenter", "cellsize", "dx", "dy",
+                "nodata_value")
+
+_lock = threading.Lock()
+_key_locks: Dict[str, threading.Lock] = {}
+_open: "OrderedDict[str, Tuple[str, np.ndarray, dict]]" = OrderedDict()
+
+
+def is_ascii_grid(path) -> bool:
+    return isinstance(path, str) and path.lower().endswith(".asc")
+
+
+def read_header(path: str) -> dict:
+    """
+    Parse the header: rows, cols, xmin, ymax, cell_w, cell_h, nodata and the byte
+    offset of the first value.
+    """
+    fields = {}
+    with open(path, "rb") as fh:
+        while True:
+            offset = fh.tell()
+            line = fh.readline()
+            parts = line.split()
+            if not line or not parts or parts[0].decode("ascii", "replace").lower() not in _HEADER_KEYS:
+                break
+            fields[parts[0].decode("ascii").lower()] = float(parts[1])
+    try:
+        cols, rows = int(fields["ncols"]), int(fields["nrows"])
+        cell_w = fields.get("cellsize", fields.get("dx"))
+        cell_h = fields.get("cellsize", fields.get("dy", cell_w))
+        if "xllcorner" in fields:
+            xmin = fields["xllcorner"]
+        else:
+            xmin = fields["xllcenter"] - 0.5 * cell_w
+        if "yllcorner" in fields:
+            ymin = fields["yllcorner"]
+        else:
+            ymin = fields["yllcenter"] - 0.5 * cell_h
+    except (KeyError, TypeError) as exc:
+        raise ValueError(f"'{path}' is not an ESRI ASCII grid (missing {exc}).") from None
+    return {
+        "rows": rows,
+        "cols": cols,
+        "xmin": xmin,
+        "ymax": ymin + rows * cell_h,
+        "cell_w": cell_w,
+        "cell_h": cell_h,
+        "nodata": fields.get("nodata_value"),
+        "data_offset": offset,
+    }
+
+
+def _cache_paths(path: str) -> Tuple[str, str]:
+    dtype = np.dtype(config.ascii_cache_dtype).name
+    key = hashlib.sha1(f"{fGl.file_fingerprint(path)}|{dtype}|{_KEY_VERSION}".encode("utf-8")).hexdigest()
+    stem = os.path.join(_CACHE_DIR, key)
+    return stem + ".npy", stem + ".json"
+
+
+def _last_whitespace(data: bytes) -> int:
+    return max(data.rfind(b" "), data.rfind(b"\n"), data.rfind(b"\r"), data.rfind(b"\t"))
+
+
+def convert(path: str, array_path: str, meta_path: str) -> dict:
+    """Parse a grid into `array_path` (.npy) and write its header to `meta_path`."""
+    header = read_header(path)
+    rows, cols, nodata = header["rows"], header["cols"], header["nodata"]
+    total = rows * cols
+    os.makedirs(_CACHE_DIR, exist_ok=True)
+    tmp = f"{array_path}.tmp{os.getpid()}-{threading.get_ident()}"
+    array = np.lib.format.open_memmap(tmp, "w+", np.dtype(config.ascii_cache_dtype), (rows, cols))
+    flat = array.reshape(-1)
+    pos = 0
+    rest = b""
+    try:
+        with open(path, "rb") as fh:
+            fh.seek(header["data_offset"])
+            while pos < total:
+                block = fh.read(_BLOCK_BYTES)
+                data = rest + block
+                # Keep a number cut by the block boundary for the next block.
+                cut = len(data) if not block else _last_whitespace(data) + 1
+                rest = data[cut:]
+                values = np.fromstring(data[:cut].decode("ascii"), dtype=np.float64, sep=" ")
+                if nodata is not None:
+                    values[values == nodata] = np.nan
+                count = min(values.size, total - pos)
+                flat[pos:pos + count] = values[:count]
+                pos += count
+                if not block:
+                    break
+        if pos != total:
+            raise ValueError(f"'{path}' holds {pos} values, its header announces {rows} x {cols}.")
+        array.flush()
+    except BaseException:
+        del flat, array
+        os.remove(tmp)
+        raise
+    del flat, array
+    meta = dict(header, source=os.path.abspath(path), fingerprint=fGl.file_fingerprint(path))
+    meta_tmp = f"{meta_path}.tmp{os.getpid()}-{threading.get_ident()}"
+    with open(meta_tmp, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    os.replace(meta_tmp, meta_path)
+    # The array last: a cache entry exists only once complete.
+    os.replace(tmp, array_path)
+    return meta
+
+
+def cached_array(path: str) -> Tuple[np.ndarray, dict]:
+    """Return the cached array of a grid (read-only memmap) and its header, parsing the grid on first use."""
+    array_path, meta_path = _cache_paths(path)
+    with _lock:
+        entry = _open.get(path)
+        if entry is not None and entry[0] == array_path:
+            _open.move_to_end(path)
+            return entry[1], entry[2]
+        key_lock = _key_locks.setdefault(array_path, threading.Lock())
+    with key_lock:
+        if not os.path.exists(array_path):
+            convert(path, array_path, meta_path)
+        with open(meta_path, "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        array = np.load(array_path, mmap_mode="r")
+    with _lock:
+        _open[path] = (array_path, array, meta)
+        _open.move_to_end(path)
+        while len(_open) > MAX_OPEN:
+            _open.popitem(last=False)
+    return array, meta
+
+
+def read_window(path: str, grid, window, dtype=np.float64) -> np.ndarray:
+    """
+    Read a window of `grid` (a raster_io.RasterGrid) from the cached grid. Cells outside
+    the file are NaN.
+    """
+    array, h = cached_array(path)
+    row_off, col_off, nrows, ncols = window
+    r0 = int(round((h["ymax"] - (grid.ymax - row_off * grid.cell_h)) / h["cell_h"]))
+    c0 = int(round((grid.xmin + col_off * grid.cell_w - h["xmin"]) / h["cell_w"]))
+    rs, re_ = max(r0, 0), min(r0 + nrows, h["rows"])
+    cs, ce = max(c0, 0), min(c0 + ncols, h["cols"])
+    if (r0, c0, nrows, ncols) == (rs, cs, re_ - rs, ce - cs):
+        return array[rs:re_, cs:ce].astype(dtype)
+    out = np.full((nrows, ncols), np.nan, dtype=dtype)
+    if rs < re_ and cs < ce:
+        out[rs - r0:re_ - r0, cs - c0:ce - c0] = array[rs:re_, cs:ce]
+    return out
+
+
+def clean() -> int:
+    """Remove cache entries whose grid was edited or deleted; returns the bytes freed."""
+    freed = 0
+    for meta_path in glob.glob(os.path.join(_CACHE_DIR, "*.json")):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            current = fGl.file_fingerprint(meta["source"]) if os.path.exists(meta["source"]) else None
+        except (OSError, ValueError, KeyError):
+            current = None
+            meta = {}
+        if current is not None and current == meta.get("fingerprint"):
+            continue
+        with _lock:
+            # Close our own memory map first (an open map blocks removal on Windows).
+            for path in [p for p, entry in _open.items() if entry[0] == meta_path[:-5] + ".npy"]:
+                del _open[path]
+        for stale in (meta_path[:-5] + ".npy", meta_path):
+            if os.path.exists(stale):
+                freed += os.path.getsize(stale)
+                os.remove(stale)
+    return freed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Binary cache of ESRI ASCII grids.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cv = sub.add_parser("convert")
+    cv.add_argument("grids", nargs="+")
+    sub.add_parser("clean")
+    args = parser.parse_args(argv)
+
+    if args.command == "clean":
+        print(f"Freed {clean() / 1024 ** 2:.1f} MiB.")
+        return
+    for path in args.grids:
+        array_path, meta_path = _cache_paths(path)
+        if os.path.exists(array_path):
+            print(f"{path}: cached")
+            continue
+        started = time.perf_counter()
+        meta = convert(path, array_path, meta_path)
+        elapsed = time.perf_counter() - started
+        print(f"{path}: {meta['rows']} x {meta['cols']} in {elapsed:.1f} s "
+              f"({os.path.getsize(path) / 1024 ** 2 / max(elapsed, 1e-9):.0f} MiB/s)")
+
+
+if __name__ == "__main__":
+    main()
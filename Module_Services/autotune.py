@@ -0,0 +1,183 @@
+"""
+Execution planner: picks the strip height (tile_rows) of the engines and the number
+of local worker processes of the work queue (work_queue.auto_worker_count).
+
+The plan is derived from the machine (logical cores, available memory), the raster
+geometry (rows, cols, dtype) and its native block layout (read through GDAL when it
+is installed). Strip heights are rounded to whole blocks. A strip's working set
+aims at config.autotune_strip_bytes. Each worker's footprint (full-size output
+buffers plus one strip) must fit in config.autotune_memory_fraction of the available
+memory.
+
+The read/compute throughput of every run that evaluated strips (derived-cache hits
+excepted) is recorded in <dir2cache>/autotune.json, per host, engine and raster width.
+Later plans try each candidate strip height once (half, base and double), then keep
+the fastest.
+
+    python -m Module_Services.autotune <raster> [--engine populate]
+"""
+import json
+import math
+import os
+import platform
+import sys
+import threading
+import time
+
+import numpy as np
+
+import config
+import fGl
+
+try:
+    from osgeo import gdal
+except ImportError:  # optional dependency
+    gdal = None
+
+_HISTORY = os.path.join(config.dir2cache, "autotune.json")
+_lock = threading.Lock()
+
+# Full-size float arrays held per worker and strip-sized arrays live during a strip,
+# per engine (inputs, outputs and kernel scratch). Populate keeps two sets of output
+# buffers, so one can be written while the other is computed, and reads two strips of
+# depth and velocity ahead (see pipeline).
+ENGINE_FOOTPRINT = {
+    "populate": {"full_arrays": 4, "strip_arrays": 10},
+    "analysis": {"full_arrays": 1, "strip_arrays": 4},
+}
+
+
+class ExecutionPlan:
+    """Chosen strip height for one engine run, and the worker processes its memory allows."""
+
+    def __init__(self, engine, rows, cols, tile_rows, workers, block_rows, source, history_key):
+        self.engine = engine
+        self.rows = rows
+        self.cols = cols
+        self.tile_rows = tile_rows
+        self.workers = workers
+        self.block_rows = block_rows
+        self.source = source
+        self.history_key = history_key
+        self._t0 = time.perf_counter()
+
+    def as_dict(self) -> dict:
+        return {
+            "engine": self.engine,
+            "rows": self.rows,
+            "cols": self.cols,
+            "tile_rows": self.tile_rows,
+            "workers": self.workers,
+            "block_rows": self.block_rows,
+            "source": self.source,
+        }
+
+    def __repr__(self):
+        return (f"ExecutionPlan({self.engine}: tile_rows={self.tile_rows}, workers={self.workers}, "
+                f"block_rows={self.block_rows}, {self.source})")
+
+
+def native_block_rows(raster_path: str) -> int:
+    """Rows per native block (tile or strip) of a raster; 1 when unknown."""
+    if gdal is None or not raster_path or not os.path.isfile(raster_path):
+        return 1
+    try:
+        ds = gdal.Open(raster_path, gdal.GA_ReadOnly)
+        return max(1, int(ds.GetRasterBand(1).GetBlockSize()[1]))
+    except Exception:
+        return 1
+
+
+def _load_history() -> dict:
+    try:
+        with open(_HISTORY, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _history_key(engine: str, cols: int, dtype) -> str:
+    # Widths within a factor of two share their history.
+    return f"{platform.node()}|{engine}|{np.dtype(dtype).name}|w{int(math.log2(max(cols, 1)))}"
+
+
+def _round_to_blocks(tile_rows: int, block_rows: int, rows: int) -> int:
+    tile_rows = max(block_rows, (tile_rows // block_rows) * block_rows)
+    return max(1, min(tile_rows, rows))
+
+
+def plan_execution(
+    rows: int,
+    cols: int,
+    dtype=np.float64,
+    engine: str = "populate",
+    tasks: int = 1,
+    raster_path: str = None,
+) -> ExecutionPlan:
+    """Return the execution plan for `tasks` independent rasters of rows x cols."""
+    footprint = ENGINE_FOOTPRINT.get(engine, ENGINE_FOOTPRINT["analysis"])
+    itemsize = np.dtype(dtype).itemsize
+    row_bytes = cols * itemsize * footprint["strip_arrays"]
+    block_rows = native_block_rows(raster_path)
+
+    base = _round_to_blocks(max(1, config.autotune_strip_bytes // max(row_bytes, 1)), block_rows, rows)
+    key = _history_key(engine, cols, dtype)
+    with _lock:
+        stats = _load_history().get(key, {})
+    candidates = sorted(
+        {_round_to_blocks(base // 2, block_rows, rows), base, _round_to_blocks(base * 2, block_rows, rows)}
+    )
+    untried = [c for c in candidates if str(c) not in stats]
+    if untried:
+        tile_rows, source = (base if base in untried else untried[0]), "heuristic"
+    else:
+        tile_rows = max(candidates, key=lambda c: stats[str(c)]["mpix_per_s"])
+        source = "history"
+
+    available = fGl.available_memory_bytes() or 4 * 1024 ** 3
+    budget = available * config.autotune_memory_fraction
+    per_worker = rows * cols * itemsize * footprint["full_arrays"] + tile_rows * row_bytes
+    while tile_rows > block_rows and per_worker > budget:
+        tile_rows = _round_to_blocks(tile_rows // 2, block_rows, rows)
+        per_worker = rows * cols * itemsize * footprint["full_arrays"] + tile_rows * row_bytes
+    workers = int(max(1, min(os.cpu_count() or 1, budget // max(per_worker, 1), tasks)))
+    return ExecutionPlan(engine, rows, cols, tile_rows, workers, block_rows, source, key)
+
+
+def plan_for_grid(grid, engine: str = "populate", tasks: int = 1, raster_path: str = None,
+                  dtype=np.float64) -> ExecutionPlan:
+    """plan_execution for a raster_io.RasterGrid; honours a fixed config.tile_rows when autotune is off."""
+    if not config.autotune:
+        return ExecutionPlan(engine, grid.rows, grid.cols, min(config.tile_rows, grid.rows), 1, 1, "config", None)
+    return plan_execution(grid.rows, grid.cols, dtype, engine, tasks, raster_path)
+
+
+def record_result(plan: ExecutionPlan, pixels: int, seconds: float = None):
+    """Store the throughput a plan achieved (seconds default to the time since planning)."""
+    if plan.history_key is None or pixels <= 0:
+        return
+    seconds = seconds if seconds is not None else time.perf_counter() - plan._t0
+    if seconds <= 0:
+        return
+    mpix_per_s = pixels / seconds / 1e6
+    with _lock:
+        history = _load_history()
+        slot = history.setdefault(plan.history_key, {}).setdefault(str(plan.tile_rows), {"runs": 0, "mpix_per_s": 0.0})
+        # Exponential average, so the estimate follows hardware and data changes.
+        slot["mpix_per_s"] = mpix_per_s if slot["runs"] == 0 else 0.7 * slot["mpix_per_s"] + 0.3 * mpix_per_s
+        slot["runs"] += 1
+        slot["last"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        os.makedirs(os.path.dirname(_HISTORY), exist_ok=True)
+        tmp = f"{_HISTORY}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(history, fh, indent=2)
+        os.replace(tmp, _HISTORY)
+
+
+if __name__ == "__main__":
+    from Module_Services import raster_io
+
+    engine = sys.argv[sys.argv.index("--engine") + 1] if "--engine" in sys.argv else "populate"
+    for target in [a for a in sys.argv[1:] if not a.startswith("--") and a != engine]:
+        grid = raster_io.RasterGrid.from_raster(target)
+        print(target, plan_execution(grid.rows, grid.cols, engine=engine, raster_path=target))
@@ -0,0 +1,278 @@
+"""
+Bulk import of conditions from a manifest or a directory tree.
+
+A manifest is a CSV (or Parquet, with pyarrow installed) file with one condition per
+row. The columns are those of the `condition` table:
+
+    condition_name, unit, depth_rasters, velocity_rasters, digital_elevation_model,
+    grain_size_raster, wse_folder, velocity_angle_folder, scour_raster, fill_raster,
+    background_raster, condition_output_path
+
+depth_rasters / velocity_rasters hold ";"-separated paths or a folder, which is
+scanned with discharge_catalog. An `output_location` column may replace
+condition_output_path; the outputs then go to <output_location>/<name>_outputs, as
+in the Condition tab. A directory scan turns every folder with depth and velocity
+rasters into a condition named after the folder.
+
+With config.align_on_ingest, inputs off the DEM grid are first replaced by aligned
+copies (raster_alignment); a dry run aligns nothing and reports them as errors.
+All rows are checked concurrently, their raster headers in turn (arcpy is not
+thread-safe). Valid rows are loaded with one COPY in a single transaction, together
+with their raster footprints (spatial_index): either every valid row is imported or
+none is.
+
+    python -m Module_Services.bulk_import manifest.csv [--dry-run]
+    python -m Module_Services.bulk_import --scan D:/scenarios --unit "SI Units" --output-root D:/outputs
+"""
+import argparse
+import csv
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import config
+from Module_Services import discharge_catalog, raster_alignment, raster_validation, spatial_index
+
+COLUMNS = (
+    "condition_name",
+    "unit",
+    "depth_rasters",
+    "velocity_rasters",
+    "digital_elevation_model",
+    "grain_size_raster",
+    "wse_folder",
+    "velocity_angle_folder",
+    "scour_raster",
+    "fill_raster",
+    "background_raster",
+    "condition_output_path",
+)
+UNITS = {"us": "US Customary Unit", "si": "SI Units"}
+_DEM_NAMES = re.compile(r"^(dem|dtm|elev)", re.IGNORECASE)
+_GRAIN_NAMES = re.compile(r"^(grain|d50|dmean|d84)", re.IGNORECASE)
+
+
+def _normalize_unit(value: str) -> str:
+    text = (value or "").strip()
+    for key, label in UNITS.items():
+        if text.lower() in (key, label.lower()) or text.lower().startswith(key):
+            return label
+    return text
+
+
+def read_manifest(path: str) -> List[dict]:
+    """Read manifest rows as dicts of stripped strings (empty cells become None)."""
+    if path.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+
+        raw = pq.read_table(path).to_pylist()
+    else:
+        with open(path, "r", newline="", encoding="utf-8-sig") as fh:
+            raw = list(csv.DictReader(fh))
+    rows = []
+    for item in raw:
+        row = {str(k).strip().lower(): (str(v).strip() if v is not None and str(v).strip() else None)
+               for k, v in item.items()}
+        rows.append(row)
+    return rows
+
+
+def _expand_rasters(value: str, kind: str) -> str:
+    """A folder is replaced by its rasters of `kind`, sorted by discharge."""
+    if value and os.path.isdir(value):
+        table = discharge_catalog.scan_folder(value).get(kind, {})
+        return ";".join(table[q] for q in sorted(table))
+    return value
+
+
+def scan_directory(root: str, unit: str = None, output_root: str = None) -> List[dict]:
+    """Return one manifest row per folder under `root` that holds depth and velocity rasters."""
+    rows = []
+    root = os.path.abspath(root)
+    for folder, _, files in os.walk(root):
+        kinds = discharge_catalog.scan_folder(folder)
+        if not kinds.get("depth") or not kinds.get("velocity"):
+            continue
+        rasters = [f for f in files if f.lower().endswith(discharge_catalog.RASTER_EXTENSIONS)]
+        dem = next((f for f in sorted(rasters) if _DEM_NAMES.match(f)), None)
+        grain = next((f for f in sorted(rasters) if _GRAIN_NAMES.match(f)), None)
+        rel = os.path.relpath(folder, root)
+        name = os.path.basename(root) if rel == "." else rel.replace(os.sep, "_")
+        rows.append(
+            {
+                "condition_name": name,
+                "unit": unit,
+                "depth_rasters": folder,
+                "velocity_rasters": folder,
+                "digital_elevation_model": os.path.join(folder, dem) if dem else None,
+                "grain_size_raster": os.path.join(folder, grain) if grain else None,
+                "output_location": output_root or folder,
+            }
+        )
+    return rows
+
+
+def prepare_row(row: dict) -> dict:
+    """Map a manifest row onto the condition columns."""
+    out = {col: row.get(col) for col in COLUMNS}
+    out["unit"] = _normalize_unit(out["unit"] or "")
+    out["depth_rasters"] = _expand_rasters(out["depth_rasters"], "depth")
+    out["velocity_rasters"] = _expand_rasters(out["velocity_rasters"], "velocity")
+    if not out["condition_output_path"] and row.get("output_location") and out["condition_name"]:
+        out["condition_output_path"] = os.path.join(row["output_location"], f"{out['condition_name']}_outputs")
+    return out
+
+
+def _split_rasters(row: dict) -> Tuple[List[str], List[str]]:
+    depth_paths = [p for p in (row["depth_rasters"] or "").split(";") if p.strip()]
+    vel_paths = [p for p in (row["velocity_rasters"] or "").split(";") if p.strip()]
+    return depth_paths, vel_paths
+
+
+def align_row(row: dict) -> List[str]:
+    """Point a prepared row at aligned copies of its misaligned inputs; returns notes."""
+    depth_paths, vel_paths = _split_rasters(row)
+    depth_paths, vel_paths, grain, notes = raster_alignment.align_condition_inputs(
+        depth_paths, vel_paths, row["digital_elevation_model"], row["grain_size_raster"]
+    )
+    if notes:
+        row["depth_rasters"] = ";".join(depth_paths)
+        row["velocity_rasters"] = ";".join(vel_paths)
+        row["grain_size_raster"] = grain
+    return notes
+
+
+def _check_files(row: dict) -> Tuple[List[str], bool]:
+    """Return the errors of a row that need no raster header, and whether its headers can be checked."""
+    errors = []
+    if not row["condition_name"]:
+        return ["missing condition_name"], False
+    if row["unit"] not in UNITS.values():
+        errors.append(f"unknown unit '{row['unit']}'")
+    depth_paths, vel_paths = _split_rasters(row)
+    if not depth_paths or not vel_paths:
+        errors.append("depth and velocity rasters are required")
+    for path in depth_paths + vel_paths + [row["digital_elevation_model"], row["grain_size_raster"]]:
+        if path and not os.path.exists(path):
+            errors.append(f"missing raster {path}")
+    if errors:
+        return errors, False
+    try:
+        discharge_catalog.pair_discharges(depth_paths, vel_paths)
+    except discharge_catalog.CatalogError as exc:
+        errors.append(str(exc))
+    return errors, True
+
+
+def validate_rows(rows: List[dict], existing=(), max_workers: int = None) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    Validate prepared rows; returns {condition_name: (errors, warnings)}. The file
+    checks run concurrently (they mostly wait on the file system); the header checks
+    call arcpy, which is not thread-safe, and run in turn on this thread.
+    """
+    existing = set(existing)
+    seen = {}
+    for row in rows:
+        seen[row["condition_name"]] = seen.get(row["condition_name"], 0) + 1
+    with ThreadPoolExecutor(max_workers=max_workers or min(16, (os.cpu_count() or 1) * 2)) as pool:
+        checked = list(pool.map(_check_files, rows))
+    report = {}
+    for row, (errors, check_headers) in zip(rows, checked):
+        warnings = []
+        if check_headers:
+            depth_paths, vel_paths = _split_rasters(row)
+            header_errors, warnings = raster_validation.validate_condition_rasters(
+                depth_paths, vel_paths, dem_path=row["digital_elevation_model"], grain_path=row["grain_size_raster"]
+            )
+            errors = errors + header_errors
+        name = row["condition_name"]
+        if name in existing:
+            errors = [f"condition '{name}' already exists"] + errors
+        if name and seen[name] > 1:
+            errors = [f"condition '{name}' appears {seen[name]} times in the manifest"] + errors
+        report[name or f"<row {len(report) + 1}>"] = (errors, warnings)
+    return report
+
+
+def copy_conditions(conn, rows: List[dict]):
+    """Insert condition rows with one COPY in the current transaction (not committed)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # Empty unquoted CSV fields load as NULL.
+        writer.writerow(["" if row[col] is None else row[col] for col in COLUMNS])
+    buffer.seek(0)
+    cur = conn.cursor()
+    cur.copy_expert(f"COPY condition ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cur.close()
+
+
+def import_conditions(conn, rows: List[dict], dry_run: bool = False, max_workers: int = None) -> dict:
+    """
+    Prepare, validate and load manifest rows. Rows with errors are skipped; the valid
+    rows are loaded in one transaction. Returns {"imported": [...], "report": {...}}.
+    """
+    prepared = [prepare_row(r) for r in rows]
+    if config.align_on_ingest and not dry_run:
+        for row in prepared:
+            try:
+                align_row(row)
+            except Exception:
+                continue  # validation reports the inputs that stay misaligned
+    cur = conn.cursor()
+    cur.execute("SELECT condition_name FROM condition;")
+    existing = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    report = validate_rows(prepared, existing, max_workers)
+    valid = [r for r in prepared if r["condition_name"] and not report[r["condition_name"]][0]]
+    if valid and not dry_run:
+        try:
+            copy_conditions(conn, valid)
+            for row in valid:
+                spatial_index.record_condition_footprints(conn, row["condition_name"], commit=False)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        for row in valid:
+            if row["condition_output_path"]:
+                os.makedirs(row["condition_output_path"], exist_ok=True)
+    return {"imported": [] if dry_run else [r["condition_name"] for r in valid], "report": report}
+
+
+def format_report(result: dict) -> str:
+    lines = [f"Imported {len(result['imported'])} condition(s)."]
+    for name, (errors, warnings) in result["report"].items():
+        for error in errors:
+            lines.append(f"⚠ {name}: {error}")
+        for warning in warnings:
+            lines.append(f"  {name}: {warning}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from Module_Services import storage
+
+    parser = argparse.ArgumentParser(description="Import many conditions at once.")
+    parser.add_argument("manifest", nargs="?", help="CSV or Parquet manifest.")
+    parser.add_argument("--scan", help="Directory tree to scan instead of a manifest.")
+    parser.add_argument("--unit", default="SI Units", help="Unit for scanned conditions.")
+    parser.add_argument("--output-root", default=None, help="Output location for scanned conditions.")
+    parser.add_argument("--dry-run", action="store_true", help="Validate only.")
+    args = parser.parse_args(argv)
+    if not args.manifest and not args.scan:
+        parser.error("give a manifest or --scan DIR")
+
+    rows = scan_directory(args.scan, args.unit, args.output_root) if args.scan else read_manifest(args.manifest)
+    conn = storage.connect()
+    try:
+        print(format_report(import_conditions(conn, rows, args.dry_run)))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Checkpoints of populate runs, so an interrupted run resumes where it stopped.
+
+Each discharge of a product run has a row in `populate_progress`. The row holds
+the input key (populate_features.checkpoint_key: input fingerprints, unit
+constants, storage mode, formula version), its status, and for the fused backend
+the number of strips already computed (with config.checkpoint_tiles). Strips are
+then computed into a memory-mapped "<output>.partial.npy", which is flushed before
+the strip count is committed. Rows
+are committed as the run advances: a discharge is marked done right after its
+raster has been renamed into place and its path recorded on the condition.
+
+A resumed run skips discharges that are done with an unchanged input key and an
+existing output. A discharge that stopped mid-way restarts from its last committed
+strip.
+
+    python -m Module_Services.checkpoints status <condition> [<product>]
+    python -m Module_Services.checkpoints resume <condition> <product> [--storage-mode MODE]
+"""
+import argparse
+import os
+import time
+from typing import Dict, Tuple
+
+import config
+from Database.populate_progress_table import POPULATE_PROGRESS_TABLE_SQL
+
+FIELDS = ("q_str", "run_id", "input_key", "status", "tile_rows", "tiles_done", "tile_count", "output_path")
+
+
+def ensure_progress_table(conn):
+    cur = conn.cursor()
+    cur.execute(POPULATE_PROGRESS_TABLE_SQL)
+    conn.commit()
+    cur.close()
+
+
+def partial_path(out_path: str) -> str:
+    """Memory-mapped strip buffer of a discharge being computed."""
+    return out_path + ".partial.npy"
+
+
+def remove_partial(out_path: str):
+    """
+    Delete the strip buffer of a finished discharge. All references to its memmap must
+    be gone; if the file is still mapped (Windows), it is left for the next run to reuse.
+    """
+    try:
+        os.remove(partial_path(out_path))
+    except (FileNotFoundError, PermissionError):
+        pass
+
+
+class Checkpoint:
+    """Progress rows of one product run of a condition."""
+
+    def __init__(self, conn, condition_name: str, product: str, run_id: str, resume: bool = False):
+        self.conn = conn
+        self.condition_name = condition_name
+        self.product = product
+        self.run_id = run_id
+        self._last_flush = {}
+        ensure_progress_table(conn)
+        cur = conn.cursor()
+        if not resume:
+            cur.execute(
+                "DELETE FROM populate_progress WHERE condition_name = %s AND product = %s;",
+                (condition_name, product),
+            )
+        cur.execute(
+            f"SELECT {', '.join(FIELDS)} FROM populate_progress WHERE condition_name = %s AND product = %s;",
+            (condition_name, product),
+        )
+        self.rows: Dict[str, dict] = {row[0]: dict(zip(FIELDS, row)) for row in cur.fetchall()}
+        conn.commit()
+        cur.close()
+
+    def _upsert(self, q_str: str, **values):
+        row = self.rows.setdefault(q_str, {"q_str": q_str})
+        row.update(values, run_id=self.run_id)
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO populate_progress (
+                condition_name, product, q_str, run_id, input_key, status,
+                tile_rows, tiles_done, tile_count, output_path, updated_at
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (condition_name, product, q_str) DO UPDATE SET
+                run_id = EXCLUDED.run_id,
+                input_key = EXCLUDED.input_key,
+                status = EXCLUDED.status,
+                tile_rows = EXCLUDED.tile_rows,
+                tiles_done = EXCLUDED.tiles_done,
+                tile_count = EXCLUDED.tile_count,
+                output_path = EXCLUDED.output_path,
+                updated_at = NOW();
+            """,
+            (
+                self.condition_name,
+                self.product,
+                q_str,
+                self.run_id,
+                row.get("input_key"),
+                row.get("status", "pending"),
+                row.get("tile_rows"),
+                row.get("tiles_done") or 0,
+                row.get("tile_count"),
+                row.get("output_path"),
+            ),
+        )
+        self.conn.commit()
+        cur.close()
+
+    def completed(self, q_str: str, input_key: str, out_path: str) -> bool:
+        """True if the discharge finished in an earlier attempt with the same inputs."""
+        row = self.rows.get(q_str)
+        return bool(
+            row
+            and row["status"] == "done"
+            and row["input_key"] == input_key
+            and row["output_path"] == out_path
+            and os.path.exists(out_path)
+        )
+
+    def resume_point(self, q_str: str, input_key: str, out_path: str, tile_rows: int) -> Tuple[int, int]:
+        """
+        Return (first strip to compute, strip height) for a discharge. A partly computed
+        discharge keeps the strip height it was started with.
+        """
+        row = self.rows.get(q_str)
+        if (
+            row
+            and row["status"] == "running"
+            and row["input_key"] == input_key
+            and row.get("tiles_done")
+            and row.get("tile_rows")
+            and os.path.exists(partial_path(out_path))
+        ):
+            return int(row["tiles_done"]), int(row["tile_rows"])
+        return 0, tile_rows
+
+    def begin(self, q_str: str, input_key: str, out_path: str, tile_rows: int = None, tile_count: int = None,
+              tiles_done: int = 0):
+        self._last_flush[q_str] = time.monotonic()
+        self._upsert(
+            q_str,
+            input_key=input_key,
+            status="running",
+            tile_rows=tile_rows,
+            tiles_done=tiles_done,
+            tile_count=tile_count,
+            output_path=out_path,
+        )
+
+    def tile_done(self, q_str: str, tiles_done: int, flush=None):
+        """Record strip progress at most every config.checkpoint_interval_s; `flush` persists the buffer first."""
+        now = time.monotonic()
+        if now - self._last_flush.get(q_str, 0.0) < config.checkpoint_interval_s:
+            return
+        if flush is not None:
+            flush()
+        self._last_flush[q_str] = now
+        self._upsert(q_str, tiles_done=tiles_done)
+
+    def done(self, q_str: str, input_key: str, out_path: str):
+        row = self.rows.get(q_str) or {}
+        self._upsert(
+            q_str,
+            input_key=input_key,
+            status="done",
+            tiles_done=row.get("tile_count") or row.get("tiles_done") or 0,
+            output_path=out_path,
+        )
+
+
+def progress(conn, condition_name: str, product: str = None):
+    """Return progress rows [(product, q_str, status, tiles_done, tile_count, updated_at)]."""
+    ensure_progress_table(conn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT product, q_str, status, tiles_done, tile_count, updated_at
+        FROM populate_progress
+        WHERE condition_name = %s AND (%s IS NULL OR product = %s)
+        ORDER BY product, updated_at;
+        """,
+        (condition_name, product, product),
+    )
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def main(argv=None):
+    from Module_Services import populate_features, storage
+
+    parser = argparse.ArgumentParser(description="Inspect or resume checkpointed populate runs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    st = sub.add_parser("status")
+    st.add_argument("condition_name")
+    st.add_argument("product", nargs="?")
+    rs = sub.add_parser("resume")
+    rs.add_argument("condition_name")
+    rs.add_argument("product", choices=sorted(populate_features.PRODUCTS))
+    rs.add_argument("--storage-mode", default=None)
+    rs.add_argument("--backend", default=None)
+    rs.add_argument("--precision", default=None, choices=("float64", "float32"))
+    args = parser.parse_args(argv)
+
+    conn = storage.connect()
+    try:
+        if args.command == "status":
+            for product, q_str, status, tiles_done, tile_count, updated_at in progress(
+                conn, args.condition_name, args.product
+            ):
+                tiles = f"{tiles_done}/{tile_count}" if tile_count else ""
+                print(f"{product:<12} Q{q_str:<10} {status:<8} {tiles:<10} {updated_at}")
+        else:
+            outputs = populate_features.resume_product(
+                args.condition_name, conn, args.product, args.storage_mode, args.backend, args.precision
+            )
+            print(f"{len(outputs)} {args.product} raster(s) complete.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Compute precision of the raster engines, and its validation.
+
+    float64  reference mode (what map algebra computes)
+    float32  half the working set and memory traffic. For the log-law chain the
+             relative error is a few float32 ulps (~1e-7) for most cells, but it grows
+             without bound where log10(h * log_coef) nears 0 (shallow cells over
+             coarse grain). Run `validate` on a condition for its largest error.
+
+The precision comes from config.compute_precision and can be overridden per run
+(populate_features.calculate_bed_shear_stress(..., precision="float32")). It is part
+of the derived-cache key of float32 outputs, so results of the two modes never mix.
+
+`validate` evaluates a random sample of tiles in both modes and reports, per product,
+the largest absolute and relative error of float32 against float64, and the cells
+whose NoData pattern differs:
+
+    python -m Module_Services.compute_precision validate <condition> [--products bed_shear,bed_shield]
+                                                         [--tiles 16] [--tile-size 256] [--seed 0]
+"""
+import argparse
+from typing import List, Sequence
+
+import numpy as np
+
+import config
+
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+
+def resolve_precision(name: str = None) -> str:
+    """Return a validated precision name, falling back to config.compute_precision."""
+    name = (name or config.compute_precision or "float64").strip().lower()
+    if name not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{name}'. Use one of: {', '.join(PRECISIONS)}.")
+    return name
+
+
+def compute_dtype(name: str = None) -> np.dtype:
+    """numpy dtype of a precision (default config.compute_precision)."""
+    return np.dtype(PRECISIONS[resolve_precision(name)])
+
+
+def _compare(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    ref_valid = np.isfinite(reference)
+    cand_valid = np.isfinite(candidate)
+    both = ref_valid & cand_valid
+    ref = reference[both]
+    err = np.abs(candidate[both].astype(np.float64) - ref)
+    scale = np.abs(ref)
+    nonzero = scale > 0
+    rel = err[nonzero] / scale[nonzero]
+    return {
+        "cells": int(both.sum()),
+        "nodata_mismatch": int(np.count_nonzero(ref_valid != cand_valid)),
+        "max_abs_error": float(err.max()) if err.size else 0.0,
+        "max_rel_error": float(rel.max()) if rel.size else 0.0,
+        "sum_rel_error": float(rel.sum()),
+        "rel_count": int(rel.size),
+    }
+
+
+def validate(
+    conn, condition_name: str, products: Sequence[str] = ("bed_shear", "bed_shield"), tiles: int = 16,
+    tile_size: int = 256, seed: int = 0,
+) -> List[dict]:
+    """
+    Evaluate `tiles` randomly chosen (discharge, tile) samples per product in float64
+    and float32. Returns one dict per product with the error figures.
+    """
+    from Module_Services import populate_features, raster_io
+
+    rng = np.random.default_rng(seed)
+    report = []
+    for product in products:
+        ctx = populate_features.load_product_context(conn, condition_name, product)
+        terms = populate_features.load_context_terms(ctx)
+        grid = ctx["grid"]
+        windows = list(raster_io.iter_windows(grid.rows, grid.cols, tile_size, tile_size))
+        total = len(ctx["discharges"]) * len(windows)
+        picks = rng.choice(total, size=min(int(tiles), total), replace=False)
+        contexts = {name: dict(ctx, dtype=compute_dtype(name)) for name in PRECISIONS}
+        summary = {"product": product, "tiles": int(picks.size), "cells": 0, "nodata_mismatch": 0,
+                   "max_abs_error": 0.0, "max_rel_error": 0.0, "sum_rel_error": 0.0, "rel_count": 0}
+        for pick in sorted(int(p) for p in picks):
+            record = ctx["discharges"][pick // len(windows)]
+            window = windows[pick % len(windows)]
+            depth, vel = populate_features.read_inputs(contexts["float64"], record, window)
+            results = {}
+            for name, run_ctx in contexts.items():
+                dtype = run_ctx["dtype"]
+                shape = (window[2], window[3])
+                out_tb = np.empty(shape, dtype=dtype)
+                out_ts = np.empty(shape, dtype=dtype) if product == "bed_shield" else None
+                populate_features.evaluate_window(
+                    run_ctx, terms, record, window, out_tb, out_ts,
+                    inputs=(depth.astype(dtype, copy=False), vel.astype(dtype, copy=False)),
+                )
+                results[name] = out_ts if out_ts is not None else out_tb
+            figures = _compare(results["float64"], results["float32"])
+            summary["cells"] += figures["cells"]
+            summary["nodata_mismatch"] += figures["nodata_mismatch"]
+            summary["max_abs_error"] = max(summary["max_abs_error"], figures["max_abs_error"])
+            summary["max_rel_error"] = max(summary["max_rel_error"], figures["max_rel_error"])
+            summary["sum_rel_error"] += figures["sum_rel_error"]
+            summary["rel_count"] += figures["rel_count"]
+        summary["mean_rel_error"] = summary.pop("sum_rel_error") / max(summary.pop("rel_count"), 1)
+        report.append(summary)
+    return report
+
+
+def format_report(rows: List[dict]) -> str:
+    lines = [f"{'product':<11} {'tiles':>6} {'cells':>11} {'max abs err':>12} {'max rel err':>12} "
+             f"{'mean rel err':>12} {'NoData diff':>11}"]
+    for row in rows:
+        lines.append(
+            f"{row['product']:<11} {row['tiles']:>6} {row['cells']:>11} {row['max_abs_error']:>12.3e} "
+            f"{row['max_rel_error']:>12.3e} {row['mean_rel_error']:>12.3e} {row['nodata_mismatch']:>11}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from Module_Services import storage
+
+    parser = argparse.ArgumentParser(description="Compare float32 against float64 compute on sampled tiles.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    va = sub.add_parser("validate")
+    va.add_argument("condition_name")
+    va.add_argument("--products", default="bed_shear,bed_shield")
+    va.add_argument("--tiles", type=int, default=16)
+    va.add_argument("--tile-size", type=int, default=256)
+    va.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    conn = storage.connect()
+    try:
+        products = [p.strip() for p in args.products.split(",") if p.strip()]
+        print(format_report(validate(conn, args.condition_name, products, args.tiles, args.tile_size, args.seed)))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Tile-wise comparison of two conditions (pre- and post-project).
+
+The discharge stacks of both conditions are aligned by numeric Q; discharges that
+only one condition has are reported and skipped. For every product and shared
+discharge the rasters are streamed tile by tile, holding one band of tiles at a
+time, into
+
+    <post outputs>/diff_<pre>/<product>_diff<Q>.tif     post - pre
+    <post outputs>/diff_<pre>/<product>_class<Q>.tif    change class per cell
+
+and a summary row per product and discharge goes to `condition_diff`.
+
+Change classes:
+    -3  valid before, NoData (dry for depth) after
+    -2  decrease larger than config.diff_large_change of the pre value
+    -1  decrease
+     0  |post - pre| <= config.diff_tolerance
+     1  increase
+     2  large increase
+     3  NoData (dry) before, valid after
+
+Unchanged data is skipped cheaply. Rasters with the same content digest are not
+read at all. Otherwise each file raster's tile checksums are cached under
+<dir2cache>/diff_checksums, keyed by its fingerprint. Tiles whose checksums match
+are filled without computing, and without reading when both checksums are already
+cached. A design iteration that touched one reach only computes the tiles of that
+reach.
+
+    python -m Module_Services.condition_diff <pre> <post> [--products depth,bed_shear] [--storage-mode MODE]
+    python -m Module_Services.condition_diff <pre> <post> --report
+"""
+import argparse
+import hashlib
+import json
+import os
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+import config
+import fGl
+from Database.condition_diff_table import CONDITION_DIFF_TABLE_SQL
+from Module_Services import (
+    derived_cache,
+    discharge_catalog,
+    populate_features,
+    raster_io,
+    raster_stats,
+    raster_storage,
+    sampling,
+    virtual_rasters,
+)
+
+DEFAULT_PRODUCTS = ("depth", "velocity", "bed_shear", "bed_shield")
+CLASSES = {
+    -3: "lost",
+    -2: "large decrease",
+    -1: "decrease",
+    0: "no change",
+    1: "increase",
+    2: "large increase",
+    3: "gained",
+}
+CHECKSUM_VERSION = 1
+
+_ROOT = os.path.join(config.dir2cache, "diff_checksums")
+
+
+class DiffError(ValueError):
+    """Raised when two conditions cannot be compared."""
+
+
+class _TileChecksums:
+    """Cached [digest, nan_count, positive_count] per tile of a raster file; virtual rasters cache nothing."""
+
+    def __init__(self, path: str, tile: int):
+        self.file = None
+        self.tiles: Dict[str, list] = {}
+        self._dirty = False
+        if path and os.path.isfile(path):
+            key = hashlib.sha1(f"{fGl.file_fingerprint(path)}|{tile}|v{CHECKSUM_VERSION}".encode("utf-8")).hexdigest()
+            self.file = os.path.join(_ROOT, key + ".json")
+            try:
+                with open(self.file, "r", encoding="utf-8") as fh:
+                    self.tiles = json.load(fh)
+            except (OSError, ValueError):
+                self.tiles = {}
+
+    @staticmethod
+    def _key(window) -> str:
+        return f"{window[0]}_{window[1]}"
+
+    def get(self, window):
+        return self.tiles.get(self._key(window))
+
+    def put(self, window, array: np.ndarray) -> list:
+        with np.errstate(invalid="ignore"):
+            positive = int(np.count_nonzero(array > 0))
+        entry = [
+            hashlib.blake2b(np.ascontiguousarray(array).tobytes(), digest_size=16).hexdigest(),
+            int(np.count_nonzero(np.isnan(array))),
+            positive,
+        ]
+        if self.file is not None:
+            self.tiles[self._key(window)] = entry
+            self._dirty = True
+        return entry
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(_ROOT, exist_ok=True)
+        tmp = f"{self.file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.tiles, fh)
+        os.replace(tmp, self.file)
+        self._dirty = False
+
+
+def ensure_diff_table(conn):
+    cur = conn.cursor()
+    cur.execute(CONDITION_DIFF_TABLE_SQL)
+    conn.commit()
+    cur.close()
+
+
+def _output_folder(conn, pre: str, post: str) -> str:
+    cur = conn.cursor()
+    cur.execute("SELECT condition_output_path FROM condition WHERE condition_name = %s;", (post,))
+    row = cur.fetchone()
+    cur.close()
+    if not row or not row[0]:
+        raise DiffError(f"Condition '{post}' has no output folder.")
+    folder = os.path.join(row[0], f"diff_{pre}")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _stack_key(record: dict):
+    """Q of a discharge, or its q_str for discharges paired by position (q is None)."""
+    return record["q"] if record["q"] is not None else record["q_str"]
+
+
+def _key_order(key):
+    # Discharges by ascending Q, then the ones paired by position by name.
+    return (1, 0.0, key) if isinstance(key, str) else (0, key, "")
+
+
+def product_stack(conn, condition_name: str, product: str, grid) -> Dict[object, Tuple[str, str, object]]:
+    """
+    Return {Q: (q_str, path or None, read(window))} of a product, keyed by q_str for
+    discharges without Q. Outputs that were not written are evaluated on demand
+    (virtual_rasters) and have no path.
+    """
+    discharges = discharge_catalog.condition_discharges(conn, condition_name)
+    if product in ("depth", "velocity"):
+        return {_stack_key(r): (r["q_str"], r[product], sampling.raster_reader(r[product], grid)) for r in discharges}
+    if product not in populate_features.PRODUCTS:
+        raise DiffError(f"Unknown product '{product}'.")
+    recorded = sampling.recorded_outputs(conn, condition_name, populate_features.PRODUCTS[product][3])
+    stack = {}
+    virtual = None
+    for record in discharges:
+        path = recorded.get(record["q"])
+        if path:
+            stack[_stack_key(record)] = (record["q_str"], path, sampling.raster_reader(path, grid))
+            continue
+        if virtual is None:
+            virtual = virtual_rasters.open_virtual_products(conn, condition_name, product)
+        stack[_stack_key(record)] = (record["q_str"], None, virtual[record["q_str"]].read)
+    return stack
+
+
+def _check_grids(pre_grid, post_grid, pre: str, post: str):
+    half_cell = 0.5 * min(pre_grid.cell_w, pre_grid.cell_h)
+    if (
+        pre_grid.shape != post_grid.shape
+        or abs(pre_grid.xmin - post_grid.xmin) > half_cell
+        or abs(pre_grid.ymax - post_grid.ymax) > half_cell
+        or abs(pre_grid.cell_w - post_grid.cell_w) > 1e-9 * max(pre_grid.cell_w, 1.0)
+    ):
+        raise DiffError(
+            f"Conditions '{pre}' and '{post}' are not on the same grid "
+            f"({pre_grid.rows}x{pre_grid.cols} vs {post_grid.rows}x{post_grid.cols}); align them first."
+        )
+
+
+def _classify(product: str, a: np.ndarray, b: np.ndarray, out_diff: np.ndarray, out_cls: np.ndarray):
+    """Write post - pre and the change class of one tile."""
+    with np.errstate(invalid="ignore"):
+        np.subtract(b, a, out=out_diff)
+        if product == "depth":
+            valid_a, valid_b = a > 0, b > 0
+        else:
+            valid_a, valid_b = np.isfinite(a), np.isfinite(b)
+        magnitude = np.abs(out_diff)
+        level = np.where(magnitude > config.diff_tolerance, 1.0, 0.0)
+        level[magnitude > config.diff_large_change * np.abs(a)] = 2.0
+        level[magnitude <= config.diff_tolerance] = 0.0
+        np.multiply(np.sign(out_diff), level, out=out_cls)
+    out_cls[~valid_a & ~valid_b] = np.nan
+    out_cls[valid_a & ~valid_b] = -3.0
+    out_cls[~valid_a & valid_b] = 3.0
+    out_diff[~(valid_a & valid_b)] = np.nan
+
+
+def _uniform_value(product: str, entry: list, size: int):
+    """0.0 or NaN when an unchanged tile is entirely valid or entirely NoData/dry; None when mixed."""
+    valid = entry[2] if product == "depth" else size - entry[1]
+    if valid == size:
+        return 0.0
+    if valid == 0:
+        return np.nan
+    return None
+
+
+def _fill_unchanged(product: str, a: np.ndarray, out_diff: np.ndarray, out_cls: np.ndarray):
+    """Fill a tile whose rasters are identical: 0 where valid, NaN elsewhere."""
+    valid = a > 0 if product == "depth" else np.isfinite(a)
+    out_diff.fill(np.nan)
+    out_cls.fill(np.nan)
+    out_diff[valid] = 0.0
+    out_cls[valid] = 0.0
+
+
+def _class_counts(cls: np.ndarray) -> np.ndarray:
+    values = cls[np.isfinite(cls)].astype(np.int64) + 3
+    return np.bincount(values, minlength=len(CLASSES))
+
+
+def diff_pair(product: str, grid, pre_entry, post_entry, tile: int, diff_out, class_out) -> dict:
+    """
+    Stream one aligned pair, one band of tiles at a time, into the raster_storage
+    StripWriters `diff_out` and `class_out`; returns the tile counters and class counts.
+    """
+    _, pre_path, pre_read = pre_entry
+    _, post_path, post_read = post_entry
+    pre_sums = _TileChecksums(pre_path, tile)
+    post_sums = _TileChecksums(post_path, tile)
+    counts = np.zeros(len(CLASSES), dtype=np.int64)
+    band = None
+
+    def flush():
+        counts[:] += _class_counts(band[2])
+        diff_out.write(band[0], band[1])
+        class_out.write(band[0], band[2])
+
+    total = skipped = 0
+    for window in raster_io.iter_windows(grid.rows, grid.cols, tile, tile):
+        row_off, col_off, nrows, ncols = window
+        if band is None or band[0] != row_off:
+            if band is not None:
+                flush()
+            band = (row_off, np.empty((nrows, grid.cols)), np.empty((nrows, grid.cols)))
+        d = band[1][:, col_off:col_off + ncols]
+        c = band[2][:, col_off:col_off + ncols]
+        total += 1
+        known_a, known_b = pre_sums.get(window), post_sums.get(window)
+        if known_a is not None and known_a == known_b:
+            value = _uniform_value(product, known_a, nrows * ncols)
+            if value is not None:
+                # Identical and uniformly valid or NoData: nothing to read.
+                d.fill(value)
+                c.fill(value)
+                skipped += 1
+                continue
+        a = pre_read(window)
+        sum_a = known_a or pre_sums.put(window, a)
+        if known_b is not None and known_b == sum_a:
+            _fill_unchanged(product, a, d, c)
+            skipped += 1
+            continue
+        b = post_read(window)
+        if (known_b or post_sums.put(window, b)) == sum_a:
+            _fill_unchanged(product, a, d, c)
+            skipped += 1
+            continue
+        _classify(product, a, b, d, c)
+    flush()
+    pre_sums.save()
+    post_sums.save()
+    return {"tiles_total": total, "tiles_skipped": skipped, "class_counts": counts.tolist()}
+
+
+def _same_content(pre_path: str, post_path: str) -> bool:
+    if not pre_path or not post_path:
+        return False
+    if os.path.abspath(pre_path) == os.path.abspath(post_path):
+        return True
+    if os.path.getsize(pre_path) != os.path.getsize(post_path):
+        return False
+    return derived_cache.content_digest(pre_path) == derived_cache.content_digest(post_path)
+
+
+def _record(conn, rows: List[tuple]):
+    cur = conn.cursor()
+    cur.execute(CONDITION_DIFF_TABLE_SQL)
+    cur.executemany(
+        """
+        INSERT INTO condition_diff (
+            pre_condition, post_condition, product, q_str, q_value, identical, compared_count,
+            changed_count, class_counts, min_diff, max_diff, mean_diff, tiles_total, tiles_skipped,
+            diff_path, class_path, computed_at
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (pre_condition, post_condition, product, q_str) DO UPDATE SET
+            q_value = EXCLUDED.q_value,
+            identical = EXCLUDED.identical,
+            compared_count = EXCLUDED.compared_count,
+            changed_count = EXCLUDED.changed_count,
+            class_counts = EXCLUDED.class_counts,
+            min_diff = EXCLUDED.min_diff,
+            max_diff = EXCLUDED.max_diff,
+            mean_diff = EXCLUDED.mean_diff,
+            tiles_total = EXCLUDED.tiles_total,
+            tiles_skipped = EXCLUDED.tiles_skipped,
+            diff_path = EXCLUDED.diff_path,
+            class_path = EXCLUDED.class_path,
+            computed_at = NOW();
+        """,
+        rows,
+    )
+    conn.commit()
+    cur.close()
+
+
+def diff_conditions(
+    conn, pre: str, post: str, products: Sequence[str] = DEFAULT_PRODUCTS, storage_mode: str = None
+) -> dict:
+    """
+    Compare `post` against `pre` for each product and shared discharge. Writes the
+    difference and change-class rasters, records the summaries in condition_diff and
+    returns {"rows": [summary dicts], "unmatched": {product: {"pre": [Q], "post": [Q]}}}.
+    Discharges paired by position (no Q in their names) are matched by q_str.
+    """
+    pre_discharges = discharge_catalog.condition_discharges(conn, pre)
+    post_discharges = discharge_catalog.condition_discharges(conn, post)
+    if not pre_discharges or not post_discharges:
+        raise DiffError("Both conditions need depth/velocity rasters.")
+    grid = raster_io.RasterGrid.from_raster(pre_discharges[0]["depth"])
+    _check_grids(grid, raster_io.RasterGrid.from_raster(post_discharges[0]["depth"]), pre, post)
+    folder = _output_folder(conn, pre, post)
+    reference = post_discharges[0]["depth"]
+    tile = config.diff_tile_size
+
+    summaries, records, unmatched = [], [], {}
+    for product in products:
+        pre_stack = product_stack(conn, pre, product, grid)
+        post_stack = product_stack(conn, post, product, grid)
+        shared = sorted(set(pre_stack) & set(post_stack), key=_key_order)
+        unmatched[product] = {
+            "pre": sorted(set(pre_stack) - set(post_stack), key=_key_order),
+            "post": sorted(set(post_stack) - set(pre_stack), key=_key_order),
+        }
+        for key in shared:
+            q_str = post_stack[key][0]
+            q = None if isinstance(key, str) else key
+            summary = {"product": product, "q": q, "q_str": q_str, "identical": False,
+                       "diff_path": None, "class_path": None}
+            if _same_content(pre_stack[key][1], post_stack[key][1]):
+                summary.update(identical=True, tiles_total=0, tiles_skipped=0, compared_count=None,
+                               changed_count=0, class_counts=None, min_diff=0.0, max_diff=0.0, mean_diff=0.0)
+            else:
+                summary["diff_path"] = os.path.join(folder, product + "_diff" + fGl.write_Q_str(q_str) + ".tif")
+                summary["class_path"] = os.path.join(folder, product + "_class" + fGl.write_Q_str(q_str) + ".tif")
+                diff_stats = raster_stats.RasterStats()
+                diff_out = raster_storage.StripWriter(summary["diff_path"], reference, storage_mode, diff_stats)
+                class_out = raster_storage.StripWriter(summary["class_path"], reference, "float32")
+                with diff_out, class_out:
+                    summary.update(diff_pair(product, grid, pre_stack[key], post_stack[key], tile, diff_out, class_out))
+                counts = summary["class_counts"]
+                stats = diff_stats.as_dict()
+                summary.update(
+                    compared_count=stats["valid_count"],
+                    changed_count=sum(counts) - counts[3],
+                    class_counts=counts,
+                    min_diff=stats["min"],
+                    max_diff=stats["max"],
+                    mean_diff=stats["mean"],
+                )
+            summaries.append(summary)
+            records.append(
+                (
+                    pre, post, product, q_str, q, summary["identical"], summary["compared_count"],
+                    summary["changed_count"], summary["class_counts"], summary["min_diff"], summary["max_diff"],
+                    summary["mean_diff"], summary["tiles_total"], summary["tiles_skipped"],
+                    summary["diff_path"], summary["class_path"],
+                )
+            )
+    _record(conn, records)
+    return {"rows": summaries, "unmatched": unmatched}
+
+
+def diff_summary(conn, pre: str, post: str) -> List[dict]:
+    """Return the recorded comparison rows of two conditions, by product and ascending Q."""
+    ensure_diff_table(conn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT product, q_str, q_value, identical, compared_count, changed_count, class_counts,
+               min_diff, max_diff, mean_diff, tiles_total, tiles_skipped, diff_path, class_path, computed_at
+        FROM condition_diff
+        WHERE pre_condition = %s AND post_condition = %s
+        ORDER BY product, q_value;
+        """,
+        (pre, post),
+    )
+    fields = [d[0] for d in cur.description]
+    rows = [dict(zip(fields, r)) for r in cur.fetchall()]
+    cur.close()
+    return rows
+
+
+def _fmt(value) -> str:
+    return f"{value:11.4g}" if value is not None else f"{'-':>11}"
+
+
+def format_summary(rows: List[dict]) -> str:
+    if not rows:
+        return "No comparison recorded."
+    lines = [f"{'product':<11} {'Q':>9} {'changed':>10} {'of':>10} {'mean':>11} {'min':>11} {'max':>11}  tiles"]
+    for row in rows:
+        if row["identical"]:
+            lines.append(f"{row['product']:<11} {row['q_str']:>9}  identical")
+            continue
+        lines.append(
+            f"{row['product']:<11} {row['q_str']:>9} {row['changed_count'] or 0:>10} {row['compared_count'] or 0:>10} "
+            f"{_fmt(row['mean_diff'])} {_fmt(row['min_diff'])} {_fmt(row['max_diff'])}  "
+            f"{row['tiles_total'] - row['tiles_skipped']}/{row['tiles_total']} computed"
+        )
+        counts = row.get("class_counts")
+        if counts:
+            lines.append("    " + ", ".join(f"{CLASSES[k]}: {n}" for k, n in zip(sorted(CLASSES), counts) if n))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from Module_Services import storage
+
+    parser = argparse.ArgumentParser(description="Compare a post-project condition with a pre-project condition.")
+    parser.add_argument("pre")
+    parser.add_argument("post")
+    parser.add_argument("--products", default=",".join(DEFAULT_PRODUCTS))
+    parser.add_argument("--storage-mode", default=None)
+    parser.add_argument("--report", action="store_true", help="Print the recorded summary only.")
+    args = parser.parse_args(argv)
+
+    conn = storage.connect()
+    try:
+        if not args.report:
+            result = diff_conditions(
+                conn, args.pre, args.post, [p.strip() for p in args.products.split(",") if p.strip()],
+                args.storage_mode,
+            )
+            for product, missing in result["unmatched"].items():
+                for side in ("pre", "post"):
+                    if missing[side]:
+                        listed = ", ".join(q if isinstance(q, str) else f"{q:g}" for q in missing[side])
+                        print(f"{product}: Q only in {side}: {listed}")
+        print(format_summary(diff_summary(conn, args.pre, args.post)))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 import os
+import time
 
-from PyQt5.QtWidgets import QLineEdit, QComboBox
+from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QLineEdit, QComboBox, QFileDialog
 try:
     import sip
 except ImportError:  # fallback if sip not available
     sip = None
 from psycopg2 import Error
 
+import config
+from Module_Services import bulk_import, raster_alignment, raster_validation, spatial_index
+
 
 def proceed_to_analysis(window):
     """Handle proceed button click."""
@@ -80,7 +85,37 @@ def create_condition(window):
     if not window.db_connection:
         window.info_text.append("\n⚠ Database connection not available.")
         return
+    if getattr(window, "_pending_condition", None) is not None:
+        window.info_text.append("\n⚠ Still aligning the inputs of the previous condition; try again when it is saved.")
+        return
+
+    values = {
+        "condition_name": condition_name,
+        "unit": unit,
+        "depth_rasters": depth_rasters,
+        "velocity_rasters": velocity_rasters,
+        "digital_elevation_model": dem,
+        "grain_size_raster": grain_size,
+        "wse_folder": wse_folder,
+        "velocity_angle_folder": velocity_angle_folder,
+        "scour_raster": scour_raster,
+        "fill_raster": fill_raster,
+        "background_raster": background_raster,
+        "condition_output_path": condition_output_path,
+    }
+    # Header check first (sub-second); alignment, if needed, runs in the background.
+    errors = condition_header_errors(window, depth_rasters, velocity_rasters, dem, grain_size)
+    if errors and config.align_on_ingest and start_alignment(window, values):
+        return
+    if errors:
+        report_misaligned(window, errors)
+        return
+    save_condition(window, values)
+
 
+def save_condition(window, values):
+    """Insert a new condition row (column -> value) and refresh the condition lists."""
+    condition_name = values["condition_name"]
     try:
         cursor = window.db_connection.cursor()
         cursor.execute(
@@ -102,17 +137,17 @@ def create_condition(window):
             """,
             (
                 condition_name,
-                unit,
-                depth_rasters,
-                velocity_rasters,
-                dem,
-                grain_size,
-                wse_folder,
-                velocity_angle_folder,
-                scour_raster,
-                fill_raster,
-                background_raster,
-                condition_output_path
+                values["unit"],
+                values["depth_rasters"],
+                values["velocity_rasters"],
+                values["digital_elevation_model"],
+                values["grain_size_raster"],
+                values["wse_folder"],
+                values["velocity_angle_folder"],
+                values["scour_raster"],
+                values["fill_raster"],
+                values["background_raster"],
+                values["condition_output_path"],
             )
         )
         window.db_connection.commit()
@@ -126,6 +161,11 @@ def create_condition(window):
         except Exception:
             pass
         window.info_text.append(f"\n✓ Condition '{condition_name}' has been created and saved to the database.")
+        try:
+            spatial_index.record_condition_footprints(window.db_connection, condition_name)
+        except Exception as exc:
+            window.db_connection.rollback()
+            window.info_text.append(f"\n⚠ Could not record raster footprints: {exc}")
         try:
             window.set_active_condition(condition_name)
         except Exception:
@@ -135,6 +175,184 @@ def create_condition(window):
         window.db_connection.rollback()
 
 
+class _AlignWorker(QThread):
+    """Write aligned copies of condition inputs off the GUI thread (arcpy runs in worker processes)."""
+
+    progress = pyqtSignal(int, int)
+    done = pyqtSignal(object, int, str)
+
+    def __init__(self, todo, reference, ref_header, parent=None):
+        super().__init__(parent)
+        self.todo = todo
+        self.reference = reference
+        self.ref_header = ref_header
+
+    def run(self):
+        try:
+            aligned, cached = raster_alignment.align_rasters(
+                self.todo, self.reference, self.ref_header, progress=self.progress.emit, isolated=True
+            )
+        except Exception as exc:
+            self.done.emit({}, 0, str(exc))
+            return
+        self.done.emit(aligned, cached, "")
+
+
+class _PendingCondition(QObject):
+    """A new condition whose inputs are being aligned; it is checked again and saved once they are."""
+
+    def __init__(self, window, values, reference, ref_header, todo):
+        super().__init__(window)
+        self.window = window
+        self.values = values
+        self.on_dem = reference == values["digital_elevation_model"]
+        self.started = time.perf_counter()
+        self.worker = _AlignWorker(todo, reference, ref_header, self)
+        self.worker.progress.connect(self._on_progress)
+        self.worker.done.connect(self._on_done)
+        self.worker.start()
+
+    @pyqtSlot(int, int)
+    def _on_progress(self, done, total):
+        self.window.info_text.append(f"Aligned {done} of {total} raster(s)...")
+
+    @pyqtSlot(object, int, str)
+    def _on_done(self, aligned, cached, error):
+        window, values = self.window, self.values
+        self.worker.wait()
+        window._pending_condition = None
+        self.deleteLater()
+        if error:
+            window.info_text.append(
+                f"\n⚠ Could not align inputs onto the DEM grid; condition '{values['condition_name']}' "
+                f"was not created: {error}"
+            )
+            return
+        window.info_text.append(
+            "\n✓ " + raster_alignment.alignment_note(aligned, cached, self.on_dem, time.perf_counter() - self.started)
+        )
+        depth_paths, vel_paths, grain = raster_alignment.replace_aligned(
+            _split(values["depth_rasters"]), _split(values["velocity_rasters"]), values["grain_size_raster"], aligned
+        )
+        values = dict(
+            values, depth_rasters=";".join(depth_paths), velocity_rasters=";".join(vel_paths), grain_size_raster=grain
+        )
+        if check_condition_alignment(
+            window, values["depth_rasters"], values["velocity_rasters"], values["digital_elevation_model"], grain
+        ):
+            save_condition(window, values)
+
+
+def _split(rasters):
+    return [p.strip() for p in (rasters or "").split(";") if p.strip()]
+
+
+def bulk_import_conditions(window, from_folder=False):
+    """Import many conditions from a manifest (or a scanned folder tree) and refresh the lists once."""
+    if not window.db_connection:
+        window.info_text.append("\n⚠ Database connection not available.")
+        return
+    if from_folder:
+        root = QFileDialog.getExistingDirectory(window, "Select Scenario Folder", "")
+        if not root:
+            return
+        unit = None
+        if "Unit" in window.inputs and isinstance(window.inputs["Unit"], QComboBox):
+            unit = window.inputs["Unit"].currentText()
+        base_output = window.inputs.get("Select Output Location", QLineEdit()).text().strip() or None
+        rows = bulk_import.scan_directory(root, unit, base_output)
+    else:
+        manifest, _ = QFileDialog.getOpenFileName(
+            window, "Select Condition Manifest", "", "Manifests (*.csv *.parquet);;All Files (*)"
+        )
+        if not manifest:
+            return
+        try:
+            rows = bulk_import.read_manifest(manifest)
+        except Exception as exc:
+            window.info_text.append(f"\n⚠ Could not read manifest: {exc}")
+            return
+    started = time.perf_counter()
+    try:
+        result = bulk_import.import_conditions(window.db_connection, rows)
+    except (Exception, Error) as error:
+        window.info_text.append(f"\nError importing conditions: {error}")
+        return
+    window.info_text.append(
+        f"\n✓ {bulk_import.format_report(result)} ({time.perf_counter() - started:.1f} s)"
+    )
+    if result["imported"]:
+        load_conditions_from_db(window)
+
+
+def start_alignment(window, values) -> bool:
+    """
+    Start aligning the inputs of a new condition onto the DEM grid (config.align_on_ingest)
+    in the background; the condition is saved when it is done. Returns False when
+    alignment cannot fix the inputs (missing rasters, nothing off the grid).
+    """
+    depth_paths = _split(values["depth_rasters"])
+    vel_paths = _split(values["velocity_rasters"])
+    dem, grain = values["digital_elevation_model"] or None, values["grain_size_raster"] or None
+    if not all(os.path.exists(p) for p in depth_paths + vel_paths + [p for p in (dem, grain) if p]):
+        return False
+    try:
+        # Headers were just read by the validation: served from its cache.
+        reference, ref_header, todo = raster_alignment.plan_alignment(depth_paths, vel_paths, dem, grain)
+    except Exception as exc:
+        window.info_text.append(f"\n⚠ Could not align inputs onto the DEM grid: {exc}")
+        return False
+    if not todo:
+        return False
+    window.info_text.append(
+        f"\nAligning {len(todo)} raster(s) onto the {'DEM' if reference == dem else 'grain size'} grid in the "
+        f"background; condition '{values['condition_name']}' is saved when they are aligned."
+    )
+    window._pending_condition = _PendingCondition(window, values, reference, ref_header, todo)
+    return True
+
+
+def condition_header_errors(window, depth_rasters, velocity_rasters, dem, grain_size):
+    """
+    Validate raster headers (extent, CRS, cell size, dtype, nodata) of a new condition.
+    Reports warnings in the info pane and returns the errors.
+    """
+    depth_paths = _split(depth_rasters)
+    vel_paths = _split(velocity_rasters)
+    if not (depth_paths or vel_paths or dem or grain_size):
+        return []
+    started = time.perf_counter()
+    try:
+        errors, warnings = raster_validation.validate_condition_rasters(
+            depth_paths, vel_paths, dem_path=dem or None, grain_path=grain_size or None
+        )
+    except Exception as exc:  # validation must never block the form on unexpected errors
+        window.info_text.append(f"\n⚠ Could not validate raster headers: {exc}")
+        return []
+    elapsed = time.perf_counter() - started
+    for warning in warnings:
+        window.info_text.append(f"\n⚠ {warning}")
+    count = len(depth_paths) + len(vel_paths) + bool(dem) + bool(grain_size)
+    window.info_text.append(f"\n✓ Checked {count} raster header(s) in {elapsed:.2f} s.")
+    return errors
+
+
+def report_misaligned(window, errors):
+    window.info_text.append("\n⚠ Inputs are not aligned; condition was not created:\n - " + "\n - ".join(errors))
+
+
+def check_condition_alignment(window, depth_rasters, velocity_rasters, dem, grain_size) -> bool:
+    """
+    Validate raster headers of a new condition (condition_header_errors).
+    Reports problems in the info pane and returns False if the condition must not be created.
+    """
+    errors = condition_header_errors(window, depth_rasters, velocity_rasters, dem, grain_size)
+    if errors:
+        report_misaligned(window, errors)
+        return False
+    return True
+
+
 def populate_condition_fields(window, condition_name):
     """Fetch a condition record from the DB and populate the form fields."""
     if not condition_name:
@@ -0,0 +1,271 @@
+"""
+Content-addressed store of derived rasters shared across conditions.
+
+A derived raster (bed shear, Shields, ...) is identified by its product, the content
+digests of its input rasters (with sidecars such as .tfw and .prj), the unit
+constants, the storage mode and grain_terms.FORMULA_VERSION. Scenario conditions that
+reuse the same depth, velocity and grain rasters therefore compute each product only
+once. Later runs hard-link the
+stored raster into their own output folder, or copy it where links are not supported.
+
+Entries live under <dir2cache>/derived/<key[:2]>/<key>/. Each entry holds the raster
+(hard-linked, so evicting it never breaks a condition's outputs) and copies of its
+small sidecars. The store is kept below config.derived_cache_max_bytes by evicting
+the least recently used entries.
+
+    python -m Module_Services.derived_cache            # print store usage
+    python -m Module_Services.derived_cache --evict    # trim to the size limit
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import Iterable, List, Optional
+
+import config
+import fGl
+from Module_Services import grain_terms
+
+_ROOT = os.path.join(config.dir2cache, "derived")
+_DIGESTS = os.path.join(_ROOT, "digests.json")
+_ENTRY_RASTER = "raster.tif"
+_ENTRY_META = "entry.json"
+# Sidecars named after the raster's stem (h100.tif -> h100.tfw). Those named after the
+# whole file name (h100.tif.aux.xml, h100.tif.quant.json) are found by _companions.
+_SIDECARS = (".tfw", ".tifw", ".wld", ".prj", ".hdr", ".blw", ".stx", ".clr", ".rrd", ".rde")
+_lock = threading.Lock()
+_digests: Optional[dict] = None
+_stored_bytes: Optional[int] = None
+_fetches = {"hits": 0, "misses": 0}
+
+
+def _load_digests() -> dict:
+    global _digests
+    if _digests is None:
+        try:
+            with open(_DIGESTS, "r", encoding="utf-8") as fh:
+                _digests = json.load(fh)
+        except (OSError, ValueError):
+            _digests = {}
+    return _digests
+
+
+def _raster_files(path: str) -> List[str]:
+    """
+    The files of a raster: the raster, then its sidecars (_SIDECARS, .aux.xml,
+    .quant.json, ...; pyramids excepted) in name order. Other rasters sharing the stem
+    (h1.5.tif next to h1.tif) are not sidecars. Directory-based formats (ESRI grid) are
+    their member files.
+    """
+    if os.path.isdir(path):
+        return [m for m in sorted(glob.glob(os.path.join(path, "**", "*"), recursive=True)) if os.path.isfile(m)]
+    stem = os.path.splitext(path)[0]
+    sidecars = {stem + ext for ext in _SIDECARS} | set(_companions(path))
+    sidecars.discard(path)
+    return [path] + sorted(p for p in sidecars if not p.lower().endswith(".ovr") and os.path.isfile(p))
+
+
+def content_digest(path: str) -> str:
+    """
+    Return the SHA-1 of a raster's bytes and those of its sidecars, which carry its
+    georeferencing. Digests are remembered per fingerprint of these files, so they are
+    only read again after one of them changes.
+    """
+    files = _raster_files(path)
+    is_dir = os.path.isdir(path)
+    fingerprint = fGl.file_fingerprint(path) if is_dir else ";".join(fGl.file_fingerprint(f) for f in files)
+    with _lock:
+        known = _load_digests().get(fingerprint)
+    if known:
+        return known
+    sha = hashlib.sha1()
+    stem_len = len(os.path.splitext(os.path.basename(path))[0])
+    for member in files:
+        if not is_dir and member != path:
+            # The sidecar's extension too: the same bytes as .tfw or as .prj are different inputs.
+            sha.update(os.path.basename(member)[stem_len:].encode("utf-8"))
+        with open(member, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                sha.update(chunk)
+    digest = sha.hexdigest()
+    with _lock:
+        digests = _load_digests()
+        digests[fingerprint] = digest
+        os.makedirs(_ROOT, exist_ok=True)
+        tmp = f"{_DIGESTS}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(digests, fh)
+        os.replace(tmp, _DIGESTS)
+    return digest
+
+
+def derived_key(product: str, inputs: Iterable[str], params: dict) -> str:
+    """
+    Return the store key of a derived raster: a hash of the product, the content
+    digests of `inputs` (in order) and `params` (unit constants, storage mode, ...).
+    """
+    text = json.dumps(
+        {
+            "product": product,
+            "inputs": [content_digest(p) for p in inputs],
+            "params": params,
+            "formula_version": grain_terms.FORMULA_VERSION,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _entry_dir(key: str) -> str:
+    return os.path.join(_ROOT, key[:2], key)
+
+
+def _companions(path: str) -> List[str]:
+    """Sidecar files written next to a raster (e.g. .aux.xml, .ovr, .quant.json)."""
+    return sorted(glob.glob(glob.escape(path) + ".*"))
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _remove(path: str):
+    for target in [path] + _companions(path):
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            pass
+
+
+def fetch(key: str, out_path: str) -> bool:
+    """
+    Place the stored raster for `key` at `out_path` (hard link, copy as fallback).
+    Returns False if the store has no such entry.
+    """
+    if not config.derived_cache_enabled or not key:
+        return False
+    entry = _entry_dir(key)
+    raster = os.path.join(entry, _ENTRY_RASTER)
+    hit = os.path.exists(raster)
+    with _lock:
+        _fetches["hits" if hit else "misses"] += 1
+    if not hit:
+        return False
+    _remove(out_path)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    _link_or_copy(raster, out_path)
+    # Sidecars are copied: they are small and may be rewritten in place later.
+    for companion in _companions(raster):
+        shutil.copy2(companion, out_path + companion[len(raster):])
+    os.utime(os.path.join(entry, _ENTRY_META))
+    return True
+
+
+def fetch_counts() -> dict:
+    """Fetches of this process served by the store (hits) or not (misses)."""
+    with _lock:
+        return dict(_fetches)
+
+
+def entry_info(key: str) -> dict:
+    """Return the info stored with an entry (e.g. its statistics), or {}."""
+    try:
+        with open(os.path.join(_entry_dir(key), _ENTRY_META), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _grow(size: int) -> bool:
+    """
+    Add `size` bytes to this process's running total of the store size, counted once on
+    first use; returns True once the total exceeds the size limit.
+    """
+    global _stored_bytes
+    with _lock:
+        if _stored_bytes is None:
+            _stored_bytes = usage()["bytes"]
+        else:
+            _stored_bytes += size
+        return _stored_bytes > config.derived_cache_max_bytes
+
+
+def store(key: str, out_path: str, info: dict = None):
+    """
+    Add a freshly written raster to the store. The store is only scanned and trimmed
+    once the running total crosses the size limit.
+    """
+    if not config.derived_cache_enabled or not key or not os.path.isfile(out_path):
+        return
+    entry = _entry_dir(key)
+    if os.path.exists(os.path.join(entry, _ENTRY_META)):
+        os.utime(os.path.join(entry, _ENTRY_META))
+        return
+    tmp = f"{entry}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    raster = os.path.join(tmp, _ENTRY_RASTER)
+    _link_or_copy(out_path, raster)
+    for companion in _companions(out_path):
+        shutil.copy2(companion, raster + companion[len(out_path):])
+    with open(os.path.join(tmp, _ENTRY_META), "w", encoding="utf-8") as fh:
+        json.dump(dict(info or {}, key=key, source=out_path, created=time.time()), fh, indent=2)
+    size = sum(os.path.getsize(p) for p in glob.glob(os.path.join(tmp, "*")))
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        # Another process stored the same key first.
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    if _grow(size):
+        evict()
+
+
+def _entries():
+    """Yield (last_used, size, entry_dir) for every stored entry."""
+    for meta in glob.glob(os.path.join(_ROOT, "*", "*", _ENTRY_META)):
+        entry = os.path.dirname(meta)
+        try:
+            size = sum(os.path.getsize(p) for p in glob.glob(os.path.join(entry, "*")))
+            yield os.path.getmtime(meta), size, entry
+        except OSError:
+            continue
+
+
+def usage() -> dict:
+    """Return the number of entries and bytes held by the store."""
+    entries = list(_entries())
+    return {"entries": len(entries), "bytes": sum(size for _, size, _ in entries)}
+
+
+def evict(max_bytes: int = None) -> int:
+    """Drop least recently used entries until the store fits `max_bytes`; returns entries removed."""
+    global _stored_bytes
+    limit = config.derived_cache_max_bytes if max_bytes is None else max_bytes
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, entry in entries:
+        if total <= limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+    with _lock:
+        _stored_bytes = total
+    return removed
+
+
+if __name__ == "__main__":
+    if "--evict" in sys.argv[1:]:
+        print(f"Evicted {evict()} entries.")
+    stats = usage()
+    print(f"{stats['entries']} entries, {stats['bytes'] / 1024 ** 2:.1f} MiB "
+          f"(limit {config.derived_cache_max_bytes / 1024 ** 2:.0f} MiB) in {_ROOT}")
@@ -0,0 +1,223 @@
+"""
+Discharge catalog for raster folders and raster lists.
+
+Discharges are parsed as numbers from filenames with the patterns in
+config.discharge_patterns, so "h050.tif" and "h50.tif" are the same Q and stacks sort
+numerically. A folder index is persisted under <dir2cache>/discharge_catalogs and is
+only refreshed when the folder's mtime changes; on refresh, names already known are
+not parsed again. Unchanged folders are never re-listed.
+
+    python -m Module_Services.discharge_catalog <folder>   # print the index of a folder
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import config
+import fGl
+
+RASTER_EXTENSIONS = (".tif", ".tiff", ".asc", ".img")
+KINDS = ("depth", "velocity", "wse", "velocity_angle")
+
+_INDEX_DIR = os.path.join(config.dir2cache, "discharge_catalogs")
+_memory: Dict[str, Tuple[int, str, dict]] = {}
+
+
+class CatalogError(ValueError):
+    """Raised when rasters cannot be paired unambiguously by discharge."""
+
+
+def _compiled(patterns: dict) -> Dict[str, "re.Pattern"]:
+    return {kind: re.compile(expr, re.IGNORECASE) for kind, expr in patterns.items()}
+
+
+def classify(filename: str, patterns: dict = None, kind: str = None) -> Optional[Tuple[str, float, str]]:
+    """
+    Return (kind, q, q_str) for a raster filename, or None if no pattern matches.
+    With `kind`, only that kind's pattern is tried.
+    """
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    if ext.lower() not in RASTER_EXTENSIONS:
+        return None
+    compiled = _compiled(patterns or config.discharge_patterns)
+    candidates = [kind] if kind else list(compiled)
+    for name in candidates:
+        match = compiled[name].match(stem) if name in compiled else None
+        if match:
+            q = fGl.parse_Q_value(match.group("q"))
+            if q is not None:
+                return name, q, match.group("q")
+    return None
+
+
+def _index_path(folder: str) -> str:
+    return os.path.join(_INDEX_DIR, hashlib.sha1(folder.lower().encode("utf-8")).hexdigest() + ".json")
+
+
+def _load_index(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_index(path: str, index: dict):
+    os.makedirs(_INDEX_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(index, fh)
+    os.replace(tmp, path)
+
+
+def scan_folder(folder: str, patterns: dict = None) -> Dict[str, Dict[float, str]]:
+    """
+    Return {kind: {q: path}} for the rasters in `folder`.
+
+    The persisted index is reused as long as the folder mtime is unchanged.
+    """
+    folder = os.path.abspath(folder)
+    patterns = patterns or config.discharge_patterns
+    pattern_key = json.dumps(patterns, sort_keys=True)
+    mtime_ns = os.stat(folder).st_mtime_ns
+
+    cached = _memory.get(folder)
+    if cached and cached[0] == mtime_ns and cached[1] == pattern_key:
+        return cached[2]
+
+    index_path = _index_path(folder)
+    index = _load_index(index_path)
+    if index and index.get("patterns") == pattern_key and index.get("mtime_ns") == mtime_ns:
+        entries = index["entries"]
+    else:
+        known = index["entries"] if index and index.get("patterns") == pattern_key else {}
+        entries = {}
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.name in known:
+                    entries[entry.name] = known[entry.name]
+                    continue
+                if not entry.name.lower().endswith(RASTER_EXTENSIONS) or not entry.is_file():
+                    continue
+                hit = classify(entry.name, patterns)
+                entries[entry.name] = [hit[0], hit[1], hit[2]] if hit else None
+        _save_index(index_path, {"folder": folder, "mtime_ns": mtime_ns, "patterns": pattern_key, "entries": entries})
+
+    by_kind: Dict[str, Dict[float, str]] = {}
+    for name, hit in sorted(entries.items()):
+        if hit:
+            by_kind.setdefault(hit[0], {}).setdefault(hit[1], os.path.join(folder, name))
+    _memory[folder] = (mtime_ns, pattern_key, by_kind)
+    return by_kind
+
+
+def _index_paths(paths: List[str], kind: str, patterns: dict) -> Optional[Dict[float, Tuple[str, str]]]:
+    """
+    Map q -> (q_str, path) for an explicit list; None if any name has no discharge.
+    A name that only matches the pattern of another kind (u100.tif among the depth
+    rasters) is rejected.
+    """
+    table = {}
+    for path in paths:
+        hit = classify(path, patterns, kind)
+        if hit is None:
+            other = classify(path, patterns)
+            if other is not None:
+                raise CatalogError(f"{os.path.basename(path)} is named as a {other[0]} raster, not a {kind} raster.")
+            return None
+        _, q, q_str = hit
+        if q in table:
+            raise CatalogError(
+                f"Discharge {q:g} appears twice in the {kind} rasters: "
+                f"{os.path.basename(table[q][1])} and {os.path.basename(path)}."
+            )
+        table[q] = (q_str, path)
+    return table
+
+
+def pair_discharges(
+    depth_paths: List[str],
+    vel_paths: List[str],
+    wse_folder: str = None,
+    angle_folder: str = None,
+    patterns: dict = None,
+) -> List[dict]:
+    """
+    Pair depth/velocity rasters (and optional WSE / velocity-angle folders) by discharge.
+
+    Returns records sorted by ascending Q with keys q, q_str, depth, velocity, wse,
+    velocity_angle. If any depth or velocity filename carries no discharge, the lists
+    are paired by position (q is None) as in earlier releases.
+    """
+    patterns = patterns or config.discharge_patterns
+    depth_table = _index_paths(depth_paths, "depth", patterns)
+    vel_table = _index_paths(vel_paths, "velocity", patterns)
+
+    if depth_table is None or vel_table is None:
+        if len(depth_paths) != len(vel_paths):
+            raise CatalogError(
+                f"Depth/velocity raster count mismatch ({len(depth_paths)} vs {len(vel_paths)})."
+            )
+        return [
+            {
+                "q": None,
+                "q_str": fGl.read_Q_str(os.path.basename(d), prefix="h"),
+                "depth": d,
+                "velocity": v,
+                "wse": None,
+                "velocity_angle": None,
+            }
+            for d, v in zip(depth_paths, vel_paths)
+        ]
+
+    unmatched = sorted(set(depth_table) ^ set(vel_table))
+    if unmatched:
+        raise CatalogError(
+            "No matching depth/velocity pair for Q = " + ", ".join(f"{q:g}" for q in unmatched) + "."
+        )
+    wse = scan_folder(wse_folder, patterns).get("wse", {}) if wse_folder and os.path.isdir(wse_folder) else {}
+    angle = (
+        scan_folder(angle_folder, patterns).get("velocity_angle", {})
+        if angle_folder and os.path.isdir(angle_folder)
+        else {}
+    )
+    return [
+        {
+            "q": q,
+            "q_str": depth_table[q][0],
+            "depth": depth_table[q][1],
+            "velocity": vel_table[q][1],
+            "wse": wse.get(q),
+            "velocity_angle": angle.get(q),
+        }
+        for q in sorted(depth_table)
+    ]
+
+
+def condition_discharges(conn, condition_name: str) -> List[dict]:
+    """Return the paired discharge table of a stored condition."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT depth_rasters, velocity_rasters, wse_folder, velocity_angle_folder
+        FROM condition WHERE condition_name = %s;
+        """,
+        (condition_name,),
+    )
+    row = cur.fetchone()
+    cur.close()
+    if not row:
+        raise ValueError(f"Condition '{condition_name}' not found in database.")
+    depth_raw, vel_raw, wse_folder, angle_folder = row
+    depth_paths = [p for p in (depth_raw or "").split(";") if p.strip()]
+    vel_paths = [p for p in (vel_raw or "").split(";") if p.strip()]
+    return pair_discharges(depth_paths, vel_paths, wse_folder, angle_folder)
+
+
+if __name__ == "__main__":
+    for target in sys.argv[1:]:
+        for kind, table in sorted(scan_folder(target).items()):
+            print(f"{kind}: " + ", ".join(f"{q:g}" for q in sorted(table)))
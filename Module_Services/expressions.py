@@ -0,0 +1,377 @@
+"""
+Derived rasters defined as expressions over the condition inputs.
+
+An expression is a Python-syntax formula over
+
+    h (depth), u (velocity)         per discharge
+    D (grain size), z (DEM)         static rasters of the condition
+    rho_w, g, s, n                  unit constants (see populate_features.unit_constants)
+    other definitions               by name, e.g. tb is used by ts
+
+with + - * / **, unary -, comparisons, & and |, and the functions log10, log, exp,
+sqrt, abs, minimum, maximum and where(cond, a, b). `nan` and `pi` are known.
+
+Every requested name is compiled into one DAG. Identical subexpressions become one
+node, whether they come from a shared definition (the shear velocity us feeds both
+tb and ts) or are written out twice. Constant subtrees are folded at compile time.
+Intermediates are dropped after their last use. The DAG is evaluated strip by strip
+in a single pass over each discharge, reading only the inputs it needs. Non-finite
+results are NoData.
+
+Definitions come from DEFINITIONS, config.derived_expressions and define().
+
+    python -m Module_Services.expressions list
+    python -m Module_Services.expressions show tb ts froude
+    python -m Module_Services.expressions run <condition> tb ts froude [--q 100] [--precision float32]
+"""
+import argparse
+import ast
+import math
+import os
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+import config
+import fGl
+
+DEFINITIONS = {
+    # 12.2 / (2 * 2.2 * D): log-law argument coefficient (NaN where D <= 0)
+    "log_coef": "where(D > 0, 12.2 / (2 * 2.2 * D), nan)",
+    "us": "where(h > 0, u / (5.75 * log10(h * log_coef)), nan)",
+    "tb": "rho_w * us ** 2",
+    "ts": "tb / (rho_w * g * (s - 1) * D)",
+    "froude": "where(h > 0, u / sqrt(g * h), nan)",
+    "unit_stream_power": "tb * u",
+    # Grain size at incipient motion for a critical Shields stress of 0.047
+    "d_crit": "tb / (rho_w * g * (s - 1) * 0.047)",
+    "wse": "where(h > 0, z + h, nan)",
+}
+
+INPUTS = {"h": "depth", "u": "velocity", "D": "grain", "z": "dem"}
+_ALIASES = {"depth": "h", "velocity": "u", "grain": "D", "dem": "z"}
+_KNOWN = {"nan": math.nan, "pi": math.pi}
+_INLINE = re.compile(r"^\s*([A-Za-z_]\w*)\s*=(?!=)(.+)$")
+
+_BINARY = {
+    ast.Add: "add", ast.Sub: "sub", ast.Mult: "mul", ast.Div: "div", ast.Pow: "pow",
+    ast.BitAnd: "and", ast.BitOr: "or",
+}
+_COMPARE = {ast.Gt: "gt", ast.GtE: "ge", ast.Lt: "lt", ast.LtE: "le", ast.Eq: "eq", ast.NotEq: "ne"}
+_COMMUTATIVE = {"add", "mul", "and", "or", "eq", "ne", "minimum", "maximum"}
+_FUNCTIONS = {
+    "log10": (1, np.log10), "log": (1, np.log), "exp": (1, np.exp), "sqrt": (1, np.sqrt), "abs": (1, np.abs),
+    "minimum": (2, np.minimum), "maximum": (2, np.maximum), "where": (3, np.where),
+}
+_UFUNCS = {
+    "add": np.add, "sub": np.subtract, "mul": np.multiply, "div": np.divide, "pow": np.power,
+    "and": np.logical_and, "or": np.logical_or, "neg": np.negative,
+    "gt": np.greater, "ge": np.greater_equal, "lt": np.less, "le": np.less_equal, "eq": np.equal, "ne": np.not_equal,
+}
+_UFUNCS.update({name: fn for name, (_, fn) in _FUNCTIONS.items()})
+
+_user_definitions: Dict[str, str] = {}
+
+
+class ExpressionError(ValueError):
+    """Raised for unknown names, unsupported syntax or circular definitions."""
+
+
+def define(name: str, expression: str):
+    """Register a derived raster for this session (overrides a definition of the same name)."""
+    if not name.isidentifier() or name in INPUTS or name in _ALIASES:
+        raise ExpressionError(f"'{name}' cannot be used as a definition name.")
+    ast.parse(expression, mode="eval")
+    _user_definitions[name] = expression
+
+
+def definitions() -> Dict[str, str]:
+    """All known definitions: built-in, then config.derived_expressions, then define()."""
+    merged = dict(DEFINITIONS)
+    merged.update(getattr(config, "derived_expressions", {}) or {})
+    merged.update(_user_definitions)
+    return merged
+
+
+class Program:
+    """A compiled DAG: nodes in evaluation order and the node of each requested name."""
+
+    def __init__(self, nodes: List[tuple], outputs: Dict[str, int]):
+        self.nodes = nodes
+        self.outputs = outputs
+        self.inputs = sorted({node[1] for node in nodes if node[0] == "input"})
+        self._last_use = {}
+        for index, node in enumerate(nodes):
+            if node[0] not in ("input", "const"):
+                for arg in node[1:]:
+                    self._last_use[arg] = index
+        self._keep = set(outputs.values())
+
+    def evaluate(self, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Evaluate on same-shaped input arrays ({"h": ..., "u": ...}); returns {name: array}."""
+        shape = next(iter(arrays.values())).shape if arrays else ()
+        dtype = next(iter(arrays.values())).dtype if arrays else np.float64
+        values = {}
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            for index, node in enumerate(self.nodes):
+                op = node[0]
+                if op == "input":
+                    values[index] = arrays[node[1]]
+                elif op == "const":
+                    values[index] = node[1]
+                else:
+                    values[index] = _UFUNCS[op](*(values[arg] for arg in node[1:]))
+                    for arg in node[1:]:
+                        if self._last_use.get(arg) == index and arg not in self._keep:
+                            values.pop(arg, None)
+        results = {}
+        for name, index in self.outputs.items():
+            result = np.asarray(values[index])
+            if result.dtype == bool or result.shape != shape:
+                result = np.broadcast_to(result, shape).astype(dtype)
+            else:
+                result = result.astype(dtype, copy=True)
+            result[~np.isfinite(result)] = np.nan
+            results[name] = result
+        return results
+
+    def describe(self) -> str:
+        """One line per node, e.g. '%4 = mul(%1, %3)'."""
+        names = {index: name for name, index in self.outputs.items()}
+        lines = []
+        for index, node in enumerate(self.nodes):
+            if node[0] == "input":
+                text = f"input {node[1]}"
+            elif node[0] == "const":
+                text = f"{node[1]!r}"
+            else:
+                text = f"{node[0]}(" + ", ".join(f"%{a}" for a in node[1:]) + ")"
+            label = f"    <- {names[index]}" if index in names else ""
+            lines.append(f"%{index} = {text}{label}")
+        return "\n".join(lines)
+
+
+class _Builder:
+    def __init__(self, constants: Dict[str, float], defs: Dict[str, str]):
+        self.constants = constants
+        self.defs = defs
+        self.nodes: List[tuple] = []
+        self.index: Dict[tuple, int] = {}
+        self.named: Dict[str, int] = {}
+
+    def add(self, node: tuple) -> int:
+        op = node[0]
+        if op not in ("input", "const"):
+            args = node[1:]
+            if all(self.nodes[a][0] == "const" for a in args):
+                # Constant folding
+                with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                    value = _UFUNCS[op](*(self.nodes[a][1] for a in args))
+                return self.add(("const", float(value)))
+            if op in _COMMUTATIVE:
+                node = (op,) + tuple(sorted(args))
+        elif op == "const" and math.isnan(node[1]):
+            node = ("const", "nan")
+        if node not in self.index:
+            self.index[node] = len(self.nodes)
+            self.nodes.append(node if node != ("const", "nan") else ("const", math.nan))
+        return self.index[node]
+
+    def name(self, name: str, stack: Tuple[str, ...] = ()) -> int:
+        name = _ALIASES.get(name, name)
+        if name in self.named:
+            return self.named[name]
+        if name in INPUTS:
+            index = self.add(("input", name))
+        elif name in self.constants:
+            index = self.add(("const", float(self.constants[name])))
+        elif name in _KNOWN:
+            index = self.add(("const", _KNOWN[name]))
+        elif name in self.defs:
+            if name in stack:
+                raise ExpressionError("Circular definition: " + " -> ".join(stack + (name,)))
+            tree = ast.parse(self.defs[name], mode="eval").body
+            index = self.expr(tree, stack + (name,))
+        else:
+            raise ExpressionError(f"Unknown name '{name}'.")
+        self.named[name] = index
+        return index
+
+    def expr(self, node, stack) -> int:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return self.add(("const", float(node.value)))
+        if isinstance(node, ast.Name):
+            return self.name(node.id, stack)
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return self.add((_BINARY[type(node.op)], self.expr(node.left, stack), self.expr(node.right, stack)))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self.expr(node.operand, stack)
+            return operand if isinstance(node.op, ast.UAdd) else self.add(("neg", operand))
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE:
+            return self.add(
+                (_COMPARE[type(node.ops[0])], self.expr(node.left, stack), self.expr(node.comparators[0], stack))
+            )
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS:
+            arity = _FUNCTIONS[node.func.id][0]
+            if len(node.args) != arity or node.keywords:
+                raise ExpressionError(f"{node.func.id}() takes {arity} argument(s).")
+            return self.add((node.func.id,) + tuple(self.expr(arg, stack) for arg in node.args))
+        raise ExpressionError(f"Unsupported syntax: {ast.dump(node)}")
+
+
+def compile_expressions(names: Sequence[str], constants: Dict[str, float], defs: Dict[str, str] = None) -> Program:
+    """
+    Compile the requested definitions (names, or "name = expression" strings) into one
+    DAG with shared subexpressions.
+    """
+    defs = dict(definitions() if defs is None else defs)
+    requested = []
+    for item in names:
+        inline = _INLINE.match(item)
+        if inline:
+            item, defs[inline.group(1)] = inline.group(1), inline.group(2).strip()
+        requested.append(item)
+    builder = _Builder(constants, defs)
+    outputs = {name: builder.name(name) for name in requested}
+    # Only the nodes the outputs depend on, in order.
+    needed = set()
+    for index in sorted(outputs.values(), reverse=True):
+        stack = [index]
+        while stack:
+            i = stack.pop()
+            if i in needed:
+                continue
+            needed.add(i)
+            if builder.nodes[i][0] not in ("input", "const"):
+                stack.extend(builder.nodes[i][1:])
+    order = sorted(needed)
+    remap = {old: new for new, old in enumerate(order)}
+    nodes = []
+    for old in order:
+        node = builder.nodes[old]
+        if node[0] in ("input", "const"):
+            nodes.append(node)
+        else:
+            nodes.append((node[0],) + tuple(remap[a] for a in node[1:]))
+    return Program(nodes, {name: remap[index] for name, index in outputs.items()})
+
+
+def _condition_inputs(conn, condition_name: str) -> dict:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT grain_size_raster, digital_elevation_model, unit, condition_output_path
+        FROM condition WHERE condition_name = %s;
+        """,
+        (condition_name,),
+    )
+    row = cur.fetchone()
+    cur.close()
+    if not row:
+        raise ValueError(f"Condition '{condition_name}' not found in database.")
+    return {"grain": row[0], "dem": row[1], "unit": (row[2] or "").lower(), "output_root": row[3]}
+
+
+def evaluate_condition(
+    conn, condition_name: str, names: Sequence[str], q_strs: Sequence[str] = None, storage_mode: str = None,
+    precision: str = None,
+) -> Dict[str, List[str]]:
+    """
+    Evaluate the requested definitions for the discharges of a condition (all, or
+    `q_strs`) in one tiled pass per discharge. Rasters go to
+    <condition outputs>/derived_rasters/<name><Q>.tif, and their statistics to
+    raster_stats. Returns {name: [paths]}.
+    """
+    from Module_Services import (
+        autotune,
+        compute_precision,
+        discharge_catalog,
+        pipeline,
+        populate_features,
+        raster_io,
+        raster_stats,
+        raster_storage,
+    )
+
+    info = _condition_inputs(conn, condition_name)
+    if not info["output_root"]:
+        raise ValueError(f"No output location stored for condition '{condition_name}'.")
+    program = compile_expressions(names, populate_features.unit_constants(info["unit"]))
+    discharges = discharge_catalog.condition_discharges(conn, condition_name)
+    if q_strs:
+        discharges = [r for r in discharges if r["q_str"] in set(q_strs)]
+    if not discharges:
+        raise ValueError(f"No matching discharges for condition '{condition_name}'.")
+    for name in ("D", "z"):
+        if name in program.inputs and not info[INPUTS[name]]:
+            raise ValueError(f"Condition '{condition_name}' has no {INPUTS[name]} raster, needed by {list(names)}.")
+
+    grid = raster_io.RasterGrid.from_raster(discharges[0]["depth"])
+    dtype = compute_precision.compute_dtype(precision)
+    plan = autotune.plan_for_grid(grid, "analysis", len(discharges), discharges[0]["depth"], dtype)
+    out_dir = os.path.join(info["output_root"], "derived_rasters")
+    os.makedirs(out_dir, exist_ok=True)
+    buffers = {name: np.empty(grid.shape, dtype=dtype) for name in program.outputs}
+    written = {name: [] for name in program.outputs}
+
+    for record in discharges:
+        sources = {"h": record["depth"], "u": record["velocity"], "D": info["grain"], "z": info["dem"]}
+
+        def read(window):
+            return {name: raster_io.read_window(sources[name], grid, window, dtype) for name in program.inputs}
+
+        windows = raster_io.iter_windows(grid.rows, grid.cols, plan.tile_rows)
+        threaded = all(raster_io.thread_safe(sources[name]) for name in program.inputs)
+        for window, arrays in pipeline.prefetch(windows, read, threaded=threaded):
+            row_off, _, nrows, _ = window
+            for name, values in program.evaluate(arrays).items():
+                buffers[name][row_off:row_off + nrows] = values
+        entries = {}
+        for name, buffer in buffers.items():
+            out_path = os.path.join(out_dir, name + fGl.write_Q_str(record["q_str"]) + ".tif")
+            accumulator = raster_stats.RasterStats()
+            raster_storage.save_derived_array(buffer, out_path, record["depth"], storage_mode, accumulator)
+            entries.setdefault(name, []).append((out_path, record["q_str"], accumulator.as_dict()))
+            written[name].append(out_path)
+        for name, rows in entries.items():
+            raster_stats.record_stats(conn, condition_name, name, rows)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Derived rasters defined as expressions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    sh = sub.add_parser("show")
+    sh.add_argument("names", nargs="+")
+    rn = sub.add_parser("run")
+    rn.add_argument("condition_name")
+    rn.add_argument("names", nargs="+", help='Definition names or "name = expression".')
+    rn.add_argument("--q", action="append", default=None, help="Discharge (repeatable; default all).")
+    rn.add_argument("--storage-mode", default=None)
+    rn.add_argument("--precision", default=None, choices=("float64", "float32"))
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, expression in sorted(definitions().items()):
+            print(f"{name:<18} = {expression}")
+        return
+    if args.command == "show":
+        # SI constants, for display only.
+        print(compile_expressions(args.names, {"rho_w": 1000.0, "g": 9.81, "s": 2.68, "n": 0.0473934}).describe())
+        return
+
+    from Module_Services import storage
+
+    conn = storage.connect()
+    try:
+        written = evaluate_condition(conn, args.condition_name, args.names, args.q, args.storage_mode, args.precision)
+        for name, paths in written.items():
+            print(f"{name}: {len(paths)} raster(s)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Precomputed grain- and unit-dependent terms of the log-law chain.
+
+    log_coef     = 12.2 / (2 * 2.2 * D)        the log argument is h * log_coef
+    shields_den  = rho_w * g * (s - 1) * D      the Shields denominator
+
+Both depend only on the grain raster and the unit constants. They are computed once,
+stored as .npy arrays under <dir2cache>/grain_terms/<key>/ and memory-mapped on
+reuse. The key is built from the grain fingerprint, the constants and
+FORMULA_VERSION. Cells with D <= 0 or NoData hold NaN. Any engine (shear, Shields,
+lifespan, design) can read windows of the arrays, or ask for a GeoTIFF copy for
+map algebra.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+import config
+import fGl
+from Module_Services import raster_io, raster_storage
+
+FORMULA_VERSION = 1
+TERMS = ("log_coef", "shields_den")
+
+# 12.2 / (2 * 2.2): log-law argument coefficient
+LOG_COEF = 12.2 / (2 * 2.2)
+
+_ROOT = os.path.join(config.dir2cache, "grain_terms")
+_loaded = {}
+
+
+class GrainTerms:
+    """Memory-mapped precomputed terms for one grain raster and unit system."""
+
+    def __init__(self, folder: str, grain_path: str):
+        self.folder = folder
+        self.grain_path = grain_path
+        with open(os.path.join(folder, "meta.json"), "r", encoding="utf-8") as fh:
+            self.meta = json.load(fh)
+        self.arrays = {name: np.load(os.path.join(folder, name + ".npy"), mmap_mode="r") for name in TERMS}
+
+    @property
+    def log_coef(self) -> np.ndarray:
+        return self.arrays["log_coef"]
+
+    @property
+    def shields_den(self) -> np.ndarray:
+        return self.arrays["shields_den"]
+
+    def window(self, name: str, window: raster_io.Window) -> np.ndarray:
+        """Return a read-only ndarray view of a term for a window."""
+        row_off, col_off, nrows, ncols = window
+        return np.asarray(self.arrays[name][row_off:row_off + nrows, col_off:col_off + ncols])
+
+    def as_raster(self, name: str) -> str:
+        """Return the path of a GeoTIFF copy of a term (written on first use) for map algebra."""
+        path = os.path.join(self.folder, name + ".tif")
+        if not os.path.exists(path):
+            raster_storage.save_derived_array(self.arrays[name], path, self.grain_path, "full")
+        return path
+
+
+def _cache_key(grain_path: str, rho_w: float, g: float, s: float) -> str:
+    text = f"{fGl.file_fingerprint(grain_path)}|{rho_w!r}|{g!r}|{s!r}|v{FORMULA_VERSION}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _build(folder: str, grain_path: str, rho_w: float, g: float, s: float):
+    """
+    Compute the terms strip by strip into a temporary folder of this process, then move
+    it into place. An existing folder is never replaced: another process may be
+    memory-mapping it.
+    """
+    tmp = f"{folder}.tmp{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    grid = raster_io.RasterGrid.from_raster(grain_path)
+    log_coef = np.lib.format.open_memmap(os.path.join(tmp, "log_coef.npy"), "w+", np.float64, grid.shape)
+    shields_den = np.lib.format.open_memmap(os.path.join(tmp, "shields_den.npy"), "w+", np.float64, grid.shape)
+    shields_factor = rho_w * g * (s - 1)
+    for window in raster_io.iter_windows(grid.rows, grid.cols, config.tile_rows):
+        row_off, _, nrows, _ = window
+        grain = raster_io.read_window(grain_path, grid, window)
+        grain[~(grain > 0.0)] = np.nan
+        np.divide(LOG_COEF, grain, out=log_coef[row_off:row_off + nrows])
+        np.multiply(grain, shields_factor, out=shields_den[row_off:row_off + nrows])
+    log_coef.flush()
+    shields_den.flush()
+    del log_coef, shields_den
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fh:
+        json.dump(
+            {
+                "grain": fGl.file_fingerprint(grain_path),
+                "rho_w": rho_w,
+                "g": g,
+                "s": s,
+                "formula_version": FORMULA_VERSION,
+                "rows": grid.rows,
+                "cols": grid.cols,
+            },
+            fh,
+            indent=2,
+        )
+    try:
+        os.replace(tmp, folder)
+    except OSError:
+        # A concurrent builder of the same key won; its terms are identical.
+        if not os.path.exists(os.path.join(folder, "meta.json")):
+            raise
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_grain_terms(grain_path: str, rho_w: float, g: float, s: float) -> GrainTerms:
+    """
+    Return the precomputed terms for a grain raster and unit constants, building them
+    on first use. Reused across discharges, runs, sessions and engines.
+    """
+    key = _cache_key(grain_path, rho_w, g, s)
+    if key in _loaded:
+        return _loaded[key]
+    folder = os.path.join(_ROOT, key)
+    if not os.path.exists(os.path.join(folder, "meta.json")):
+        os.makedirs(_ROOT, exist_ok=True)
+        _build(folder, grain_path, rho_w, g, s)
+    terms = GrainTerms(folder, grain_path)
+    _loaded[key] = terms
+    return terms
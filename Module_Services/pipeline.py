@@ -0,0 +1,153 @@
+"""
+Overlapped read / compute / write for the raster engines.
+
+Run serially, an engine reads block N, computes it, writes it, and only then starts
+reading block N+1, so the disk and the CPU take turns being idle. These helpers
+overlap the stages:
+
+    prefetch(items, read)        reader threads load the next blocks while the
+                                 caller computes the current one; results are
+                                 yielded in order
+    BackgroundWriter             one writer thread flushes finished outputs
+    BufferPool                   a fixed set of output buffers (double buffering):
+                                 compute fills one while the writer drains another
+
+Every queue is bounded (config.pipeline_prefetch blocks ahead, one pending write per
+spare buffer), so a slow disk throttles the compute stage instead of filling memory.
+Errors raised in a reader or the writer are re-raised in the calling thread.
+
+arcpy is not thread-safe (geoprocessing runs one arcpy per worker process, see
+raster_alignment), so at most one thread calls it at any time. Callers pass
+`threaded=False` when a stage would call arcpy next to another thread that does; the
+stage then runs inline, in the same order. The engines thread their stages only when
+every input is read without arcpy (raster_io.thread_safe): the readers then slice
+numpy arrays and the writer thread is the only one calling arcpy. numpy releases the
+GIL for most of its work, so the overlap pays off even on one core.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple, TypeVar
+
+import config
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def prefetch(
+    items: Iterable[T], read: Callable[[T], R], depth: int = None, workers: int = 1, threaded: bool = True
+) -> Iterator[Tuple[T, R]]:
+    """
+    Yield (item, read(item)) in order while up to `depth` following items are read in
+    the background by `workers` threads. With depth 0 or without `threaded` the reads
+    happen inline.
+    """
+    depth = config.pipeline_prefetch if depth is None else depth
+    if not config.pipeline_enabled or not threaded or depth <= 0:
+        for item in items:
+            yield item, read(item)
+        return
+    pending = deque()
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ra-read") as pool:
+        try:
+            for item in iterator:
+                pending.append((item, pool.submit(read, item)))
+                if len(pending) > depth:
+                    head, future = pending.popleft()
+                    yield head, future.result()
+            while pending:
+                head, future = pending.popleft()
+                yield head, future.result()
+        finally:
+            # An abandoned consumer must not leave queued reads running.
+            for _, future in pending:
+                future.cancel()
+
+
+def completed(value: R) -> "Future[R]":
+    """A Future that already holds `value`, for work done inline next to pipelined work."""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class BufferPool:
+    """A fixed number of reusable buffer sets; acquire() blocks until one is released."""
+
+    def __init__(self, count: int, factory: Callable[[], T]):
+        self._free = queue.Queue()
+        for _ in range(max(1, count)):
+            self._free.put(factory())
+
+    def acquire(self) -> T:
+        return self._free.get()
+
+    def release(self, buffers: T):
+        self._free.put(buffers)
+
+
+class BackgroundWriter:
+    """
+    Run write jobs in submission order on one thread. At most `depth` jobs wait in the
+    queue; submit() blocks beyond that. Each job returns a Future with its result.
+    Without `threaded` the jobs run inline in submit().
+    """
+
+    _STOP = object()
+
+    def __init__(self, depth: int = 1, threaded: bool = True):
+        self._enabled = config.pipeline_enabled and threaded
+        self._jobs = queue.Queue(maxsize=max(1, depth))
+        self._thread = None
+        if self._enabled:
+            self._thread = threading.Thread(target=self._run, name="ra-write", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is self._STOP:
+                return
+            future, fn, args, kwargs = job
+            # Drop the references to the job's arrays before the caller is notified, so
+            # memory-mapped buffers can be closed and removed as soon as the job is done.
+            job = None
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as exc:
+                fn = args = kwargs = None
+                future.set_exception(exc)
+            else:
+                fn = args = kwargs = None
+                future.set_result(result)
+                result = None
+
+    def submit(self, fn: Callable[..., R], *args, **kwargs) -> "Future[R]":
+        future = Future()
+        if not self._enabled:
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+            return future
+        self._jobs.put((future, fn, args, kwargs))
+        return future
+
+    def close(self):
+        """Wait for queued jobs and stop the thread."""
+        if self._thread is not None:
+            self._jobs.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
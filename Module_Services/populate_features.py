@@ -1,10 +1,32 @@
+import datetime
+import hashlib
+import json
 import os
-from typing import List, Tuple
+import re
+from typing import List, Optional, Tuple
 
 import arcpy
+import numpy as np
 from arcpy.sa import Log10
 import config
 import fGl
+from Module_Services import (
+    autotune,
+    checkpoints,
+    compute_precision,
+    derived_cache,
+    discharge_catalog,
+    grain_terms,
+    pipeline,
+    raster_io,
+    raster_stats,
+    raster_storage,
+    raster_validation,
+    run_log,
+    shear_kernels,
+    storage,
+    wet_index,
+)
 
 class InputError(ValueError):
     """Raised when required rasters are missing or inconsistent."""
@@ -57,7 +79,7 @@ def _split_paths(raw: str) -> List[str]:
 
 
 def _validate_inputs(depth_paths: List[str], vel_paths: List[str], grain_path: str):
-    """Ensure required rasters exist and lists align."""
+    """Ensure required rasters exist, lists align 1:1 and all grids match (headers only)."""
     if not depth_paths or not vel_paths:
         raise InputError("Depth and velocity rasters are required for this operation.")
     if len(depth_paths) != len(vel_paths):
@@ -75,6 +97,9 @@ def _validate_inputs(depth_paths: List[str], vel_paths: List[str], grain_path: s
         raise InputError(f"Missing depth rasters: {', '.join(missing_depth)}")
     if missing_vel:
         raise InputError(f"Missing velocity rasters: {', '.join(missing_vel)}")
+    errors, _ = raster_validation.validate_condition_rasters(depth_paths, vel_paths, grain_path=grain_path)
+    if errors:
+        raise InputError("Misaligned rasters: " + " ".join(errors))
 
 
 def _unit_params(unit: str):
@@ -93,6 +118,12 @@ def _unit_params(unit: str):
     return ft2m, rho_w, n, g, s
 
 
+def unit_constants(unit: str) -> dict:
+    """The unit constants by name (rho_w, g, s, n, ft2m), e.g. for expressions."""
+    ft2m, rho_w, n, g, s = _unit_params((unit or "").lower())
+    return {"ft2m": ft2m, "rho_w": rho_w, "n": n, "g": g, "s": s}
+
+
 def _save_paths_to_db(conn, condition_name: str, column: str, paths: List[str]):
     """Update a condition row with semicolon-separated output paths."""
     cursor = conn.cursor()
@@ -107,6 +138,24 @@ def _save_paths_to_db(conn, condition_name: str, column: str, paths: List[str]):
     cursor.close()
 
 
+def _resolve_subfolder(conn, condition_name: str, column: str, folder_name: str) -> str:
+    """
+    Return the subfolder path stored in `condition.column`, or the one
+    create_output_subfolder would create. Only reads the condition row.
+    """
+    row = storage.Repository(conn).get_condition(condition_name)
+    if row is None:
+        raise ValueError(f"Condition '{condition_name}' not found in database.")
+    if row.get(column):
+        return row[column]
+    if not row.get("condition_output_path"):
+        raise ValueError(
+            f"No output location stored for condition '{condition_name}'. "
+            "Set an output folder in the Condition tab first."
+        )
+    return os.path.join(row["condition_output_path"], folder_name)
+
+
 def _get_or_create_subfolder(conn, condition_name: str, column: str, folder_name: str) -> str:
     """
     Return a subfolder path stored in `condition.column`; create it if missing.
@@ -154,69 +203,483 @@ def create_output_subfolder(conn, condition_name: str, subfolder_name: str, colu
     return target
 
 
-def calculate_bed_shear_stress(condition_name: str, conn):
+# Product key -> output prefix, folder column, folder name, DB column for the output paths.
+PRODUCTS = {
+    "bed_shear": ("tb", "shear_rasters_folder", "shear rasters", "bed_shear_rasters"),
+    "bed_shield": ("ts", "shield_stress_rasters_folder", "shield stress rasters", "bed_shield_rasters"),
+}
+
+
+BACKENDS = ("fused", "sparse", "arcpy")
+
+
+def load_product_context(conn, condition_name: str, product: str) -> dict:
     """
-    Calculate bed shear stress rasters for a condition and store file paths in DB.
+    Fetch, validate and pair the inputs of a product run for a condition.
+
+    Returns a dict with condition_name, product, prefix, paths_column, out_dir, discharges
+    (see discharge_catalog.pair_discharges), grain_path, rho_w, g, s, grid (the
+    RasterGrid shared by all inputs) and dtype (the compute precision, see
+    compute_precision). Read-only: runs that write outputs call ensure_output_dir.
     """
+    prefix, folder_column, folder_name, paths_column = PRODUCTS[product]
     depth_raw, vel_raw, grain_path, unit = _fetch_condition_inputs(conn, condition_name)
-    _, rho_w, _, _, _ = _unit_params(unit)
-    shear_dir = _get_or_create_subfolder(conn, condition_name, "shear_rasters_folder", "shear rasters")
+    _, rho_w, _, g, s_val = _unit_params(unit)
+    out_dir = _resolve_subfolder(conn, condition_name, folder_column, folder_name)
 
     depth_paths = _split_paths(depth_raw)
     vel_paths = _split_paths(vel_raw)
     _validate_inputs(depth_paths, vel_paths, grain_path)
+    try:
+        discharges = discharge_catalog.pair_discharges(depth_paths, vel_paths)
+    except discharge_catalog.CatalogError as exc:
+        raise InputError(str(exc)) from exc
+    return {
+        "condition_name": condition_name,
+        "product": product,
+        "prefix": prefix,
+        "paths_column": paths_column,
+        "out_dir": out_dir,
+        "discharges": discharges,
+        "grain_path": grain_path,
+        "rho_w": rho_w,
+        "g": g,
+        "s": s_val,
+        "grid": raster_io.RasterGrid.from_raster(discharges[0]["depth"]),
+        "dtype": compute_precision.compute_dtype(),
+    }
+
+
+def ensure_output_dir(conn, ctx: dict) -> str:
+    """Create the output folder of a product context and store its path on the condition."""
+    _, folder_column, folder_name, _ = PRODUCTS[ctx["product"]]
+    ctx["out_dir"] = _get_or_create_subfolder(conn, ctx["condition_name"], folder_column, folder_name)
+    return ctx["out_dir"]
+
+
+def load_context_terms(ctx: dict):
+    """Return the precomputed grain terms of a product context (built once per grain raster and unit)."""
+    return grain_terms.load_grain_terms(ctx["grain_path"], ctx["rho_w"], ctx["g"], ctx["s"])
+
+
+def find_discharge(ctx: dict, q_str: str) -> dict:
+    """Return the discharge record of a context with the given Q string."""
+    for record in ctx["discharges"]:
+        if record["q_str"] == q_str:
+            return record
+    raise InputError(f"Discharge '{q_str}' is not part of condition '{ctx['condition_name']}'.")
+
+
+def output_path(ctx: dict, record: dict) -> str:
+    """Return the output raster path of a discharge, e.g. <out_dir>/tb100.tif."""
+    return os.path.join(ctx["out_dir"], ctx["prefix"] + fGl.write_Q_str(record["q_str"]) + ".tif")
+
+
+def _key_params(ctx: dict, storage_mode: str = None) -> dict:
+    params = {
+        "rho_w": ctx["rho_w"],
+        "g": ctx["g"],
+        "s": ctx["s"],
+        "storage_mode": raster_storage.resolve_storage_mode(storage_mode),
+    }
+    dtype = np.dtype(ctx.get("dtype", np.float64))
+    if dtype != np.float64:
+        # float64 keys are left as they were, so existing entries stay valid.
+        params["precision"] = dtype.name
+    return params
+
+
+def derived_cache_key(ctx: dict, record: dict, storage_mode: str = None) -> Optional[str]:
+    """
+    Return the derived_cache key of a discharge's product raster. The key hashes the
+    input contents, so it is only built while the store is enabled (None otherwise).
+    """
+    if not config.derived_cache_enabled:
+        return None
+    inputs = [record["depth"], record["velocity"], ctx["grain_path"]]
+    return derived_cache.derived_key(ctx["product"], inputs, _key_params(ctx, storage_mode))
 
-    grains = arcpy.Raster(grain_path)
-    outputs = []
 
-    for depth_path, vel_path in zip(depth_paths, vel_paths):
-        depth_r = arcpy.Raster(depth_path)
-        vel_r = arcpy.Raster(vel_path)
+def checkpoint_key(ctx: dict, record: dict, storage_mode: str = None) -> str:
+    """
+    Return the checkpoint input key of a discharge: the same parameters as the
+    derived_cache key, with input fingerprints (path, size, mtime) instead of contents.
+    """
+    text = json.dumps(
+        {
+            "product": ctx["product"],
+            "inputs": [fGl.file_fingerprint(p) for p in (record["depth"], record["velocity"], ctx["grain_path"])],
+            "params": _key_params(ctx, storage_mode),
+            "formula_version": grain_terms.FORMULA_VERSION,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
-        q_val = fGl.read_Q_str(os.path.basename(depth_path), prefix="h")
-        tb_name = "tb" + fGl.write_Q_str(q_val) + ".tif"
-        tb_path = os.path.join(shear_dir, tb_name)
 
-        shear_vel = vel_r / (5.75 * Log10(12.2 * depth_r / (2 * 2.2 * grains)))
-        tb = rho_w * (shear_vel ** 2)
+def output_q(path: str) -> float:
+    """Sort key for output rasters: the numeric discharge after the product prefix."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    q = fGl.parse_Q_value(re.sub(r"^[A-Za-z]+", "", stem))
+    return q if q is not None else float("inf")
 
-        arcpy.CopyRaster_management(tb, tb_path)
-        outputs.append(tb_path)
 
-    _save_paths_to_db(conn, condition_name, "bed_shear_rasters", outputs)
-    return outputs
+def record_output_path(conn, condition_name: str, product: str, path: str):
+    """Add one output raster to the condition's path list, kept in ascending Q order."""
+    column = PRODUCTS[product][3]
+    cursor = conn.cursor()
+    cursor.execute(f"ALTER TABLE IF EXISTS condition ADD COLUMN IF NOT EXISTS {column} TEXT;")
+    cursor.execute(f"SELECT {column} FROM condition WHERE condition_name = %s FOR UPDATE;", (condition_name,))
+    row = cursor.fetchone()
+    paths = [p for p in _split_paths(row[0] if row else "") if p != path] + [path]
+    paths.sort(key=output_q)
+    cursor.execute(
+        f"UPDATE condition SET {column} = %s WHERE condition_name = %s;",
+        (";".join(paths), condition_name),
+    )
+    conn.commit()
+    cursor.close()
+
+
+def _read_inputs(record: dict, grid, window, dtype=np.float64):
+    depth = raster_io.read_window(record["depth"], grid, window, dtype)
+    vel = raster_io.read_window(record["velocity"], grid, window, dtype)
+    return depth, vel
+
+
+def _evaluate(terms, rho_w, window, depth, vel, out_tb, out_ts=None, workspace=None):
+    # The grain terms are stored in float64; they follow the precision of the inputs.
+    shear_kernels.log_law(
+        depth,
+        vel,
+        terms.window("log_coef", window).astype(depth.dtype, copy=False),
+        rho_w,
+        out_tb,
+        shields_den=(
+            terms.window("shields_den", window).astype(depth.dtype, copy=False) if out_ts is not None else None
+        ),
+        out_ts=out_ts,
+        workspace=workspace,
+    )
+
 
+def read_inputs(ctx: dict, record: dict, window):
+    """Read the depth and velocity arrays of one window of a discharge, in the context's precision."""
+    return _read_inputs(record, ctx["grid"], window, ctx.get("dtype", np.float64))
 
-def calculate_bed_shield_stress(condition_name: str, conn):
+
+def evaluate_window(ctx: dict, terms, record: dict, window, out_tb, out_ts=None, workspace=None, inputs=None):
     """
-    Calculate bed Shields stress rasters for a condition and store file paths in DB.
-    Depends on bed shear outputs; computes both if needed.
+    Read one window of a discharge and evaluate the fused kernel into `out_tb` (and
+    `out_ts` for Shields). Output arrays are shaped like the window. `inputs` passes
+    (depth, vel) already read, e.g. prefetched with read_inputs.
     """
-    depth_raw, vel_raw, grain_path, unit = _fetch_condition_inputs(conn, condition_name)
-    _, rho_w, _, g, s_val = _unit_params(unit)
-    shield_dir = _get_or_create_subfolder(conn, condition_name, "shield_stress_rasters_folder", "shield stress rasters")
+    depth, vel = inputs if inputs is not None else read_inputs(ctx, record, window)
+    _evaluate(terms, ctx["rho_w"], window, depth, vel, out_tb, out_ts, workspace)
 
-    depth_paths = _split_paths(depth_raw)
-    vel_paths = _split_paths(vel_raw)
-    _validate_inputs(depth_paths, vel_paths, grain_path)
 
-    grains = arcpy.Raster(grain_path)
-    outputs = []
+def _log_law_arcpy(record, terms, rho_w, product, recorder):
+    """Map-algebra evaluation of one discharge; returns an arcpy Raster."""
+    q_val = record["q_str"]
+    with recorder.span("read", q_val) as span:
+        depth_r = arcpy.Raster(record["depth"])
+        vel_r = arcpy.Raster(record["velocity"])
+        span["bytes"] = fGl.file_bytes([record["depth"], record["velocity"]])
+
+    # Map algebra is lazy: most of the evaluation happens in the write stage.
+    with recorder.span("compute", q_val):
+        shear_vel = vel_r / (5.75 * Log10(depth_r * arcpy.Raster(terms.as_raster("log_coef"))))
+        result = rho_w * (shear_vel ** 2)
+        if product == "bed_shield":
+            result = result / arcpy.Raster(terms.as_raster("shields_den"))
+    return result
 
-    for depth_path, vel_path in zip(depth_paths, vel_paths):
-        depth_r = arcpy.Raster(depth_path)
-        vel_r = arcpy.Raster(vel_path)
 
-        q_val = fGl.read_Q_str(os.path.basename(depth_path), prefix="h")
-        ts_name = "ts" + fGl.write_Q_str(q_val) + ".tif"
-        ts_path = os.path.join(shield_dir, ts_name)
+def _log_law_fused(record, terms, grid, rho_w, product, buffers, workspace, recorder, tile_rows,
+                   start_tile=0, on_tile=None):
+    """
+    Strip-wise fused evaluation of one discharge into the preallocated `buffers`;
+    returns the array holding the requested product. Strips before `start_tile` are
+    taken as already computed; `on_tile(n)` is called after the n-th strip. The next
+    strips are read ahead in the background while the current one is computed, unless
+    the reads go through arcpy.
+    """
+    q_val = record["q_str"]
+    out_tb = buffers["tb"]
+    out_ts = buffers.get("ts")
+
+    def read(item):
+        with recorder.span("read", q_val) as span:
+            inputs = _read_inputs(record, grid, item[1], out_tb.dtype)
+            span["bytes"] = inputs[0].nbytes + inputs[1].nbytes
+        return inputs
+
+    windows = [
+        (index, window)
+        for index, window in enumerate(raster_io.iter_windows(grid.rows, grid.cols, tile_rows))
+        if index >= start_tile
+    ]
+    threaded = raster_io.thread_safe(record["depth"]) and raster_io.thread_safe(record["velocity"])
+    for (index, window), (depth, vel) in pipeline.prefetch(windows, read, threaded=threaded):
+        row_off, _, nrows, _ = window
+        with recorder.span("compute", q_val):
+            _evaluate(
+                terms,
+                rho_w,
+                window,
+                depth,
+                vel,
+                out_tb[row_off:row_off + nrows],
+                out_ts[row_off:row_off + nrows] if out_ts is not None else None,
+                workspace,
+            )
+        if on_tile is not None:
+            on_tile(index + 1)
+    return out_ts if product == "bed_shield" else out_tb
+
+
+def _log_law_sparse(record, terms, grid, rho_w, product, buffers, recorder):
+    """
+    Evaluate one discharge on its wet cells only: the inputs are packed with the
+    discharge's WetIndex, the kernel runs on the 1-D arrays and the product is
+    scattered back into its buffer, NaN elsewhere. Returns that buffer.
+    """
+    q_val = record["q_str"]
+    window = (0, 0, grid.rows, grid.cols)
+    dtype = buffers["tb"].dtype
+    with recorder.span("read", q_val) as span:
+        depth = raster_io.read_window(record["depth"], grid, window, dtype)
+        index = wet_index.load_wet_index(record["depth"], grid, depth=depth)
+        depth = index.gather(depth)
+        vel = index.gather(raster_io.read_window(record["velocity"], grid, window, dtype))
+        log_coef = index.gather(terms.log_coef).astype(dtype, copy=False)
+        shields_den = index.gather(terms.shields_den).astype(dtype, copy=False) if product == "bed_shield" else None
+        span["bytes"] = 2 * grid.rows * grid.cols * dtype.itemsize
+    with recorder.span("compute", q_val):
+        packed_tb = np.empty(index.count, dtype=dtype)
+        packed_ts = np.empty(index.count, dtype=dtype) if shields_den is not None else None
+        shear_kernels.log_law(depth, vel, log_coef, rho_w, packed_tb, shields_den=shields_den, out_ts=packed_ts)
+        if product == "bed_shield":
+            return index.scatter(packed_ts, buffers["ts"])
+        return index.scatter(packed_tb, buffers["tb"])
+
+
+def _output_buffers(grid, product: str, dtype=np.float64) -> dict:
+    """Full-size output arrays of one discharge."""
+    buffers = {"tb": np.empty(grid.shape, dtype=dtype)}
+    if product == "bed_shield":
+        buffers["ts"] = np.empty(grid.shape, dtype=dtype)
+    return buffers
+
+
+def _write_output(result, out_path, reference, storage_mode, cache_key, info, recorder) -> dict:
+    """
+    Save a discharge's product raster (an arcpy Raster when `reference` is None),
+    store it in the derived cache and return its statistics. Runs on the writer thread
+    for the array backends.
+    """
+    with recorder.span("write", info["q_str"]) as span:
+        accumulator = raster_stats.RasterStats()
+        if reference is None:
+            raster_storage.save_derived_raster(result, out_path, storage_mode, accumulator)
+        else:
+            raster_storage.save_derived_array(result, out_path, reference, storage_mode, accumulator)
+        span["bytes"] = fGl.file_bytes([out_path])
+        stats = accumulator.as_dict()
+        derived_cache.store(cache_key, out_path, dict(info, stats=stats))
+    return stats
+
+
+def _fused_discharge(ctx, record, terms, buffers, workspace, recorder, plan, checkpoint, input_key, out_path):
+    """
+    Evaluate one discharge with the fused kernel. With config.checkpoint_tiles the
+    product is computed into a memory-mapped partial buffer, whose strip progress is
+    checkpointed, so an interrupted discharge resumes from its last recorded strip.
+    """
+    grid = ctx["grid"]
+    q_val = record["q_str"]
+    product_key = "ts" if ctx["product"] == "bed_shield" else "tb"
+    if not config.checkpoint_tiles:
+        checkpoint.begin(q_val, input_key, out_path)
+        return _log_law_fused(record, terms, grid, ctx["rho_w"], ctx["product"], buffers, workspace, recorder,
+                              plan.tile_rows)
+
+    partial = checkpoints.partial_path(out_path)
+    start_tile, tile_rows = checkpoint.resume_point(q_val, input_key, out_path, plan.tile_rows)
+    tile_count = -(-grid.rows // tile_rows)
+    buffer = np.lib.format.open_memmap(partial, mode="r+" if start_tile else "w+", dtype=ctx["dtype"], shape=grid.shape)
+    checkpoint.begin(q_val, input_key, out_path, tile_rows, tile_count, start_tile)
+    run_buffers = dict(buffers, **{product_key: buffer})
+    _log_law_fused(
+        record, terms, grid, ctx["rho_w"], ctx["product"], run_buffers, workspace, recorder, tile_rows,
+        start_tile=start_tile, on_tile=lambda n: checkpoint.tile_done(q_val, n, buffer.flush),
+    )
+    return buffer
 
-        shear_vel = vel_r / (5.75 * Log10(12.2 * depth_r / (2 * 2.2 * grains)))
-        tb = rho_w * (shear_vel ** 2)
-        ts = tb / (rho_w * g * (s_val - 1) * grains)
 
-        arcpy.CopyRaster_management(ts, ts_path)
-        outputs.append(ts_path)
+def _strip_seconds(spans: List[dict]) -> float:
+    """Wall time covered by the read and compute spans of one discharge (prefetched reads overlap the compute)."""
+    spans = [s for s in spans if s["stage"] in ("read", "compute")]
+    if not spans:
+        return 0.0
+    start = min(s["started_at"] for s in spans)
+    end = max(s["started_at"] + datetime.timedelta(seconds=s["wall_s"]) for s in spans)
+    return (end - start).total_seconds()
 
-    _save_paths_to_db(conn, condition_name, "bed_shield_rasters", outputs)
+
+def _run_log_law_product(
+    condition_name: str, conn, product: str, storage_mode: str = None, backend: str = None, resume: bool = False,
+    precision: str = None,
+) -> List[str]:
+    """
+    Evaluate the log-law shear chain for every discharge (ascending Q) and write `product`
+    rasters. Every stage of every discharge is timed into run_log. Progress is
+    checkpointed per discharge (and per strip for the fused backend); with `resume`,
+    work finished by an earlier, interrupted run is kept. `precision` ("float64" or
+    "float32") applies to the fused and sparse backends.
+    """
+    backend = (backend or config.populate_backend).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Use one of: {', '.join(BACKENDS)}.")
+    recorder = run_log.RunRecorder(conn, condition_name, product)
+    try:
+        with recorder.span("db"):
+            ctx = load_product_context(conn, condition_name, product)
+            ensure_output_dir(conn, ctx)
+            if backend == "arcpy":
+                ctx["dtype"] = np.dtype(np.float64)
+            else:
+                ctx["dtype"] = compute_precision.compute_dtype(precision)
+            checkpoint = checkpoints.Checkpoint(conn, condition_name, product, recorder.run_id, resume)
+        with recorder.span("read"):
+            terms = load_context_terms(ctx)
+            # Output buffers are allocated once (one set per pipeline stage) and reused.
+            grid = ctx["grid"]
+            if backend == "fused":
+                plan = autotune.plan_for_grid(
+                    grid, "populate", len(ctx["discharges"]), ctx["discharges"][0]["depth"], ctx["dtype"]
+                )
+                workspace = shear_kernels.KernelWorkspace((plan.tile_rows, grid.cols), ctx["dtype"])
+
+        outputs = []
+        strip_seconds = []  # read/compute time of each discharge the fused backend evaluated
+        # fused/sparse: writes run on a background thread while the next discharge is
+        # computed into the other set of output buffers. Writes call arcpy, so they only
+        # leave this thread when the inputs are read without it (see pipeline).
+        io_threads = backend != "arcpy" and all(
+            raster_io.thread_safe(r[kind]) for r in ctx["discharges"] for kind in ("depth", "velocity")
+        )
+        writer = pipeline.BackgroundWriter(threaded=io_threads)
+        pool = None
+        if backend != "arcpy":
+            pool = pipeline.BufferPool(
+                2 if config.pipeline_enabled and io_threads else 1, lambda: _output_buffers(grid, product, ctx["dtype"])
+            )
+        pending = []
+
+        def record_done(entry):
+            future, q_val, input_key, out_path, used = entry
+            try:
+                stats = future.result()
+            finally:
+                if used is not None:
+                    pool.release(used)
+            # The writer has dropped its reference to a memory-mapped strip buffer by now.
+            checkpoints.remove_partial(out_path)
+            # Progress is recorded as it happens: the path, its statistics and the checkpoint.
+            with recorder.span("db", q_val):
+                record_output_path(conn, condition_name, product, out_path)
+                raster_stats.record_stats(conn, condition_name, product, [(out_path, q_val, stats)])
+                checkpoint.done(q_val, input_key, out_path)
+
+        try:
+            for record in ctx["discharges"]:
+                q_val = record["q_str"]
+                out_path = output_path(ctx, record)
+                with recorder.span("read", q_val):
+                    input_key = checkpoint_key(ctx, record, storage_mode)
+                if checkpoint.completed(q_val, input_key, out_path):
+                    outputs.append(out_path)
+                    continue
+                with recorder.span("read", q_val):
+                    cache_key = derived_cache_key(ctx, record, storage_mode)
+                with recorder.span("write", q_val) as span:
+                    cached = derived_cache.fetch(cache_key, out_path)
+                    span["bytes"] = 0
+                if cached:
+                    # Identical inputs were already evaluated (possibly for another condition).
+                    stats = derived_cache.entry_info(cache_key).get("stats")
+                    pending.append((pipeline.completed(stats), q_val, input_key, out_path, None))
+                else:
+                    info = {"condition_name": condition_name, "q_str": q_val}
+                    if backend == "arcpy":
+                        checkpoint.begin(q_val, input_key, out_path)
+                        result = _log_law_arcpy(record, terms, ctx["rho_w"], product, recorder)
+                        stats = _write_output(result, out_path, None, storage_mode, cache_key, info, recorder)
+                        result = None
+                        pending.append((pipeline.completed(stats), q_val, input_key, out_path, None))
+                    else:
+                        buffers = pool.acquire()
+                        if backend == "sparse":
+                            checkpoint.begin(q_val, input_key, out_path)
+                            result = _log_law_sparse(record, terms, grid, ctx["rho_w"], product, buffers, recorder)
+                        else:
+                            first_span = len(recorder.spans)
+                            result = _fused_discharge(
+                                ctx, record, terms, buffers, workspace, recorder, plan, checkpoint, input_key,
+                                out_path,
+                            )
+                            strip_seconds.append(_strip_seconds(recorder.spans[first_span:]))
+                        future = writer.submit(
+                            _write_output, result, out_path, record["depth"], storage_mode, cache_key, info, recorder
+                        )
+                        result = None
+                        pending.append((future, q_val, input_key, out_path, buffers))
+                outputs.append(out_path)
+                # Keep at most one write in flight: wait for the previous discharge.
+                while len(pending) > 1:
+                    record_done(pending.pop(0))
+            while pending:
+                record_done(pending.pop(0))
+        finally:
+            writer.close()
+
+        with recorder.span("db"):
+            _save_paths_to_db(conn, condition_name, ctx["paths_column"], outputs)
+    except Exception:
+        recorder.finish("failed")
+        raise
+    recorder.finish("ok")
+    # Discharges served by the derived cache or resumed from strip checkpoints say nothing about strip height.
+    if backend == "fused" and not resume and strip_seconds:
+        autotune.record_result(plan, grid.rows * grid.cols * len(strip_seconds), sum(strip_seconds))
     return outputs
+
+
+def resume_product(condition_name: str, conn, product: str, storage_mode: str = None, backend: str = None,
+                   precision: str = None):
+    """Resume an interrupted run of `product`, keeping the discharges (and strips) it finished."""
+    return _run_log_law_product(condition_name, conn, product, storage_mode, backend, resume=True, precision=precision)
+
+
+def calculate_bed_shear_stress(condition_name: str, conn, storage_mode: str = None, backend: str = None,
+                               precision: str = None):
+    """
+    Calculate bed shear stress rasters for a condition and store file paths in DB.
+    `storage_mode` selects the raster_storage mode (defaults to config.derived_raster_storage),
+    `backend` the evaluation backend (defaults to config.populate_backend),
+    `precision` the compute precision (defaults to config.compute_precision).
+    """
+    return _run_log_law_product(condition_name, conn, "bed_shear", storage_mode, backend, precision=precision)
+
+
+def calculate_bed_shield_stress(condition_name: str, conn, storage_mode: str = None, backend: str = None,
+                                precision: str = None):
+    """
+    Calculate bed Shields stress rasters for a condition and store file paths in DB.
+    Depends on bed shear outputs; computes both if needed.
+    `storage_mode` selects the raster_storage mode (defaults to config.derived_raster_storage),
+    `backend` the evaluation backend (defaults to config.populate_backend),
+    `precision` the compute precision (defaults to config.compute_precision).
+    """
+    return _run_log_law_product(condition_name, conn, "bed_shield", storage_mode, backend, precision=precision)
@@ -0,0 +1,220 @@
+"""
+Ingest-time alignment of condition inputs onto the DEM grid.
+
+populate combines depth, velocity and grain cell by cell, so every input must share the
+CRS, cell size and extent of the DEM (or of the grain raster without a DEM). When a
+condition is created or imported, the inputs that do not match are reprojected,
+resampled and clipped onto that grid in worker processes (arcpy ApplyEnvironment with
+the reference as snap raster, extent, cell size and output coordinate system). Rasters
+that already match are used as they are.
+
+Aligned copies are cached in <dir2cache>/aligned/<key>/<source name>.tif, keyed by
+the source file fingerprint, the target grid and the resampling method. The condition
+row then points at the copies, so later runs read pre-aligned data directly, and
+creating another condition from the same sources reuses them. A source.json next to
+each copy records where it came from. The source file name is kept, so discharges are
+still read from names such as h100.tif.
+
+    python -m Module_Services.raster_alignment align --reference dem.tif h100.tif u100.tif [--workers 4]
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Tuple
+
+import config
+import fGl
+
+_ALIGNED_DIR = os.path.join(config.dir2cache, "aligned")
+_KEY_VERSION = "v1"
+
+
+def grid_signature(header: dict) -> str:
+    """Identity of a target grid: CRS, origin, cell size and shape (from raster_validation headers)."""
+    return "|".join(
+        [str(header["sr_code"] or header["sr_name"])]
+        + [f"{header[k]:.9g}" for k in ("xmin", "ymax", "cell_w", "cell_h")]
+        + [str(header["rows"]), str(header["cols"])]
+    )
+
+
+def aligned_key(source: str, reference_header: dict, resampling: str) -> str:
+    text = "|".join([fGl.file_fingerprint(source), grid_signature(reference_header), resampling, _KEY_VERSION])
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def aligned_path(source: str, key: str) -> str:
+    name = os.path.splitext(os.path.basename(source.rstrip("/\\")))[0]
+    return os.path.join(_ALIGNED_DIR, key, name + ".tif")
+
+
+def _align_job(source: str, reference: str, out_path: str, resampling: str, info: dict) -> str:
+    """Write the aligned copy of `source` (runs in a worker process)."""
+    import arcpy
+
+    folder = os.path.dirname(out_path)
+    partial = f"{folder}.partial{os.getpid()}"
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    arcpy.CheckOutExtension("Spatial")
+    ref = arcpy.Raster(reference)
+    with arcpy.EnvManager(
+        outputCoordinateSystem=ref.spatialReference, snapRaster=reference, extent=ref.extent, cellSize=reference,
+    ):
+        aligned = arcpy.sa.ApplyEnvironment(source, resampling)
+        aligned.save(os.path.join(partial, os.path.basename(out_path)))
+    with open(os.path.join(partial, "source.json"), "w", encoding="utf-8") as fh:
+        json.dump(info, fh)
+    try:
+        # The whole folder appears at once; a concurrent writer of the same key may have won.
+        os.replace(partial, folder)
+    except OSError:
+        if not os.path.exists(out_path):
+            raise
+        shutil.rmtree(partial, ignore_errors=True)
+    return out_path
+
+
+def align_rasters(
+    sources: List[Tuple[str, str]], reference: str, reference_header: dict, max_workers: int = None,
+    progress: Callable[[int, int], None] = None, isolated: bool = False,
+) -> Tuple[Dict[str, str], int]:
+    """
+    Align [(source, resampling)] onto the grid of `reference`. Returns
+    ({source: aligned path}, number taken from the cache).
+
+    `progress(done, total)` is called after each written copy. With `isolated`, even a
+    single job runs in a worker process, so the calling thread never touches arcpy.
+    """
+    os.makedirs(_ALIGNED_DIR, exist_ok=True)
+    result, jobs = {}, []
+    for source, resampling in dict.fromkeys(sources):
+        key = aligned_key(source, reference_header, resampling)
+        out_path = aligned_path(source, key)
+        result[source] = out_path
+        if not os.path.exists(out_path):
+            info = {
+                "source": os.path.abspath(source),
+                "fingerprint": fGl.file_fingerprint(source),
+                "reference": os.path.abspath(reference),
+                "grid": grid_signature(reference_header),
+                "resampling": resampling,
+                "created": time.time(),
+            }
+            jobs.append((source, reference, out_path, resampling, info))
+    workers = min(len(jobs), max_workers or config.alignment_workers or os.cpu_count() or 1)
+    if workers <= 1 and not (isolated and jobs):
+        for done, job in enumerate(jobs, 1):
+            _align_job(*job)
+            if progress is not None:
+                progress(done, len(jobs))
+    else:
+        # Geoprocessing is not thread-safe: one arcpy per worker process.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_align_job, *job) for job in jobs]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                if progress is not None:
+                    progress(done, len(jobs))
+    return result, len(result) - len(jobs)
+
+
+def plan_alignment(
+    depth_paths: List[str], vel_paths: List[str], dem_path: str = None, grain_path: str = None,
+) -> Tuple[str, dict, List[Tuple[str, str]]]:
+    """
+    Find the depth, velocity and grain rasters that are off the DEM grid (the grain grid
+    without a DEM). Reads headers only; missing or unreadable rasters are left for
+    raster_validation to report.
+
+    Returns (reference, reference header, [(source, resampling)]); the list is empty
+    when nothing needs aligning.
+    """
+    from Module_Services import raster_validation
+
+    reference = dem_path or grain_path
+    labelled = [("depth", p) for p in depth_paths] + [("velocity", p) for p in vel_paths]
+    if grain_path and reference != grain_path:
+        labelled.append(("grain", grain_path))
+    if not reference or not labelled or not os.path.exists(reference):
+        return reference, None, []
+    existing = [p for _, p in labelled if os.path.exists(p)]
+    headers = raster_validation.read_headers(existing + [reference])
+    ref_header = headers.get(reference)
+    if ref_header is None:
+        return reference, None, []
+    methods = config.alignment_resampling
+    todo = [
+        (p, methods.get(label, "BILINEAR"))
+        for label, p in labelled
+        if p in headers and not raster_validation.is_aligned(headers[p], ref_header)
+    ]
+    return reference, ref_header, todo
+
+
+def replace_aligned(
+    depth_paths: List[str], vel_paths: List[str], grain_path: str, aligned: Dict[str, str]
+) -> Tuple[List[str], List[str], str]:
+    """Substitute aligned copies ({source: copy}) into the inputs of a condition."""
+    return (
+        [aligned.get(p, p) for p in depth_paths],
+        [aligned.get(p, p) for p in vel_paths],
+        aligned.get(grain_path, grain_path) if grain_path else grain_path,
+    )
+
+
+def alignment_note(aligned: Dict[str, str], cached: int, on_dem: bool, seconds: float) -> str:
+    return (
+        f"Aligned {len(aligned)} raster(s) onto the {'DEM' if on_dem else 'grain size'} grid "
+        f"({cached} from cache) in {seconds:.1f} s."
+    )
+
+
+def align_condition_inputs(
+    depth_paths: List[str], vel_paths: List[str], dem_path: str = None, grain_path: str = None,
+    max_workers: int = None,
+) -> Tuple[List[str], List[str], str, List[str]]:
+    """
+    Replace misaligned depth, velocity and grain rasters by aligned copies on the DEM
+    grid (the grain grid without a DEM), see plan_alignment.
+
+    Returns (depth_paths, vel_paths, grain_path, notes).
+    """
+    reference, ref_header, todo = plan_alignment(depth_paths, vel_paths, dem_path, grain_path)
+    if not todo:
+        return depth_paths, vel_paths, grain_path, []
+    started = time.perf_counter()
+    aligned, cached = align_rasters(todo, reference, ref_header, max_workers)
+    notes = [alignment_note(aligned, cached, reference == dem_path, time.perf_counter() - started)]
+    return replace_aligned(depth_paths, vel_paths, grain_path, aligned) + (notes,)
+
+
+def main(argv=None):
+    from Module_Services import raster_validation
+
+    parser = argparse.ArgumentParser(description="Align rasters onto the grid of a reference raster.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    al = sub.add_parser("align")
+    al.add_argument("--reference", required=True, help="Raster whose grid is the target (usually the DEM).")
+    al.add_argument("--resampling", default="BILINEAR", choices=("NEAREST", "BILINEAR", "CUBIC"))
+    al.add_argument("--workers", type=int, default=None)
+    al.add_argument("rasters", nargs="+")
+    args = parser.parse_args(argv)
+
+    headers = raster_validation.read_headers(args.rasters + [args.reference])
+    ref_header = headers[args.reference]
+    todo = [(p, args.resampling) for p in args.rasters
+            if p in headers and not raster_validation.is_aligned(headers[p], ref_header)]
+    aligned, cached = align_rasters(todo, args.reference, ref_header, args.workers)
+    for source in args.rasters:
+        print(f"{source} -> {aligned.get(source, source)}")
+    print(f"{len(aligned)} aligned ({cached} from cache), {len(args.rasters) - len(aligned)} already on the grid.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Windowed numpy access to rasters.
+
+A window is (row_off, col_off, nrows, ncols) with row 0 at the top of the raster, the
+same layout as the numpy arrays it produces. NoData is returned as NaN, and derived
+rasters stored as scaled integers (raster_storage) are returned in physical units.
+ESRI ASCII grids (.asc) are read from their binary cache (see ascii_grid) instead of
+being parsed by arcpy on every read.
+"""
+import os
+from typing import Iterator, Tuple
+
+import arcpy
+import numpy as np
+
+from Module_Services import ascii_grid, raster_storage
+
+Window = Tuple[int, int, int, int]
+
+
+class RasterGrid:
+    """Geometry of a raster: upper-left origin, cell size, shape and spatial reference."""
+
+    def __init__(self, xmin, ymax, cell_w, cell_h, rows, cols, spatial_reference=None):
+        self.xmin = xmin
+        self.ymax = ymax
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+        self.rows = rows
+        self.cols = cols
+        self.spatial_reference = spatial_reference
+
+    @classmethod
+    def from_raster(cls, raster):
+        """Build the grid of a raster path or arcpy Raster."""
+        if ascii_grid.is_ascii_grid(raster):
+            h = ascii_grid.read_header(raster)
+            prj = os.path.splitext(raster)[0] + ".prj"
+            sr = arcpy.SpatialReference(prj) if os.path.exists(prj) else None
+            return cls(h["xmin"], h["ymax"], h["cell_w"], h["cell_h"], h["rows"], h["cols"], sr)
+        r = raster if isinstance(raster, arcpy.Raster) else arcpy.Raster(raster)
+        ext = r.extent
+        return cls(ext.XMin, ext.YMax, r.meanCellWidth, r.meanCellHeight, r.height, r.width, r.spatialReference)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.rows, self.cols
+
+    def window_lower_left(self, window: Window):
+        """Return the lower-left corner (map units) of a window as an arcpy Point."""
+        row_off, col_off, nrows, _ = window
+        return arcpy.Point(self.xmin + col_off * self.cell_w, self.ymax - (row_off + nrows) * self.cell_h)
+
+
+def thread_safe(raster) -> bool:
+    """
+    True when reads of `raster` do not call arcpy (ESRI ASCII grids, sliced from their
+    binary cache), so they may run on a worker thread. arcpy is not thread-safe.
+    """
+    return ascii_grid.is_ascii_grid(raster)
+
+
+def iter_windows(rows: int, cols: int, tile_rows: int, tile_cols: int = None) -> Iterator[Window]:
+    """
+    Yield windows covering a rows x cols grid. Without `tile_cols` the windows are
+    full-width strips, whose slices of a C-ordered array are contiguous.
+    """
+    tile_rows = max(1, int(tile_rows))
+    tile_cols = max(1, int(tile_cols or cols))
+    for row_off in range(0, rows, tile_rows):
+        nrows = min(tile_rows, rows - row_off)
+        for col_off in range(0, cols, tile_cols):
+            yield row_off, col_off, nrows, min(tile_cols, cols - col_off)
+
+
+def read_window(raster, grid: RasterGrid, window: Window, dtype=np.float64) -> np.ndarray:
+    """
+    Read a window of a raster (path or arcpy Raster) as a float array with NaN for NoData.
+    Quantized rasters given by path are decoded with the scale and offset of their
+    .quant.json sidecar.
+    """
+    if ascii_grid.is_ascii_grid(raster):
+        return ascii_grid.read_window(raster, grid, window, dtype)
+    meta = raster_storage.read_quantization(raster) if isinstance(raster, str) else None
+    r = raster if isinstance(raster, arcpy.Raster) else arcpy.Raster(raster)
+    _, _, nrows, ncols = window
+    lower_left = grid.window_lower_left(window)
+    if not r.isInteger:
+        return arcpy.RasterToNumPyArray(r, lower_left, ncols, nrows, nodata_to_value=np.nan).astype(dtype, copy=False)
+    nodata = meta["nodata"] if meta is not None else r.noDataValue
+    if nodata is None:
+        return arcpy.RasterToNumPyArray(r, lower_left, ncols, nrows).astype(dtype)
+    array = arcpy.RasterToNumPyArray(r, lower_left, ncols, nrows, nodata_to_value=nodata).astype(dtype)
+    array[array == nodata] = np.nan
+    if meta is not None:
+        array *= meta["scale"]
+        array += meta["offset"]
+    return array
@@ -0,0 +1,174 @@
+"""
+Raster statistics accumulated while outputs are written.
+
+A `RasterStats` is updated with every chunk a writer already holds in memory (see
+raster_storage.save_derived_array). It keeps the count, min, max, mean and variance
+(merged chunk by chunk with Chan's formula), valid and wet (value > 0) pixel counts,
+and a histogram on fixed log-spaced bins. The fixed bins make histograms from
+different rasters, runs and conditions directly comparable.
+
+Statistics are stored in the `raster_stats` table next to the output path. QA
+reports, the View Database page and thresholds can therefore query them without
+opening raster files.
+"""
+import math
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from Database.raster_stats_table import RASTER_STATS_TABLE_SQL
+
+# Upper bin edges: (-inf, 0], (0, 1e-6], ... four bins per decade ..., (1e5.75, 1e6], (1e6, inf)
+HISTOGRAM_EDGES = np.concatenate(([0.0], np.logspace(-6, 6, 49)))
+
+
+class RasterStats:
+    """Streaming statistics of one raster."""
+
+    def __init__(self):
+        self.total = 0
+        self.valid = 0
+        self.wet = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.histogram = np.zeros(HISTOGRAM_EDGES.size + 1, dtype=np.int64)
+
+    def update(self, array: np.ndarray, valid: np.ndarray = None):
+        """Add a chunk; `valid` may pass a precomputed finite mask."""
+        array = np.asarray(array)
+        self.total += array.size
+        values = array[np.isfinite(array) if valid is None else valid]
+        n = values.size
+        if n == 0:
+            return
+        self.wet += int(np.count_nonzero(values > 0))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        # Accumulate in float64 whatever the compute precision of the chunk.
+        chunk_mean = float(values.mean(dtype=np.float64))
+        chunk_m2 = float(np.square(np.subtract(values, chunk_mean, dtype=np.float64)).sum())
+        total = self.valid + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += chunk_m2 + delta * delta * self.valid * n / total
+        self.valid = total
+        self.histogram += np.bincount(
+            np.searchsorted(HISTOGRAM_EDGES, values, side="left"), minlength=self.histogram.size
+        )
+
+    @property
+    def std(self) -> Optional[float]:
+        return math.sqrt(self._m2 / self.valid) if self.valid else None
+
+    def as_dict(self) -> dict:
+        return {
+            "total_count": self.total,
+            "valid_count": self.valid,
+            "wet_count": self.wet,
+            "min": self.min if self.valid else None,
+            "max": self.max if self.valid else None,
+            "mean": self.mean if self.valid else None,
+            "std": self.std,
+            "histogram": self.histogram.tolist(),
+        }
+
+
+def ensure_raster_stats_table(conn):
+    cur = conn.cursor()
+    cur.execute(RASTER_STATS_TABLE_SQL)
+    conn.commit()
+    cur.close()
+
+
+def record_stats(conn, condition_name: str, product: str, entries: Iterable[Tuple[str, str, dict]]):
+    """
+    Upsert statistics for written rasters in one batch and commit.
+    `entries` holds (raster_path, q_str, stats) with stats as returned by RasterStats.as_dict.
+    """
+    rows = [
+        (
+            path,
+            condition_name,
+            product,
+            q_str,
+            stats["total_count"],
+            stats["valid_count"],
+            stats["wet_count"],
+            stats["min"],
+            stats["max"],
+            stats["mean"],
+            stats["std"],
+            stats["histogram"],
+            HISTOGRAM_EDGES.tolist(),
+        )
+        for path, q_str, stats in entries
+        if stats
+    ]
+    if not rows:
+        return
+    cur = conn.cursor()
+    cur.execute(RASTER_STATS_TABLE_SQL)
+    cur.executemany(
+        """
+        INSERT INTO raster_stats (
+            raster_path, condition_name, product, q_str, total_count, valid_count, wet_count,
+            min_value, max_value, mean_value, std_value, histogram, histogram_edges
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (raster_path) DO UPDATE SET
+            condition_name = EXCLUDED.condition_name,
+            product = EXCLUDED.product,
+            q_str = EXCLUDED.q_str,
+            total_count = EXCLUDED.total_count,
+            valid_count = EXCLUDED.valid_count,
+            wet_count = EXCLUDED.wet_count,
+            min_value = EXCLUDED.min_value,
+            max_value = EXCLUDED.max_value,
+            mean_value = EXCLUDED.mean_value,
+            std_value = EXCLUDED.std_value,
+            histogram = EXCLUDED.histogram,
+            histogram_edges = EXCLUDED.histogram_edges,
+            computed_at = NOW();
+        """,
+        rows,
+    )
+    conn.commit()
+    cur.close()
+
+
+def condition_stats(conn, condition_name: str, product: str = None) -> List[dict]:
+    """Return the stored statistics of a condition's outputs, ordered by product and path."""
+    ensure_raster_stats_table(conn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT raster_path, product, q_str, total_count, valid_count, wet_count,
+               min_value, max_value, mean_value, std_value, histogram
+        FROM raster_stats
+        WHERE condition_name = %s AND (%s IS NULL OR product = %s)
+        ORDER BY product, raster_path;
+        """,
+        (condition_name, product, product),
+    )
+    fields = [d[0] for d in cur.description]
+    rows = [dict(zip(fields, row)) for row in cur.fetchall()]
+    cur.close()
+    return rows
+
+
+def format_condition_stats(rows: List[dict]) -> str:
+    """Plain-text table of condition_stats rows for the GUI and reports."""
+    if not rows:
+        return "No output statistics recorded."
+    lines = []
+    for row in rows:
+        if row["valid_count"]:
+            lines.append(
+                f"{row['product']} Q{row['q_str']}: min {row['min_value']:.4g}, max {row['max_value']:.4g}, "
+                f"mean {row['mean_value']:.4g}, std {row['std_value']:.4g}, "
+                f"wet {row['wet_count']}/{row['valid_count']} valid of {row['total_count']}"
+            )
+        else:
+            lines.append(f"{row['product']} Q{row['q_str']}: no valid pixels ({row['total_count']} cells)")
+    return "\n".join(lines)
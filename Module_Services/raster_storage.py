@@ -0,0 +1,324 @@
+"""
+Storage modes for derived rasters (bed shear, Shields, ...).
+
+"full" writes map-algebra results unchanged. The compact modes drop precision the
+derived products do not carry anyway:
+
+    float32  single precision, relative error <= 2**-24 (about 6e-8)
+    int16    value = stored * scale + offset, absolute error <= scale / 2
+    uint16   same as int16 with an unsigned code range
+
+Scale, offset and the maximum error are recorded in a "<raster>.quant.json" sidecar.
+Read derived rasters through `open_derived_raster` / `read_derived_array` or
+raster_io.read_window; they de-quantize transparently and behave like plain reads for
+the other modes.
+
+Rasters are written to a temporary sibling and renamed into place, so an
+interrupted write never leaves a truncated output under the final name. StripWriter
+writes a raster strip by strip, for engines that never hold the whole grid.
+"""
+import glob
+import json
+import os
+import platform
+import re
+import shutil
+
+import arcpy
+import numpy as np
+
+import config
+import fGl
+
+STORAGE_MODES = ("full", "float32", "int16", "uint16")
+
+# NoData written for float outputs (NaN is not a reliable NoData marker in arcpy).
+FLOAT_NODATA = float(np.finfo(np.float32).min)
+
+# dtype, lowest code, highest code, nodata code
+_INT_LAYOUT = {
+    "int16": (np.int16, -32767, 32767, -32768),
+    "uint16": (np.uint16, 0, 65534, 65535),
+}
+
+
+def resolve_storage_mode(mode: str = None) -> str:
+    """Return a validated storage mode, falling back to config.derived_raster_storage."""
+    mode = (mode or config.derived_raster_storage or "full").strip().lower()
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode '{mode}'. Use one of: {', '.join(STORAGE_MODES)}.")
+    return mode
+
+
+def sidecar_path(raster_path: str) -> str:
+    """Return the path of the quantization sidecar for a raster."""
+    return raster_path + ".quant.json"
+
+
+def quantization_params(vmin: float, vmax: float, mode: str):
+    """
+    Return (scale, offset, max_abs_error) mapping [vmin, vmax] onto the code range of `mode`.
+    """
+    _, lo, hi, _ = _INT_LAYOUT[mode]
+    span = float(vmax) - float(vmin)
+    if span <= 0:
+        return 1.0, float(vmin) - lo, 0.0
+    scale = span / (hi - lo)
+    offset = float(vmin) - lo * scale
+    return scale, offset, scale / 2.0
+
+
+def read_quantization(raster_path: str):
+    """Return the sidecar metadata of a quantized raster, or None for unscaled rasters."""
+    meta_path = sidecar_path(raster_path)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _write_sidecar(raster_path: str, meta):
+    meta_path = sidecar_path(raster_path)
+    if meta is None:
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        return
+    with open(meta_path, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, indent=2)
+
+
+def _companions(path: str):
+    """Files written next to a raster that share its name (.aux.xml, .ovr, .quant.json, ...)."""
+    folder, name = os.path.split(path)
+    folder = folder or "."
+    return [
+        os.path.join(folder, f)
+        for f in os.listdir(folder)
+        if f.startswith(name + ".") and os.path.isfile(os.path.join(folder, f))
+    ]
+
+
+def _temp_path(path: str) -> str:
+    """
+    Temporary sibling of `path` (same folder, so the final rename is atomic), named after
+    this host and process. Leftovers of interrupted writes of the same raster are removed
+    when the process that wrote them is gone; writes in progress elsewhere are left alone.
+    """
+    folder, name = os.path.split(path)
+    host = re.sub(r"[^0-9A-Za-z]", "", platform.node()) or "host"
+    pattern = re.compile(rf"_tmp{host}-(\d+)_{re.escape(name)}$")
+    for stale in glob.glob(os.path.join(glob.escape(folder), f"_tmp{host}-*_{glob.escape(name)}")):
+        match = pattern.match(os.path.basename(stale))
+        if match is None or (int(match.group(1)) != os.getpid() and fGl.pid_alive(int(match.group(1)))):
+            continue
+        if arcpy.Exists(stale):
+            arcpy.management.Delete(stale)
+        for companion in _companions(stale):
+            os.remove(companion)
+    return os.path.join(folder, f"_tmp{host}-{os.getpid()}_{name}")
+
+
+def _publish(tmp_path: str, path: str):
+    """Move a raster written at `tmp_path` (and its sidecars) onto `path`, replacing any old version."""
+    if arcpy.Exists(path):
+        arcpy.management.Delete(path)
+    for old in _companions(path):
+        os.remove(old)
+    tmp_name = os.path.basename(tmp_path)
+    for companion in _companions(tmp_path):
+        os.replace(companion, path + os.path.basename(companion)[len(tmp_name):])
+    # The raster file last: it only appears under its final name once complete.
+    os.replace(tmp_path, path)
+
+
+def _grid_of(reference):
+    """Return lower-left point, cell width/height and spatial reference of a raster."""
+    ref = reference if isinstance(reference, arcpy.Raster) else arcpy.Raster(reference)
+    ext = ref.extent
+    return arcpy.Point(ext.XMin, ext.YMin), ref.meanCellWidth, ref.meanCellHeight, ref.spatialReference
+
+
+def _float_data(array):
+    data = np.asarray(array)
+    if data.dtype not in (np.float32, np.float64):
+        data = data.astype(np.float64)
+    return data, np.isfinite(data)
+
+
+def _quantization_meta(vmin: float, vmax: float, mode: str):
+    """Sidecar metadata of an integer mode for values in [vmin, vmax]; None for float modes."""
+    if mode not in _INT_LAYOUT:
+        return None
+    scale, offset, max_err = quantization_params(vmin, vmax, mode)
+    return {
+        "mode": mode,
+        "scale": scale,
+        "offset": offset,
+        "nodata": _INT_LAYOUT[mode][3],
+        "min": vmin,
+        "max": vmax,
+        "max_abs_error": max_err,
+    }
+
+
+def _encode(data: np.ndarray, valid: np.ndarray, mode: str, meta):
+    """Return the stored array of `data` in `mode` and its NoData value."""
+    if meta is not None:
+        dtype, lo, hi, nodata_code = _INT_LAYOUT[mode]
+        out = np.full(data.shape, nodata_code, dtype=dtype)
+        out[valid] = np.clip(np.rint((data[valid] - meta["offset"]) / meta["scale"]), lo, hi).astype(dtype)
+        return out, nodata_code
+    out_dtype = np.float32 if mode == "float32" else data.dtype
+    return np.where(valid, data, FLOAT_NODATA).astype(out_dtype), FLOAT_NODATA
+
+
+def save_derived_array(array, path: str, reference, mode: str = None, stats=None):
+    """
+    Write a float array (NaN = nodata) to `path` on the grid of `reference`. float32
+    arrays are written without an intermediate float64 copy, and stay float32 in
+    "full" mode.
+    A raster_stats.RasterStats passed as `stats` is updated from the same pass.
+
+    Returns the quantization metadata for integer modes, otherwise None.
+    """
+    mode = resolve_storage_mode(mode)
+    lower_left, cell_w, cell_h, sr = _grid_of(reference)
+    data, valid = _float_data(array)
+    if stats is not None:
+        stats.update(data, valid)
+    if mode in _INT_LAYOUT and valid.any():
+        meta = _quantization_meta(float(data[valid].min()), float(data[valid].max()), mode)
+    else:
+        meta = _quantization_meta(0.0, 0.0, mode)
+    out, nodata_value = _encode(data, valid, mode, meta)
+
+    tmp_path = _temp_path(path)
+    raster = arcpy.NumPyArrayToRaster(out, lower_left, cell_w, cell_h, nodata_value)
+    raster.save(tmp_path)
+    if sr is not None and sr.name and sr.name != "Unknown":
+        arcpy.management.DefineProjection(tmp_path, sr)
+    _write_sidecar(tmp_path, meta)
+    _publish(tmp_path, path)
+    return meta
+
+
+class StripWriter:
+    """
+    Write a derived raster strip by strip (full-width row bands, top to bottom) without
+    holding the whole grid in memory. Strips wait on disk as .npy parts until `close`:
+    integer modes need the value range of the whole raster before encoding. Each part
+    is then written as a raster piece and the pieces are mosaicked into `path`. Use as
+    a context manager; the output is only published when the block completes.
+    A raster_stats.RasterStats passed as `stats` is updated as strips are written.
+    """
+
+    _PIXEL_TYPES = {"float32": "32_BIT_FLOAT", "float64": "64_BIT", "int16": "16_BIT_SIGNED",
+                    "uint16": "16_BIT_UNSIGNED"}
+
+    def __init__(self, path: str, reference, mode: str = None, stats=None):
+        ref = reference if isinstance(reference, arcpy.Raster) else arcpy.Raster(reference)
+        self.path = path
+        self.mode = resolve_storage_mode(mode)
+        self.stats = stats
+        self.meta = None
+        self._rows = ref.height
+        self._lower_left, self._cell_w, self._cell_h, self._sr = _grid_of(ref)
+        self._tmp_path = _temp_path(path)
+        self._parts_dir = self._tmp_path + ".parts"
+        shutil.rmtree(self._parts_dir, ignore_errors=True)
+        os.makedirs(self._parts_dir)
+        self._parts = []
+        self._range = [np.inf, -np.inf]
+
+    def write(self, row_off: int, strip: np.ndarray):
+        """Add the rows starting at `row_off` (NaN = nodata)."""
+        data, valid = _float_data(strip)
+        if self.stats is not None:
+            self.stats.update(data, valid)
+        if valid.any():
+            self._range = [min(self._range[0], float(data[valid].min())), max(self._range[1], float(data[valid].max()))]
+        part = os.path.join(self._parts_dir, f"{row_off}.npy")
+        np.save(part, data)
+        self._parts.append((row_off, data.shape[0], part))
+
+    def close(self):
+        """Encode and mosaic the strips into `path`; returns the quantization metadata (or None)."""
+        vmin, vmax = self._range if self._range[0] <= self._range[1] else (0.0, 0.0)
+        self.meta = _quantization_meta(vmin, vmax, self.mode)
+        pieces, pixel_type, nodata_value = [], None, None
+        for row_off, nrows, part in self._parts:
+            data, valid = _float_data(np.load(part))
+            out, nodata_value = _encode(data, valid, self.mode, self.meta)
+            pixel_type = self._PIXEL_TYPES[out.dtype.name]
+            y = self._lower_left.Y + (self._rows - row_off - nrows) * self._cell_h
+            piece = os.path.join(self._parts_dir, f"{row_off}.tif")
+            arcpy.NumPyArrayToRaster(out, arcpy.Point(self._lower_left.X, y), self._cell_w, self._cell_h,
+                                     nodata_value).save(piece)
+            pieces.append(piece)
+            os.remove(part)
+        sr = self._sr if self._sr is not None and self._sr.name and self._sr.name != "Unknown" else None
+        arcpy.management.MosaicToNewRaster(
+            pieces, os.path.dirname(self._tmp_path) or ".", os.path.basename(self._tmp_path), sr, pixel_type,
+            self._cell_w, 1,
+        )
+        arcpy.management.SetRasterProperties(self._tmp_path, nodata=[[1, nodata_value]])
+        _write_sidecar(self._tmp_path, self.meta)
+        _publish(self._tmp_path, self.path)
+        self.discard()
+        return self.meta
+
+    def discard(self):
+        """Drop the strips written so far."""
+        for piece in glob.glob(os.path.join(glob.escape(self._parts_dir), "*.tif")):
+            if arcpy.Exists(piece):
+                arcpy.management.Delete(piece)
+        shutil.rmtree(self._parts_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+def save_derived_raster(raster, path: str, mode: str = None, stats=None):
+    """
+    Save a map-algebra result to `path` using the requested storage mode.
+    A raster_stats.RasterStats passed as `stats` is updated with the written values.
+
+    Returns the quantization metadata for integer modes, otherwise None.
+    """
+    mode = resolve_storage_mode(mode)
+    if mode == "full" and stats is None:
+        tmp_path = _temp_path(path)
+        arcpy.CopyRaster_management(raster, tmp_path)
+        _publish(tmp_path, path)
+        return None
+    # The pixels are needed: compute them once and count the statistics while writing.
+    array = arcpy.RasterToNumPyArray(raster, nodata_to_value=np.nan)
+    return save_derived_array(array, path, raster, mode, stats)
+
+
+def open_derived_raster(path: str):
+    """Open a derived raster as an arcpy Raster in physical units."""
+    raster = arcpy.Raster(path)
+    meta = read_quantization(path)
+    if meta is None:
+        return raster
+    return raster * meta["scale"] + meta["offset"]
+
+
+def read_derived_array(path: str) -> np.ndarray:
+    """Read a derived raster into a float64 array in physical units (NaN = nodata)."""
+    meta = read_quantization(path)
+    if meta is None:
+        return arcpy.RasterToNumPyArray(path, nodata_to_value=np.nan).astype(np.float64, copy=False)
+    codes = arcpy.RasterToNumPyArray(path, nodata_to_value=meta["nodata"])
+    out = np.full(codes.shape, np.nan, dtype=np.float64)
+    valid = codes != meta["nodata"]
+    out[valid] = codes[valid] * meta["scale"] + meta["offset"]
+    return out
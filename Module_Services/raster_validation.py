@@ -0,0 +1,270 @@
+"""
+Header-only alignment checks for the rasters of a condition.
+
+Only raster headers are read. ESRI ASCII grid headers (and their .prj) are parsed
+without arcpy, concurrently; other rasters go through arcpy.Describe on the calling
+thread, as arcpy is not thread-safe. Each header is cached by file fingerprint in
+memory and in <dir2cache>/raster_headers.json, so validating an unchanged condition
+again does not touch the rasters at all. Entries of rasters that changed or were
+deleted are dropped whenever the cache file is written, and it keeps at most
+MAX_CACHE_ENTRIES headers.
+"""
+import json
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import arcpy
+
+import config
+import fGl
+from Module_Services import ascii_grid
+
+_CACHE_FILE = os.path.join(config.dir2cache, "raster_headers.json")
+_cache = None
+_cache_lock = threading.Lock()
+
+FLOAT_PIXEL_TYPES = ("F32", "F64")
+MAX_CACHE_ENTRIES = 20000
+
+
+def _load_cache() -> Dict[str, dict]:
+    global _cache
+    if _cache is None:
+        try:
+            with open(_CACHE_FILE, "r", encoding="utf-8") as fh:
+                _cache = json.load(fh)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _current(fingerprint: str) -> bool:
+    """True while the file a cache key was taken from is unchanged."""
+    path = fingerprint.rsplit("|", 2)[0]
+    try:
+        return fGl.file_fingerprint(path) == fingerprint
+    except OSError:
+        return False
+
+
+def _save_cache():
+    """Merge with what other processes saved, drop entries of changed or deleted rasters and write."""
+    try:
+        with open(_CACHE_FILE, "r", encoding="utf-8") as fh:
+            merged = json.load(fh)
+    except (OSError, ValueError):
+        merged = {}
+    merged.update(_cache)
+    entries = [(k, v) for k, v in merged.items() if _current(k)]
+    _cache.clear()
+    # Newest last; the oldest go first once the cache is full.
+    _cache.update(entries[-MAX_CACHE_ENTRIES:])
+    tmp = f"{_CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(_cache, fh)
+    os.replace(tmp, _CACHE_FILE)
+
+
+def _describe(path: str) -> dict:
+    """Read the header of a single-band raster."""
+    desc = arcpy.Describe(path)
+    ext = desc.extent
+    sr = desc.spatialReference
+    return {
+        "xmin": ext.XMin,
+        "ymin": ext.YMin,
+        "xmax": ext.XMax,
+        "ymax": ext.YMax,
+        "cell_w": desc.meanCellWidth,
+        "cell_h": desc.meanCellHeight,
+        "rows": desc.height,
+        "cols": desc.width,
+        "pixel_type": desc.pixelType,
+        "nodata": desc.noDataValue,
+        "sr_name": sr.name if sr else "",
+        "sr_code": sr.factoryCode if sr else 0,
+    }
+
+
+def _prj_crs(path: str) -> Tuple[str, int]:
+    """Name and EPSG code of the .prj next to a raster (WKT), as arcpy reports them."""
+    try:
+        with open(os.path.splitext(path)[0] + ".prj", "r", encoding="utf-8", errors="replace") as fh:
+            wkt = fh.read().strip()
+    except OSError:
+        return "Unknown", 0
+    name = re.match(r'\s*[A-Z]+\["([^"]*)"', wkt)
+    # The authority of the whole CRS closes the WKT.
+    code = re.search(r'AUTHORITY\["EPSG",\s*"?(\d+)"?\]\s*\]\s*$', wkt)
+    return (name.group(1) if name else "Unknown"), (int(code.group(1)) if code else 0)
+
+
+def _describe_ascii(path: str) -> dict:
+    """Header of an ESRI ASCII grid, parsed without arcpy (read as float, like ascii_grid does)."""
+    h = ascii_grid.read_header(path)
+    sr_name, sr_code = _prj_crs(path)
+    return {
+        "xmin": h["xmin"],
+        "ymin": h["ymax"] - h["rows"] * h["cell_h"],
+        "xmax": h["xmin"] + h["cols"] * h["cell_w"],
+        "ymax": h["ymax"],
+        "cell_w": h["cell_w"],
+        "cell_h": h["cell_h"],
+        "rows": h["rows"],
+        "cols": h["cols"],
+        "pixel_type": "F32",
+        "nodata": h["nodata"],
+        "sr_name": sr_name,
+        "sr_code": sr_code,
+    }
+
+
+def read_header(path: str) -> dict:
+    """Return the (cached) header of a raster."""
+    fingerprint = fGl.file_fingerprint(path)
+    with _cache_lock:
+        cached = _load_cache().get(fingerprint)
+    if cached is not None:
+        return cached
+    header = _describe_ascii(path) if ascii_grid.is_ascii_grid(path) else _describe(path)
+    with _cache_lock:
+        _load_cache()[fingerprint] = header
+    return header
+
+
+def _try_read_header(path: str):
+    try:
+        return read_header(path)
+    except Exception:
+        return None
+
+
+def read_headers(paths: List[str], max_workers: int = None) -> Dict[str, dict]:
+    """
+    Read the headers of several rasters; unreadable rasters are omitted. ESRI ASCII
+    headers are parsed concurrently, the others are described one by one.
+    """
+    with _cache_lock:
+        known = len(_load_cache())
+    unique = list(dict.fromkeys(p for p in paths if p))
+    ascii_paths = [p for p in unique if ascii_grid.is_ascii_grid(p)]
+    found = {}
+    if len(ascii_paths) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(ascii_paths), max_workers or 8)) as pool:
+            found.update(zip(ascii_paths, pool.map(_try_read_header, ascii_paths)))
+    for path in unique:
+        if path not in found:
+            found[path] = _try_read_header(path)
+    headers = {path: found[path] for path in unique if found[path] is not None}
+    with _cache_lock:
+        if len(_load_cache()) != known:
+            _save_cache()
+    return headers
+
+
+def _same_crs(a: dict, b: dict) -> bool:
+    if a["sr_code"] and b["sr_code"]:
+        return a["sr_code"] == b["sr_code"]
+    return a["sr_name"] == b["sr_name"]
+
+
+def _compare(label: str, path: str, header: dict, ref_label: str, ref: dict) -> List[str]:
+    """Return alignment errors of `header` against the reference header."""
+    name = os.path.basename(path)
+    errors = []
+    if not _same_crs(header, ref):
+        errors.append(
+            f"{label} '{name}' CRS ({header['sr_name'] or 'undefined'}) differs from "
+            f"{ref_label} ({ref['sr_name'] or 'undefined'})."
+        )
+    tol = 1e-6 * max(ref["cell_w"], ref["cell_h"])
+    if abs(header["cell_w"] - ref["cell_w"]) > tol or abs(header["cell_h"] - ref["cell_h"]) > tol:
+        errors.append(
+            f"{label} '{name}' cell size {header['cell_w']:g} x {header['cell_h']:g} differs from "
+            f"{ref_label} ({ref['cell_w']:g} x {ref['cell_h']:g})."
+        )
+        return errors
+    half_cell = 0.5 * min(ref["cell_w"], ref["cell_h"])
+    if any(abs(header[k] - ref[k]) > half_cell for k in ("xmin", "ymin", "xmax", "ymax")):
+        errors.append(
+            f"{label} '{name}' extent ({header['xmin']:.3f}, {header['ymin']:.3f}, {header['xmax']:.3f}, "
+            f"{header['ymax']:.3f}) does not match {ref_label}."
+        )
+    elif header["rows"] != ref["rows"] or header["cols"] != ref["cols"]:
+        errors.append(
+            f"{label} '{name}' is {header['rows']} x {header['cols']} cells, "
+            f"{ref_label} is {ref['rows']} x {ref['cols']}."
+        )
+    return errors
+
+
+def is_aligned(header: dict, ref: dict) -> bool:
+    """True when a raster shares CRS, cell size and extent with the reference header."""
+    return not _compare("", "", header, "", ref)
+
+
+def validate_condition_rasters(
+    depth_paths: List[str],
+    vel_paths: List[str],
+    dem_path: str = None,
+    grain_path: str = None,
+) -> Tuple[List[str], List[str]]:
+    """
+    Check that all rasters of a condition share CRS, cell size and extent with the DEM
+    (or with the grain raster when no DEM is given).
+
+    Returns
+    -------
+    errors : list of str
+        Problems that would make map algebra combine misaligned cells.
+    warnings : list of str
+        Suspicious but usable inputs (integer pixel types, undefined NoData, NoData
+        differing from the reference raster's).
+    """
+    labelled = [("Depth raster", p) for p in depth_paths] + [("Velocity raster", p) for p in vel_paths]
+    if grain_path:
+        labelled.append(("Grain size raster", grain_path))
+    if dem_path:
+        labelled.append(("DEM", dem_path))
+
+    errors = [f"{label} not found at: {p}" for label, p in labelled if not os.path.exists(p)]
+    existing = [(label, p) for label, p in labelled if os.path.exists(p)]
+    headers = read_headers([p for _, p in existing])
+    errors += [f"Could not read raster header of {label.lower()}: {p}" for label, p in existing if p not in headers]
+
+    ref_path = dem_path if dem_path in headers else (grain_path if grain_path in headers else None)
+    warnings = []
+    if ref_path is None:
+        return errors, warnings
+    ref_label = "DEM" if ref_path == dem_path else "grain size raster"
+    ref = headers[ref_path]
+
+    for label, path in existing:
+        header = headers.get(path)
+        if header is None:
+            continue
+        if path != ref_path:
+            errors += _compare(label, path, header, ref_label, ref)
+        if label != "DEM" and header["pixel_type"] not in FLOAT_PIXEL_TYPES:
+            warnings.append(
+                f"{label} '{os.path.basename(path)}' has integer pixel type {header['pixel_type']}; "
+                "fractional values are truncated."
+            )
+        if header["nodata"] is None and label in ("Depth raster", "Velocity raster"):
+            warnings.append(
+                f"{label} '{os.path.basename(path)}' defines no NoData value; dry cells may be read as zero."
+            )
+        elif (
+            label in ("Depth raster", "Velocity raster")
+            and ref["nodata"] is not None
+            and not math.isclose(header["nodata"], ref["nodata"], rel_tol=1e-6)
+        ):
+            warnings.append(
+                f"{label} '{os.path.basename(path)}' NoData value {header['nodata']:g} differs from "
+                f"{ref_label} ({ref['nodata']:g})."
+            )
+    return errors, warnings
@@ -0,0 +1,236 @@
+"""
+Per-stage instrumentation of populate runs.
+
+A `RunRecorder` times every stage (read, compute, write, db) of every discharge
+iteration: wall time, CPU time, bytes moved and the process memory peak. Spans are
+buffered in memory and written to the `run_log` table in one batch when the run
+finishes, so the hot path only pays for two clock reads per stage.
+
+Report from the command line:
+    python -m Module_Services.run_log <condition_name> [--run-id RUN_ID]
+"""
+import argparse
+import datetime
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+import fGl
+from Database.condition_output_table import CONDITION_OUTPUT_TABLE_SQL
+from Database.run_log_table import RUN_LOG_TABLE_SQL
+
+STAGES = ("db", "read", "compute", "write")
+
+
+def ensure_run_log_table(conn, condition_name: str = None):
+    """Create run_log (and condition_output) if missing; make sure the condition has an output row."""
+    cur = conn.cursor()
+    cur.execute(CONDITION_OUTPUT_TABLE_SQL)
+    cur.execute(RUN_LOG_TABLE_SQL)
+    if condition_name:
+        cur.execute(
+            "INSERT INTO condition_output (condition_name) VALUES (%s) ON CONFLICT (condition_name) DO NOTHING;",
+            (condition_name,),
+        )
+    conn.commit()
+    cur.close()
+
+
+class RunRecorder:
+    """Collect timing spans of one engine run and persist them to run_log."""
+
+    def __init__(self, conn, condition_name: str, product: str):
+        self.conn = conn
+        self.condition_name = condition_name
+        self.product = product
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        self.spans: List[dict] = []
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._started_at = datetime.datetime.now(datetime.timezone.utc)
+
+    @contextmanager
+    def span(self, stage: str, q_str: str = None):
+        """
+        Time a stage. The yielded dict accepts a "bytes" entry for data read or written.
+        """
+        record = {"stage": stage, "q_str": q_str, "bytes": 0}
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - wall0
+            record["cpu_s"] = time.process_time() - cpu0
+            record["peak_rss_bytes"] = fGl.peak_rss_bytes()
+            record["started_at"] = started_at
+            self.spans.append(record)
+
+    def finish(self, status: str = "ok"):
+        """Write all spans plus a whole-run summary span; never raises."""
+        total = {
+            "stage": "run",
+            "q_str": None,
+            "bytes": sum(s["bytes"] for s in self.spans),
+            "wall_s": time.perf_counter() - self._wall0,
+            "cpu_s": time.process_time() - self._cpu0,
+            "peak_rss_bytes": fGl.peak_rss_bytes(),
+            "started_at": self._started_at,
+        }
+        rows = [
+            (
+                self.run_id,
+                self.condition_name,
+                self.product,
+                s["q_str"],
+                s["stage"],
+                status if s["stage"] == "run" else None,
+                s["wall_s"],
+                s["cpu_s"],
+                s["bytes"],
+                s["peak_rss_bytes"],
+                s["started_at"],
+            )
+            for s in self.spans + [total]
+        ]
+        try:
+            if status != "ok":
+                self.conn.rollback()
+            ensure_run_log_table(self.conn, self.condition_name)
+            cur = self.conn.cursor()
+            cur.executemany(
+                """
+                INSERT INTO run_log (
+                    run_id, condition_name, product, q_str, stage, status,
+                    wall_s, cpu_s, bytes, peak_rss_bytes, started_at
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+                """,
+                rows,
+            )
+            self.conn.commit()
+            cur.close()
+        except Exception as exc:  # instrumentation must never fail a run
+            print(f"Could not write run_log for run {self.run_id}: {exc}")
+            try:
+                self.conn.rollback()
+            except Exception:
+                pass
+
+
+def _latest_run_id(conn, condition_name: str) -> Optional[str]:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT run_id FROM run_log
+        WHERE condition_name = %s AND stage = 'run'
+        ORDER BY started_at DESC LIMIT 1;
+        """,
+        (condition_name,),
+    )
+    row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
+
+
+def summarize_run(conn, condition_name: str, run_id: str = None) -> Optional[dict]:
+    """
+    Aggregate the spans of a run (latest run of the condition by default).
+
+    Returns None when the condition has no recorded run.
+    """
+    ensure_run_log_table(conn)
+    run_id = run_id or _latest_run_id(conn, condition_name)
+    if not run_id:
+        return None
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT product, status, wall_s, cpu_s, bytes, peak_rss_bytes, started_at
+        FROM run_log WHERE run_id = %s AND stage = 'run';
+        """,
+        (run_id,),
+    )
+    run_row = cur.fetchone()
+    cur.execute(
+        """
+        SELECT stage, COUNT(*), SUM(wall_s), SUM(cpu_s), SUM(bytes), MAX(peak_rss_bytes)
+        FROM run_log WHERE run_id = %s AND stage <> 'run'
+        GROUP BY stage ORDER BY SUM(wall_s) DESC;
+        """,
+        (run_id,),
+    )
+    stage_rows = cur.fetchall()
+    cur.execute(
+        """
+        SELECT q_str, SUM(wall_s) FROM run_log
+        WHERE run_id = %s AND q_str IS NOT NULL
+        GROUP BY q_str ORDER BY SUM(wall_s) DESC LIMIT 5;
+        """,
+        (run_id,),
+    )
+    slowest = cur.fetchall()
+    cur.close()
+    if not run_row:
+        return None
+    product, status, wall_s, cpu_s, nbytes, peak, started_at = run_row
+    return {
+        "run_id": run_id,
+        "product": product,
+        "status": status,
+        "wall_s": wall_s,
+        "cpu_s": cpu_s,
+        "bytes": nbytes,
+        "peak_rss_bytes": peak,
+        "started_at": started_at,
+        "stages": [
+            {"stage": r[0], "count": r[1], "wall_s": r[2] or 0.0, "cpu_s": r[3] or 0.0,
+             "bytes": r[4] or 0, "peak_rss_bytes": r[5] or 0}
+            for r in stage_rows
+        ],
+        "slowest_discharges": [(r[0], r[1] or 0.0) for r in slowest],
+    }
+
+
+def format_run_report(conn, condition_name: str, run_id: str = None) -> str:
+    """Return a human-readable summary of a run."""
+    summary = summarize_run(conn, condition_name, run_id)
+    if summary is None:
+        return f"No recorded runs for condition '{condition_name}'."
+    mib = 2 ** 20
+    lines = [
+        f"Run {summary['run_id']} ({summary['product']}, {summary['status']}) started {summary['started_at']:%Y-%m-%d %H:%M:%S}",
+        f"Total: {summary['wall_s']:.2f} s wall, {summary['cpu_s']:.2f} s CPU, "
+        f"{summary['bytes'] / mib:.1f} MiB moved, peak memory {summary['peak_rss_bytes'] / mib:.0f} MiB",
+        "",
+        f"{'stage':<8} {'spans':>5} {'wall s':>9} {'share':>6} {'CPU s':>9} {'MiB':>9}",
+    ]
+    total_wall = summary["wall_s"] or 1e-12
+    for st in summary["stages"]:
+        lines.append(
+            f"{st['stage']:<8} {st['count']:>5} {st['wall_s']:>9.2f} {st['wall_s'] / total_wall:>6.0%} "
+            f"{st['cpu_s']:>9.2f} {st['bytes'] / mib:>9.1f}"
+        )
+    if summary["slowest_discharges"]:
+        lines.append("")
+        lines.append("Slowest discharges: " + ", ".join(f"Q{q} {s:.2f} s" for q, s in summary["slowest_discharges"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from Module_Services import storage
+
+    parser = argparse.ArgumentParser(description="Summarize a recorded populate run.")
+    parser.add_argument("condition_name")
+    parser.add_argument("--run-id", help="Run to report (default: latest run of the condition).")
+    args = parser.parse_args(argv)
+    conn = storage.connect()
+    try:
+        print(format_run_report(conn, args.condition_name, args.run_id))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Point and polygon sampling across every discharge and product of a condition.
+
+Points and polygons are converted to pixel indices once (polygons by cell centre,
+even-odd rule, so holes work). The pixels are grouped into BLOCK x BLOCK blocks.
+Each raster is then read only over the bounding window of the sampled pixels in
+each touched block, so 5,000 survey points cost a few small reads per raster
+instead of a full extraction per flow.
+
+Products:
+    depth, velocity      the condition's discharge rasters
+    bed_shear, bed_shield   the recorded outputs, else evaluated on demand (virtual_rasters)
+    dem, grain_size      static rasters (q is empty)
+
+Results are a tidy table: one dict per feature, product and discharge.
+
+    python -m Module_Services.sampling <condition> --points gauges.csv --out samples.csv
+    python -m Module_Services.sampling <condition> --features C:/gis/reaches.shp --id-field NAME
+"""
+import argparse
+import csv
+import os
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from Module_Services import (
+    discharge_catalog,
+    populate_features,
+    raster_io,
+    storage,
+    virtual_rasters,
+)
+
+BLOCK = 256
+DEFAULT_PRODUCTS = ("depth", "velocity", "bed_shear", "bed_shield")
+STATIC_PRODUCTS = {"dem": "digital_elevation_model", "grain_size": "grain_size_raster"}
+TABLE_FIELDS = ("feature_id", "kind", "product", "q", "q_str", "value", "count", "mean", "min", "max")
+
+
+def _rings(geometry) -> List[np.ndarray]:
+    """Accept one ring [(x, y), ...] or several rings [[(x, y), ...], ...]."""
+    first = geometry[0]
+    if np.ndim(first) == 1 and len(first) == 2 and np.isscalar(first[0]):
+        geometry = [geometry]
+    return [np.asarray(ring, dtype=np.float64) for ring in geometry]
+
+
+def polygon_pixels(grid: raster_io.RasterGrid, geometry) -> np.ndarray:
+    """Return flat pixel indices (row * cols + col) whose cell centres fall inside a polygon."""
+    rings = _rings(geometry)
+    allxy = np.vstack(rings)
+    col0 = max(0, int(np.floor((allxy[:, 0].min() - grid.xmin) / grid.cell_w)))
+    col1 = min(grid.cols, int(np.ceil((allxy[:, 0].max() - grid.xmin) / grid.cell_w)))
+    row0 = max(0, int(np.floor((grid.ymax - allxy[:, 1].max()) / grid.cell_h)))
+    row1 = min(grid.rows, int(np.ceil((grid.ymax - allxy[:, 1].min()) / grid.cell_h)))
+    if row1 <= row0 or col1 <= col0:
+        return np.empty(0, dtype=np.int64)
+    rows, cols = np.mgrid[row0:row1, col0:col1]
+    cx = grid.xmin + (cols + 0.5) * grid.cell_w
+    cy = grid.ymax - (rows + 0.5) * grid.cell_h
+    inside = np.zeros(cx.shape, dtype=bool)
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        for ax, ay, bx, by in zip(x1, y1, x2, y2):
+            if ay == by:
+                continue
+            crosses = (ay > cy) != (by > cy)
+            x_at = ax + (cy - ay) * (bx - ax) / (by - ay)
+            inside ^= crosses & (cx < x_at)
+    return (rows[inside] * grid.cols + cols[inside]).astype(np.int64)
+
+
+class SamplePlan:
+    """Pixel indices of a set of points and polygons, grouped into read windows."""
+
+    def __init__(self, grid: raster_io.RasterGrid, points=(), polygons=()):
+        self.grid = grid
+        self.points = list(points)
+        self.polygons = list(polygons)
+
+        point_flat = np.full(len(self.points), -1, dtype=np.int64)
+        if self.points:
+            xy = np.array([(x, y) for _, x, y in self.points], dtype=np.float64)
+            cols = np.floor((xy[:, 0] - grid.xmin) / grid.cell_w).astype(np.int64)
+            rows = np.floor((grid.ymax - xy[:, 1]) / grid.cell_h).astype(np.int64)
+            inside = (rows >= 0) & (rows < grid.rows) & (cols >= 0) & (cols < grid.cols)
+            point_flat[inside] = rows[inside] * grid.cols + cols[inside]
+        polygon_flat = [polygon_pixels(grid, geometry) for _, geometry in self.polygons]
+
+        self.flat = np.unique(np.concatenate([point_flat[point_flat >= 0]] + polygon_flat))
+        self.point_pos = np.where(point_flat >= 0, np.searchsorted(self.flat, np.maximum(point_flat, 0)), -1)
+        self.polygon_pos = [np.searchsorted(self.flat, f) for f in polygon_flat]
+
+        # Block -> (positions in self.flat, rows, cols, bounding window)
+        rows, cols = np.divmod(self.flat, grid.cols)
+        block_ids = (rows // BLOCK) * ((grid.cols + BLOCK - 1) // BLOCK) + cols // BLOCK
+        self.blocks = []
+        for block_id in np.unique(block_ids):
+            pos = np.nonzero(block_ids == block_id)[0]
+            r, c = rows[pos], cols[pos]
+            window = (int(r.min()), int(c.min()), int(r.max() - r.min() + 1), int(c.max() - c.min() + 1))
+            self.blocks.append((pos, r - window[0], c - window[1], window))
+
+    def read(self, reader) -> np.ndarray:
+        """Return the values of every planned pixel; `reader(window)` returns a window array."""
+        values = np.full(self.flat.size, np.nan, dtype=np.float64)
+        for pos, r, c, window in self.blocks:
+            values[pos] = reader(window)[r, c]
+        return values
+
+    def rows(self, values: np.ndarray, product: str, q=None, q_str: str = None) -> List[dict]:
+        """Tidy rows for one raster: a value per point and summary statistics per polygon."""
+        out = []
+        for (feature_id, _, _), pos in zip(self.points, self.point_pos):
+            value = values[pos] if pos >= 0 else np.nan
+            out.append(
+                {
+                    "feature_id": feature_id,
+                    "kind": "point",
+                    "product": product,
+                    "q": q,
+                    "q_str": q_str,
+                    "value": float(value) if np.isfinite(value) else None,
+                }
+            )
+        for (feature_id, _), pos in zip(self.polygons, self.polygon_pos):
+            sample = values[pos]
+            sample = sample[np.isfinite(sample)]
+            out.append(
+                {
+                    "feature_id": feature_id,
+                    "kind": "polygon",
+                    "product": product,
+                    "q": q,
+                    "q_str": q_str,
+                    "count": int(sample.size),
+                    "mean": float(sample.mean()) if sample.size else None,
+                    "min": float(sample.min()) if sample.size else None,
+                    "max": float(sample.max()) if sample.size else None,
+                }
+            )
+        return out
+
+
+def raster_reader(path: str, grid: raster_io.RasterGrid):
+    """Return read(window) for a raster in physical units (see raster_io.read_window)."""
+
+    def reader(window):
+        return raster_io.read_window(path, grid, window)
+
+    return reader
+
+
+def recorded_outputs(conn, condition_name: str, column: str) -> Dict[float, str]:
+    """Return {Q: path} of the existing output rasters listed in a condition column."""
+    if column not in {spec[3] for spec in populate_features.PRODUCTS.values()}:
+        raise ValueError(f"'{column}' is not an output column of the condition table.")
+    # The whole row: an output column that has not been added to the table yet is just missing.
+    record = storage.Repository(conn).get_condition(condition_name) or {}
+    paths = [p for p in (record.get(column) or "").split(";") if p.strip() and os.path.exists(p)]
+    return {populate_features.output_q(p): p for p in paths}
+
+
+def sample_condition(
+    conn,
+    condition_name: str,
+    points: Sequence[Tuple] = (),
+    polygons: Sequence[Tuple] = (),
+    products: Sequence[str] = DEFAULT_PRODUCTS,
+) -> List[dict]:
+    """
+    Sample a condition at `points` [(id, x, y)] and `polygons` [(id, rings)] for every
+    discharge of each product. Returns tidy rows (see TABLE_FIELDS).
+    """
+    discharges = discharge_catalog.condition_discharges(conn, condition_name)
+    if not discharges:
+        raise ValueError(f"Condition '{condition_name}' has no depth/velocity rasters.")
+    grid = raster_io.RasterGrid.from_raster(discharges[0]["depth"])
+    plan = SamplePlan(grid, points, polygons)
+    table = []
+
+    for product in products:
+        if product in STATIC_PRODUCTS:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT {STATIC_PRODUCTS[product]} FROM condition WHERE condition_name = %s;", (condition_name,)
+            )
+            row = cur.fetchone()
+            cur.close()
+            if row and row[0]:
+                table += plan.rows(plan.read(raster_reader(row[0], grid)), product)
+            continue
+        if product in ("depth", "velocity"):
+            for record in discharges:
+                values = plan.read(raster_reader(record[product], grid))
+                table += plan.rows(values, product, record["q"], record["q_str"])
+            continue
+        if product not in populate_features.PRODUCTS:
+            raise ValueError(f"Unknown product '{product}'.")
+        recorded = recorded_outputs(conn, condition_name, populate_features.PRODUCTS[product][3])
+        virtual = None
+        for record in discharges:
+            path = recorded.get(record["q"]) if record["q"] is not None else None
+            if path:
+                reader = raster_reader(path, grid)
+            else:
+                if virtual is None:
+                    virtual = virtual_rasters.open_virtual_products(conn, condition_name, product)
+                reader = virtual[record["q_str"]].read
+            table += plan.rows(plan.read(reader), product, record["q"], record["q_str"])
+    return table
+
+
+def load_points_csv(path: str) -> List[Tuple]:
+    """Read points from a CSV with columns id, x, y (header names are case-insensitive)."""
+    with open(path, "r", newline="", encoding="utf-8") as fh:
+        reader = csv.DictReader(fh)
+        fields = {name.lower(): name for name in reader.fieldnames or []}
+        return [(row[fields["id"]], float(row[fields["x"]]), float(row[fields["y"]])) for row in reader]
+
+
+def load_features(path: str, id_field: str = None) -> Tuple[List[Tuple], List[Tuple]]:
+    """Read point or polygon features (shapefile / feature class) as (points, polygons)."""
+    import arcpy
+
+    desc = arcpy.Describe(path)
+    id_field = id_field or desc.OIDFieldName
+    points, polygons = [], []
+    with arcpy.da.SearchCursor(path, [id_field, "SHAPE@"]) as cursor:
+        for feature_id, shape in cursor:
+            if shape is None:
+                continue
+            if desc.shapeType == "Polygon":
+                rings = []
+                for part in shape:
+                    ring = []
+                    for pnt in part:
+                        if pnt is None:  # ring separator inside a part
+                            if ring:
+                                rings.append(ring)
+                            ring = []
+                        else:
+                            ring.append((pnt.X, pnt.Y))
+                    if ring:
+                        rings.append(ring)
+                polygons.append((feature_id, rings))
+            else:
+                for pnt in shape:
+                    points.append((feature_id, pnt.X, pnt.Y))
+    return points, polygons
+
+
+def write_table(rows: List[dict], path: str):
+    """Write tidy rows to CSV."""
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=TABLE_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sample a condition's rasters at points or polygons.")
+    parser.add_argument("condition_name")
+    parser.add_argument("--points", help="CSV with id, x, y columns.")
+    parser.add_argument("--features", help="Point or polygon feature class / shapefile.")
+    parser.add_argument("--id-field", default=None)
+    parser.add_argument("--products", default=",".join(DEFAULT_PRODUCTS))
+    parser.add_argument("--out", default=None, help="CSV output (default: print).")
+    args = parser.parse_args(argv)
+
+    points, polygons = [], []
+    if args.points:
+        points = load_points_csv(args.points)
+    if args.features:
+        fc_points, polygons = load_features(args.features, args.id_field)
+        points += fc_points
+    conn = storage.connect()
+    try:
+        rows = sample_condition(conn, args.condition_name, points, polygons, args.products.split(","))
+    finally:
+        conn.close()
+    if args.out:
+        write_table(rows, args.out)
+        print(f"Wrote {len(rows)} rows to {args.out}")
+    else:
+        for row in rows:
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
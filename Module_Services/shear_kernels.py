@@ -0,0 +1,126 @@
+"""
+Fused per-pixel kernel for the log-law bed shear / Shields chain.
+
+    u*  = u / (5.75 * log10(h * log_coef))        log_coef    = 12.2 / (2 * 2.2 * D)
+    tb  = rho_w * u*^2
+    ts  = tb / shields_den                        shields_den = rho_w * g * (s - 1) * D
+
+The grain terms come precomputed from grain_terms (NaN where D <= 0). The whole chain
+is evaluated in one pass into caller-provided output buffers instead of building a
+full-size temporary raster per operator. Cells with NaN inputs, h <= 0 (non-positive
+log argument) or a zero logarithm become NaN (NoData).
+
+numba is used when it is installed. Otherwise a numpy path evaluates the chain with
+in-place ufuncs and the reusable scratch buffers of a `KernelWorkspace`.
+"""
+import math
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # optional dependency
+    njit = None
+    prange = range
+
+
+def _log_law_loop(depth, vel, log_coef, shields_den, rho_w, out_tb, out_ts, want_ts):
+    """Per-pixel loop; compiled with numba when available."""
+    nan = math.nan
+    for i in prange(depth.shape[0]):
+        for j in range(depth.shape[1]):
+            h = depth[i, j]
+            u = vel[i, j]
+            c = log_coef[i, j]
+            tb = nan
+            if h > 0.0 and c > 0.0 and u == u:
+                lg = math.log10(h * c)
+                if lg != 0.0:
+                    us = u / (5.75 * lg)
+                    tb = rho_w * us * us
+            out_tb[i, j] = tb
+            if want_ts:
+                out_ts[i, j] = tb / shields_den[i, j]
+
+
+def _log_law_packed_loop(depth, vel, log_coef, shields_den, rho_w, out_tb, out_ts, want_ts):
+    """Same chain over packed 1-D arrays (see wet_index)."""
+    nan = math.nan
+    for i in prange(depth.shape[0]):
+        h = depth[i]
+        u = vel[i]
+        c = log_coef[i]
+        tb = nan
+        if h > 0.0 and c > 0.0 and u == u:
+            lg = math.log10(h * c)
+            if lg != 0.0:
+                us = u / (5.75 * lg)
+                tb = rho_w * us * us
+        out_tb[i] = tb
+        if want_ts:
+            out_ts[i] = tb / shields_den[i]
+
+
+if njit is not None:
+    _log_law_loop = njit(parallel=True, cache=True, fastmath=False)(_log_law_loop)
+    _log_law_packed_loop = njit(parallel=True, cache=True, fastmath=False)(_log_law_packed_loop)
+
+
+class KernelWorkspace:
+    """Scratch buffers for the numpy path, sized for the largest tile and reused across tiles."""
+
+    def __init__(self, shape, dtype=np.float64):
+        size = int(np.prod(shape))
+        self.dtype = np.dtype(dtype)
+        self._scratch = np.empty(size, dtype=self.dtype)
+        self._bad = np.empty(size, dtype=bool)
+        self._tmp = np.empty(size, dtype=bool)
+
+    def views(self, shape):
+        """Return (scratch, bad, tmp) views shaped like a tile; grows the buffers if needed."""
+        size = int(np.prod(shape))
+        if size > self._scratch.size:
+            self.__init__(shape, self.dtype)
+        return (
+            self._scratch[:size].reshape(shape),
+            self._bad[:size].reshape(shape),
+            self._tmp[:size].reshape(shape),
+        )
+
+
+def _log_law_numpy(depth, vel, log_coef, shields_den, rho_w, out_tb, out_ts, workspace):
+    scratch, bad, tmp = workspace.views(depth.shape)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        np.multiply(depth, log_coef, out=scratch)
+        np.log10(scratch, out=scratch)
+        np.multiply(scratch, 5.75, out=scratch)
+        np.divide(vel, scratch, out=out_tb)
+        np.multiply(out_tb, out_tb, out=out_tb)
+        np.multiply(out_tb, rho_w, out=out_tb)
+
+        np.isfinite(out_tb, out=bad)
+        np.logical_not(bad, out=bad)
+        np.less_equal(depth, 0.0, out=tmp)
+        np.logical_or(bad, tmp, out=bad)
+        out_tb[bad] = np.nan
+
+        if out_ts is not None:
+            np.divide(out_tb, shields_den, out=out_ts)
+
+
+def log_law(depth, vel, log_coef, rho_w, out_tb, shields_den=None, out_ts=None, workspace: KernelWorkspace = None):
+    """
+    Evaluate bed shear (into `out_tb`) and, with `shields_den` and `out_ts`, Shields stress.
+
+    All arrays share one shape: a 2-D window, or packed 1-D wet cells (see wet_index).
+    `log_coef` and `shields_den` come from grain_terms.
+    """
+    want_ts = out_ts is not None
+    if njit is not None:
+        loop = _log_law_packed_loop if depth.ndim == 1 else _log_law_loop
+        loop(depth, vel, log_coef, shields_den if want_ts else log_coef, rho_w, out_tb,
+             out_ts if want_ts else out_tb, want_ts)
+        return
+    if workspace is None:
+        workspace = KernelWorkspace(depth.shape, out_tb.dtype)
+    _log_law_numpy(depth, vel, log_coef, shields_den, rho_w, out_tb, out_ts, workspace)
@@ -0,0 +1,205 @@
+"""
+Raster footprints and spatial queries across conditions.
+
+When a condition is created or imported, the extent, CRS and resolution of its
+rasters are recorded in `raster_footprint`: one row per depth/velocity raster
+(with its discharge), plus the DEM and grain raster. Footprints are native
+PostgreSQL boxes with a GiST index, an R-tree, so the question "which conditions
+and discharges cover this area?" is answered from the index without opening any
+raster. Headers come from raster_validation's header cache.
+
+Footprints are stored in each raster's own coordinates. Queries can be restricted
+to a CRS with `sr_code`.
+
+    python -m Module_Services.spatial_index query --bbox 560000,4350000,561000,4351000 [--wkid 26910]
+    python -m Module_Services.spatial_index query --point 560500,4350500
+    python -m Module_Services.spatial_index query --centerline reach.shp --km 12.5 --buffer 200
+    python -m Module_Services.spatial_index backfill
+"""
+import argparse
+from typing import List, Optional, Tuple
+
+from Database.raster_footprint_table import RASTER_FOOTPRINT_TABLE_SQL
+from Module_Services import discharge_catalog, raster_validation, storage
+
+BBox = Tuple[float, float, float, float]
+
+
+def ensure_footprint_table(conn):
+    storage.require_postgres(conn, "The raster footprint index")
+    cur = conn.cursor()
+    cur.execute(RASTER_FOOTPRINT_TABLE_SQL)
+    conn.commit()
+    cur.close()
+
+
+def _condition_rasters(conn, condition_name: str) -> List[Tuple[str, Optional[str], str]]:
+    """Return [(role, q_str, path)] of a condition's input rasters."""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT digital_elevation_model, grain_size_raster FROM condition WHERE condition_name = %s;",
+        (condition_name,),
+    )
+    row = cur.fetchone()
+    cur.close()
+    if not row:
+        raise ValueError(f"Condition '{condition_name}' not found in database.")
+    rasters = []
+    for record in discharge_catalog.condition_discharges(conn, condition_name):
+        rasters.append(("depth", record["q_str"], record["depth"]))
+        rasters.append(("velocity", record["q_str"], record["velocity"]))
+    if row[0]:
+        rasters.append(("dem", None, row[0]))
+    if row[1]:
+        rasters.append(("grain_size", None, row[1]))
+    return rasters
+
+
+def record_condition_footprints(conn, condition_name: str, commit: bool = True) -> int:
+    """
+    Read (cached) headers of a condition's rasters and replace its footprint rows.
+    Unreadable rasters are skipped. With commit=False the rows join the caller's transaction. Returns the row count.
+    On the SQLite backend nothing is indexed (0); `backfill` after a copy to PostgreSQL catches up.
+    """
+    if storage.backend_of(conn) != "postgres":
+        return 0
+    rasters = _condition_rasters(conn, condition_name)
+    headers = raster_validation.read_headers([path for _, _, path in rasters])
+    rows = []
+    for role, q_str, path in rasters:
+        h = headers.get(path)
+        if h is None:
+            continue
+        rows.append(
+            (
+                condition_name, path, role, q_str,
+                h["xmin"], h["ymin"], h["xmax"], h["ymax"],
+                h["sr_name"], h["sr_code"], h["cell_w"], h["cell_h"], h["rows"], h["cols"],
+            )
+        )
+    cur = conn.cursor()
+    cur.execute(RASTER_FOOTPRINT_TABLE_SQL)
+    cur.execute("DELETE FROM raster_footprint WHERE condition_name = %s;", (condition_name,))
+    cur.executemany(
+        """
+        INSERT INTO raster_footprint (
+            condition_name, raster_path, role, q_str, footprint,
+            sr_name, sr_code, cell_w, cell_h, n_rows, n_cols
+        ) VALUES (%s, %s, %s, %s, box(point(%s, %s), point(%s, %s)), %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (condition_name, raster_path) DO NOTHING;
+        """,
+        rows,
+    )
+    cur.close()
+    if commit:
+        conn.commit()
+    return len(rows)
+
+
+def backfill(conn) -> List[str]:
+    """Record footprints of conditions that have none yet; returns the conditions indexed."""
+    ensure_footprint_table(conn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT c.condition_name FROM condition c
+        WHERE NOT EXISTS (SELECT 1 FROM raster_footprint f WHERE f.condition_name = c.condition_name)
+        ORDER BY c.condition_name;
+        """
+    )
+    names = [r[0] for r in cur.fetchall()]
+    cur.close()
+    done = []
+    for name in names:
+        try:
+            record_condition_footprints(conn, name)
+            done.append(name)
+        except Exception as exc:
+            conn.rollback()
+            print(f"Could not index '{name}': {exc}")
+    return done
+
+
+def query_bbox(conn, bbox: BBox, sr_code: int = None, roles=("depth",)) -> List[dict]:
+    """
+    Return footprints intersecting `bbox` (xmin, ymin, xmax, ymax) as dicts with
+    condition_name, role, q_str and raster_path, ordered by condition and path.
+    """
+    xmin, ymin, xmax, ymax = bbox
+    roles = list(roles) if roles else None
+    ensure_footprint_table(conn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT condition_name, role, q_str, raster_path
+        FROM raster_footprint
+        WHERE footprint && box(point(%s, %s), point(%s, %s))
+          AND (%s IS NULL OR sr_code = %s)
+          AND (%s IS NULL OR role = ANY(%s))
+        ORDER BY condition_name, raster_path;
+        """,
+        (xmin, ymin, xmax, ymax, sr_code, sr_code, roles, roles),
+    )
+    fields = [d[0] for d in cur.description]
+    rows = [dict(zip(fields, r)) for r in cur.fetchall()]
+    cur.close()
+    return rows
+
+
+def conditions_in_bbox(conn, bbox: BBox, sr_code: int = None) -> List[str]:
+    """Names of conditions with at least one raster intersecting `bbox`."""
+    return sorted({r["condition_name"] for r in query_bbox(conn, bbox, sr_code, roles=None)})
+
+
+def centerline_bbox(centerline: str, km: float, buffer: float, unit_per_km: float = 1000.0) -> BBox:
+    """Box of half-width `buffer` around the point `km` along a centreline (first feature)."""
+    import arcpy
+
+    with arcpy.da.SearchCursor(centerline, ["SHAPE@"]) as cursor:
+        line = next(iter(cursor))[0]
+    pnt = line.positionAlongLine(km * unit_per_km).firstPoint
+    return pnt.X - buffer, pnt.Y - buffer, pnt.X + buffer, pnt.Y + buffer
+
+
+def parse_bbox(text: str) -> BBox:
+    """Parse "xmin,ymin,xmax,ymax" (or "x,y" for a point)."""
+    values = [float(v) for v in text.replace(" ", "").split(",")]
+    if len(values) == 2:
+        return values[0], values[1], values[0], values[1]
+    if len(values) != 4:
+        raise ValueError("Expected xmin,ymin,xmax,ymax or x,y.")
+    xmin, ymin, xmax, ymax = values
+    return min(xmin, xmax), min(ymin, ymax), max(xmin, xmax), max(ymin, ymax)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query raster footprints across conditions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    q = sub.add_parser("query")
+    q.add_argument("--bbox")
+    q.add_argument("--point")
+    q.add_argument("--centerline")
+    q.add_argument("--km", type=float)
+    q.add_argument("--buffer", type=float, default=100.0)
+    q.add_argument("--wkid", type=int, default=None)
+    q.add_argument("--all-roles", action="store_true", help="Include velocity, DEM and grain rasters.")
+    sub.add_parser("backfill")
+    args = parser.parse_args(argv)
+
+    conn = storage.connect()
+    try:
+        if args.command == "backfill":
+            print(f"Indexed {len(backfill(conn))} condition(s).")
+            return
+        if args.centerline:
+            bbox = centerline_bbox(args.centerline, args.km or 0.0, args.buffer)
+        else:
+            bbox = parse_bbox(args.bbox or args.point or "")
+        for row in query_bbox(conn, bbox, args.wkid, None if args.all_roles else ("depth",)):
+            print(f"{row['condition_name']:<30} {row['role']:<10} Q{row['q_str'] or '-':<8} {row['raster_path']}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
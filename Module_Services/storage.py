@@ -0,0 +1,509 @@
+"""
+Storage backends for conditions, outputs and run metadata.
+
+    postgres   the shared PostgreSQL database (config.db_settings)
+    sqlite     an embedded single-file database (config.sqlite_path). It needs no
+               server, so local and offline runs, benchmarks and tests start at once
+
+connect() returns a DB-API connection for the configured backend, and the services
+keep taking a `conn` as before. A SQLite connection accepts the PostgreSQL SQL that
+this tree writes:
+
+    %s placeholders, BIGSERIAL, TIMESTAMPTZ / NOW(), BOOLEAN
+    array columns (BIGINT[], DOUBLE PRECISION[]), stored as JSON and read back as lists
+    ALTER TABLE [IF EXISTS] ... ADD COLUMN IF NOT EXISTS
+    upserts (ON CONFLICT ... DO UPDATE / DO NOTHING), multi-statement DDL
+    SELECT ... FOR UPDATE (SQLite serialises writers anyway)
+    COPY ... FROM STDIN WITH (FORMAT csv) through cursor.copy_expert
+
+Features that need the server, such as GiST footprint queries and the distributed
+work queue, raise UnsupportedFeature.
+
+This is a translation shim, not a SQL parser. Statements are rewritten with regular
+expressions, outside quoted literals, quoted identifiers and comments only. The shim
+covers the statements of this tree; new SQL should stay within the list above, or go
+through Repository. Query parameters are adapted by the cursor (datetimes as UTC
+text, lists and arrays as JSON, numpy scalars as numbers). Nothing is registered
+with sqlite3 except converters for the RA_TIMESTAMP, RA_JSONARRAY and RA_BOOLEAN
+column types it declares.
+
+Repository wraps a connection with the condition, output and run-metadata
+operations, behind the same interface for both backends:
+
+    with storage.open_repository() as repo:
+        repo.list_conditions(); repo.get_condition(name); repo.output_paths(name, "bed_shear")
+
+    python -m Module_Services.storage init [--backend sqlite] [--path ra.sqlite]
+    python -m Module_Services.storage copy --source postgres --target sqlite   # offline snapshot
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+BACKENDS = ("postgres", "sqlite")
+# Copied in this order (parents before children); run_log ids are reassigned by the target.
+TABLES = ("condition", "condition_output", "raster_stats", "populate_progress", "run_log", "condition_diff")
+
+
+class UnsupportedFeature(RuntimeError):
+    """Raised when an operation needs the PostgreSQL backend."""
+
+
+def resolve_backend(backend: str = None) -> str:
+    backend = (backend or config.storage_backend or "postgres").strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'. Use one of: {', '.join(BACKENDS)}.")
+    return backend
+
+
+def connect(backend: str = None, path: str = None, **db_settings):
+    """
+    Open a connection to the configured backend (config.storage_backend). For
+    PostgreSQL `db_settings` override config.db_settings; for SQLite `path` overrides
+    config.sqlite_path, and the condition table is created on first use.
+    """
+    if resolve_backend(backend) == "sqlite":
+        conn = SQLiteConnection(path or config.sqlite_path)
+        ensure_schema(conn)
+        return conn
+    import psycopg2
+
+    return psycopg2.connect(**dict(config.db_settings, **db_settings))
+
+
+def backend_of(conn) -> str:
+    return "sqlite" if isinstance(conn, SQLiteConnection) else "postgres"
+
+
+def require_postgres(conn, feature: str):
+    """Raise UnsupportedFeature when `conn` is not a PostgreSQL connection."""
+    if backend_of(conn) != "postgres":
+        raise UnsupportedFeature(f"{feature} needs the PostgreSQL backend (config.storage_backend = 'postgres').")
+
+
+def ensure_schema(conn):
+    """Create the condition table; the other tables are created by their services on first use."""
+    from Database.input_condition_database import CONDITION_TABLE_SQL
+
+    cur = conn.cursor()
+    cur.execute(CONDITION_TABLE_SQL)
+    conn.commit()
+    cur.close()
+
+
+def table_exists(conn, table: str) -> bool:
+    cur = conn.cursor()
+    if backend_of(conn) == "sqlite":
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s;", (table,))
+        exists = cur.fetchone() is not None
+    else:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+        exists = bool(cur.fetchone()[0])
+    cur.close()
+    return exists
+
+
+# ---------------------------------------------------------------------------
+# SQLite connection speaking the PostgreSQL SQL of this tree
+# ---------------------------------------------------------------------------
+
+def _adapt_datetime(value: datetime.datetime) -> str:
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat(sep=" ")
+
+
+def _convert_timestamp(value: bytes) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.decode()).replace(tzinfo=datetime.timezone.utc)
+
+
+def _adapt(value):
+    """Python value of a query parameter -> value sqlite3 stores (applied by SQLiteCursor only)."""
+    if isinstance(value, datetime.datetime):
+        return _adapt_datetime(value)
+    if isinstance(value, list):
+        return json.dumps(value, default=lambda item: item.item())
+    if isinstance(value, np.ndarray):
+        return json.dumps(value.tolist())
+    if isinstance(value, (np.bool_, np.integer)):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def _adapt_params(params) -> tuple:
+    return tuple(_adapt(value) for value in params)
+
+
+# Declared types of translated columns. sqlite3 converters are looked up by declared type
+# in a process-wide registry, so only these RA_ names are registered: other sqlite3 users
+# in the process keep their own TIMESTAMP / BOOLEAN handling.
+sqlite3.register_converter("RA_TIMESTAMP", _convert_timestamp)
+sqlite3.register_converter("RA_JSONARRAY", json.loads)
+sqlite3.register_converter("RA_BOOLEAN", lambda value: value not in (b"0", b""))
+
+_REWRITES = [
+    (re.compile(r"\b(?:BIG)?SERIAL\s+PRIMARY\s+KEY\b", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\b(?:BIGINT|INTEGER|DOUBLE\s+PRECISION|TEXT)\s*\[\]", re.I), "RA_JSONARRAY"),
+    (re.compile(r"\bTIMESTAMPTZ\b", re.I), "RA_TIMESTAMP"),
+    (re.compile(r"\bBOOLEAN\b", re.I), "RA_BOOLEAN"),
+    (re.compile(r"\bNOW\(\)", re.I), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\s+FOR\s+UPDATE(?:\s+SKIP\s+LOCKED)?", re.I), ""),
+]
+_ADD_COLUMN = re.compile(
+    r"^\s*ALTER\s+TABLE\s+(IF\s+EXISTS\s+)?(\w+)\s+ADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\s+(\w+)\s+([^;]+);?\s*$", re.I
+)
+_COPY_CSV = re.compile(r"^\s*COPY\s+(\w+)\s*\(([^)]*)\)\s+FROM\s+STDIN\s+WITH\s*\(\s*FORMAT\s+csv\s*\)\s*;?\s*$", re.I)
+_UNSUPPORTED = re.compile(r"\b(?:USING\s+gist|box\s*\(|pg_(?:try_)?advisory\w*|make_interval|to_jsonb)", re.I)
+# Quoted literals and identifiers, and comments: never rewritten.
+_NOT_CODE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.S)
+_PLACEHOLDER = re.compile(r"%[s%]")
+
+
+def _tokens(sql: str) -> List[Tuple[bool, str]]:
+    """Split a statement into (is_code, text) parts; quoted text and comments are not code."""
+    parts, pos = [], 0
+    for match in _NOT_CODE.finditer(sql):
+        parts.append((True, sql[pos:match.start()]))
+        parts.append((False, match.group()))
+        pos = match.end()
+    parts.append((True, sql[pos:]))
+    return parts
+
+
+def translate(sql: str, with_params: bool = True) -> str:
+    """
+    Rewrite PostgreSQL SQL of this tree for SQLite. Only the SQL outside quoted literals,
+    quoted identifiers and comments is rewritten: "%s" placeholders become "?" and "%%"
+    becomes "%" there. Inside a string literal only "%%" is unescaped, as psycopg2 does.
+    """
+    out = []
+    for is_code, text in _tokens(sql):
+        if is_code:
+            if _UNSUPPORTED.search(text):
+                raise UnsupportedFeature("This statement needs the PostgreSQL backend: " + " ".join(sql.split())[:80])
+            for pattern, replacement in _REWRITES:
+                text = pattern.sub(replacement, text)
+            if with_params:
+                text = _PLACEHOLDER.sub(lambda m: "?" if m.group() == "%s" else "%", text)
+        elif with_params and text.startswith("'"):
+            text = text.replace("%%", "%")
+        out.append(text)
+    return "".join(out)
+
+
+def _statements(sql: str) -> List[str]:
+    """Split a script on the semicolons outside literals and comments."""
+    statements, current = [], []
+    for is_code, text in _tokens(sql):
+        if not is_code:
+            current.append(text)
+            continue
+        pieces = text.split(";")
+        for piece in pieces[:-1]:
+            current.append(piece)
+            statements.append("".join(current))
+            current = []
+        current.append(pieces[-1])
+    statements.append("".join(current))
+    return [s.strip() for s in statements if s.strip()]
+
+
+class SQLiteCursor:
+    """psycopg2-style cursor over sqlite3."""
+
+    def __init__(self, connection: "SQLiteConnection"):
+        self.connection = connection
+        self._cur = connection.raw.cursor()
+
+    def execute(self, sql: str, params=None):
+        with self.connection.lock:
+            match = _ADD_COLUMN.match(sql)
+            if match:
+                self._add_column(*match.groups())
+            elif params is None and len(_statements(sql)) > 1:
+                for statement in _statements(translate(sql, with_params=False)):
+                    self._cur.execute(statement)
+            else:
+                self._cur.execute(translate(sql, params is not None), _adapt_params(params or ()))
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        with self.connection.lock:
+            self._cur.executemany(translate(sql), [_adapt_params(p) for p in seq_of_params])
+        return self
+
+    def _add_column(self, if_exists, table, column, definition):
+        self._cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (table,))
+        if self._cur.fetchone() is None:
+            if if_exists:
+                return
+            raise sqlite3.OperationalError(f"no such table: {table}")
+        self._cur.execute(f"PRAGMA table_info({table});")
+        if column.lower() not in {row[1].lower() for row in self._cur.fetchall()}:
+            self._cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {translate(definition, False)};")
+
+    def copy_expert(self, sql: str, file):
+        """COPY <table> (<columns>) FROM STDIN WITH (FORMAT csv); empty fields are NULL."""
+        match = _COPY_CSV.match(sql)
+        if not match:
+            raise UnsupportedFeature("Only COPY ... FROM STDIN WITH (FORMAT csv) is supported on SQLite.")
+        table, columns = match.group(1), [c.strip() for c in match.group(2).split(",")]
+        rows = [[value if value != "" else None for value in row] for row in csv.reader(file) if row]
+        placeholders = ", ".join("?" for _ in columns)
+        with self.connection.lock:
+            self._cur.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders});", rows)
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size: int = None):
+        return self._cur.fetchmany(size or self._cur.arraysize)
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class SQLiteConnection:
+    """psycopg2-style connection to an embedded SQLite file (foreign keys enforced)."""
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.RLock()
+        self.raw = sqlite3.connect(path, timeout=30.0, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self.raw.execute("PRAGMA foreign_keys = ON;")
+        self.raw.execute("PRAGMA journal_mode = WAL;")
+        self.autocommit = False
+
+    def cursor(self) -> SQLiteCursor:
+        return SQLiteCursor(self)
+
+    def commit(self):
+        with self.lock:
+            self.raw.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Repository
+# ---------------------------------------------------------------------------
+
+class Repository:
+    """Conditions, their outputs and run metadata on one connection (either backend)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.backend = backend_of(conn)
+
+    def list_conditions(self) -> List[str]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT condition_name FROM condition ORDER BY condition_name;")
+        names = [row[0] for row in cur.fetchall()]
+        cur.close()
+        return names
+
+    def get_condition(self, condition_name: str) -> Optional[dict]:
+        """The condition row as {column: value} (output columns included), or None."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM condition WHERE condition_name = %s;", (condition_name,))
+        row = cur.fetchone()
+        fields = [d[0] for d in cur.description]
+        cur.close()
+        return dict(zip(fields, row)) if row else None
+
+    def save_condition(self, condition_name: str, fields: Dict[str, str]):
+        """Insert or update a condition; missing text columns are added."""
+        cur = self.conn.cursor()
+        for column in fields:
+            cur.execute(f"ALTER TABLE condition ADD COLUMN IF NOT EXISTS {column} TEXT;")
+        columns = ["condition_name"] + list(fields)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in fields) or "condition_name = EXCLUDED.condition_name"
+        cur.execute(
+            f"""
+            INSERT INTO condition ({', '.join(columns)}) VALUES ({', '.join('%s' for _ in columns)})
+            ON CONFLICT (condition_name) DO UPDATE SET {updates};
+            """,
+            [condition_name] + list(fields.values()),
+        )
+        self.conn.commit()
+        cur.close()
+
+    def delete_condition(self, condition_name: str):
+        """Delete a condition; its outputs, statistics and run log go with it (ON DELETE CASCADE)."""
+        cur = self.conn.cursor()
+        cur.execute("DELETE FROM condition WHERE condition_name = %s;", (condition_name,))
+        self.conn.commit()
+        cur.close()
+
+    def output_paths(self, condition_name: str, product: str) -> List[str]:
+        """Recorded output rasters of a populate product, in ascending Q order."""
+        from Module_Services import populate_features
+
+        record = self.get_condition(condition_name) or {}
+        return populate_features._split_paths(record.get(populate_features.PRODUCTS[product][3]) or "")
+
+    def record_output_path(self, condition_name: str, product: str, path: str):
+        from Module_Services import populate_features
+
+        populate_features.record_output_path(self.conn, condition_name, product, path)
+
+    def raster_stats(self, condition_name: str, product: str = None) -> List[dict]:
+        from Module_Services import raster_stats
+
+        return raster_stats.condition_stats(self.conn, condition_name, product)
+
+    def latest_run(self, condition_name: str) -> Optional[dict]:
+        from Module_Services import run_log
+
+        return run_log.summarize_run(self.conn, condition_name)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def open_repository(backend: str = None, path: str = None) -> Repository:
+    return Repository(connect(backend, path))
+
+
+def copy_database(source, target, tables=TABLES) -> Dict[str, int]:
+    """
+    Copy the rows of `tables` that exist in `source` into `target` (existing rows are
+    kept). Returns {table: rows read}.
+    """
+    copied = {}
+    for table in tables:
+        if not table_exists(source, table):
+            continue
+        cur = source.cursor()
+        cur.execute(f"SELECT * FROM {table};")
+        fields = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+        cur.close()
+        keep = [i for i, f in enumerate(fields) if not (table == "run_log" and f == "id")]
+        columns = [fields[i] for i in keep]
+        _create_like(target, table)
+        out = target.cursor()
+        for column in columns:
+            out.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} TEXT;")
+        out.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('%s' for _ in columns)}) "
+            "ON CONFLICT DO NOTHING;",
+            [[row[i] for i in keep] for row in rows],
+        )
+        target.commit()
+        out.close()
+        copied[table] = len(rows)
+    return copied
+
+
+def _create_like(conn, table: str):
+    from Database.condition_diff_table import CONDITION_DIFF_TABLE_SQL
+    from Database.condition_output_table import CONDITION_OUTPUT_TABLE_SQL
+    from Database.input_condition_database import CONDITION_TABLE_SQL
+    from Database.populate_progress_table import POPULATE_PROGRESS_TABLE_SQL
+    from Database.raster_stats_table import RASTER_STATS_TABLE_SQL
+    from Database.run_log_table import RUN_LOG_TABLE_SQL
+
+    ddl = {
+        "condition": CONDITION_TABLE_SQL,
+        "condition_output": CONDITION_OUTPUT_TABLE_SQL,
+        "raster_stats": RASTER_STATS_TABLE_SQL,
+        "populate_progress": POPULATE_PROGRESS_TABLE_SQL,
+        "run_log": RUN_LOG_TABLE_SQL,
+        "condition_diff": CONDITION_DIFF_TABLE_SQL,
+    }[table]
+    cur = conn.cursor()
+    cur.execute(ddl)
+    cur.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Storage backends for conditions, outputs and run metadata.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ini = sub.add_parser("init", help="Create the schema of a backend.")
+    ini.add_argument("--backend", choices=BACKENDS, default=None)
+    ini.add_argument("--path", default=None, help="SQLite file (default config.sqlite_path).")
+    cp = sub.add_parser("copy", help="Copy conditions, outputs and run metadata between backends.")
+    cp.add_argument("--source", choices=BACKENDS, default="postgres")
+    cp.add_argument("--target", choices=BACKENDS, default="sqlite")
+    cp.add_argument("--path", default=None, help="SQLite file (default config.sqlite_path).")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        conn = connect(args.backend, args.path)
+        ensure_schema(conn)
+        conn.close()
+        where = (args.path or config.sqlite_path) if resolve_backend(args.backend) == "sqlite" else "PostgreSQL"
+        print(f"Schema is ready ({where}).")
+        return
+    if args.source == args.target:
+        parser.error("--source and --target must differ.")
+    source = connect(args.source, args.path)
+    target = connect(args.target, args.path)
+    try:
+        for table, count in copy_database(source, target).items():
+            print(f"{table}: {count} row(s)")
+    finally:
+        source.close()
+        target.close()
+
+
+if __name__ == "__main__":
+    main()
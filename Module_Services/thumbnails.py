@@ -0,0 +1,147 @@
+"""
+Quick-look thumbnails of input and output rasters.
+
+A thumbnail is a small float array (NaN = nodata) at most `size` cells on its long
+side. GDAL (optional) reads it from the raster's embedded or .ovr overviews, so only
+the overview level is touched. Without GDAL, arcpy reads the raster resampled on the
+fly to the thumbnail cell size (Spatial Analyst Resample), which also draws on the
+pyramids when they exist. ESRI ASCII grids are subsampled from their binary cache
+(ascii_grid). The result is cached as .npy under <dir2cache>/thumbnails, keyed by the
+file fingerprint. Reopening a raster after the first look costs one small file read.
+
+arcpy is not thread-safe: `thread_safe` tells whether a thumbnail can be made on a
+worker thread.
+
+Quantized derived rasters (raster_storage) are returned in physical units.
+`render_rgba` turns a thumbnail into RGBA bytes for display.
+"""
+import hashlib
+import os
+
+import arcpy
+import numpy as np
+
+import config
+import fGl
+from Module_Services import ascii_grid, raster_io, raster_storage
+
+try:
+    from osgeo import gdal
+except ImportError:  # optional dependency
+    gdal = None
+
+BASE_SIZE = 512
+_ROOT = os.path.join(config.dir2cache, "thumbnails")
+
+# Colour ramp (viridis-like) used by render_rgba.
+_RAMP = np.array(
+    [
+        [68, 1, 84],
+        [59, 82, 139],
+        [33, 145, 140],
+        [94, 201, 98],
+        [253, 231, 37],
+    ],
+    dtype=np.float64,
+)
+
+
+def _cache_path(path: str) -> str:
+    key = hashlib.sha1(f"{fGl.file_fingerprint(path)}|{BASE_SIZE}".encode("utf-8")).hexdigest()
+    return os.path.join(_ROOT, key[:2], key + ".npy")
+
+
+def _thumb_shape(rows: int, cols: int, size: int):
+    scale = min(1.0, float(size) / max(rows, cols))
+    return max(1, int(round(rows * scale))), max(1, int(round(cols * scale)))
+
+
+def _read_gdal(path: str, size: int) -> np.ndarray:
+    ds = gdal.Open(path, gdal.GA_ReadOnly)
+    if ds is None:
+        raise OSError(f"GDAL cannot open {path}")
+    band = ds.GetRasterBand(1)
+    out_rows, out_cols = _thumb_shape(ds.RasterYSize, ds.RasterXSize, size)
+    # With a reduced buffer size GDAL picks the closest overview level.
+    array = band.ReadAsArray(buf_xsize=out_cols, buf_ysize=out_rows, resample_alg=gdal.GRIORA_NearestNeighbour)
+    array = array.astype(np.float64)
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        array[array == nodata] = np.nan
+    return array
+
+
+def _sample_indices(rows: int, cols: int, size: int):
+    out_rows, out_cols = _thumb_shape(rows, cols, size)
+    row_idx = np.minimum((np.arange(out_rows) + 0.5) * rows / out_rows, rows - 1).astype(np.int64)
+    col_idx = np.minimum((np.arange(out_cols) + 0.5) * cols / out_cols, cols - 1).astype(np.int64)
+    return row_idx, col_idx
+
+
+def _read_ascii(path: str, size: int) -> np.ndarray:
+    array, header = ascii_grid.cached_array(path)
+    row_idx, col_idx = _sample_indices(header["rows"], header["cols"], size)
+    return np.asarray(array[row_idx][:, col_idx], dtype=np.float64)
+
+
+def _read_arcpy(path: str, size: int) -> np.ndarray:
+    raster = arcpy.Raster(path)
+    out_rows, out_cols = _thumb_shape(raster.height, raster.width, size)
+    cell = max(raster.meanCellWidth * raster.width / out_cols, raster.meanCellHeight * raster.height / out_rows)
+    arcpy.CheckOutExtension("Spatial")
+    # A raster function: only the coarse cells are computed when the array is read.
+    coarse = arcpy.sa.Resample(raster, "NearestNeighbor", None, cell)
+    grid = raster_io.RasterGrid.from_raster(coarse)
+    return raster_io.read_window(coarse, grid, (0, 0, grid.rows, grid.cols))
+
+
+def _to_physical(path: str, array: np.ndarray) -> np.ndarray:
+    meta = raster_storage.read_quantization(path)
+    if meta is None:
+        # Float outputs carry FLOAT_NODATA; GDAL/arcpy usually mask it already.
+        array[array <= raster_storage.FLOAT_NODATA] = np.nan
+        return array
+    array[array == meta["nodata"]] = np.nan
+    return array * meta["scale"] + meta["offset"]
+
+
+def thread_safe(path: str) -> bool:
+    """True when `thumbnail(path)` does not call arcpy (cached, ESRI ASCII grid or GDAL)."""
+    return ascii_grid.is_ascii_grid(path) or gdal is not None or os.path.exists(_cache_path(path))
+
+
+def thumbnail(path: str, size: int = 256) -> np.ndarray:
+    """Return a cached low-resolution float array of a raster (long side <= `size`)."""
+    cache = _cache_path(path)
+    try:
+        base = np.load(cache)
+    except (OSError, ValueError):
+        if ascii_grid.is_ascii_grid(path):
+            base = _read_ascii(path, BASE_SIZE)
+        elif gdal is not None:
+            base = _read_gdal(path, BASE_SIZE)
+        else:
+            base = _read_arcpy(path, BASE_SIZE)
+        base = _to_physical(path, base)
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        tmp = f"{cache}.{os.getpid()}.tmp.npy"
+        np.save(tmp, base)
+        os.replace(tmp, cache)
+    step = int(np.ceil(max(base.shape) / float(size)))
+    return base[::step, ::step] if step > 1 else base
+
+
+def render_rgba(array: np.ndarray) -> np.ndarray:
+    """Colour a thumbnail with a 2-98 percentile stretch; NaN cells are transparent."""
+    valid = np.isfinite(array)
+    rgba = np.zeros(array.shape + (4,), dtype=np.uint8)
+    if not valid.any():
+        return rgba
+    lo, hi = np.percentile(array[valid], [2, 98])
+    span = hi - lo if hi > lo else 1.0
+    t = np.clip((array[valid] - lo) / span, 0.0, 1.0) * (len(_RAMP) - 1)
+    idx = np.minimum(t.astype(np.int64), len(_RAMP) - 2)
+    frac = (t - idx)[:, None]
+    rgba[valid, :3] = np.rint(_RAMP[idx] * (1 - frac) + _RAMP[idx + 1] * frac).astype(np.uint8)
+    rgba[valid, 3] = 255
+    return rgba
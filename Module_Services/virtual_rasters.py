@@ -0,0 +1,293 @@
+"""
+Virtual derived rasters: products evaluated tile by tile when a window is requested.
+
+A VirtualRaster is a populate product (bed shear, Shields, ...) at one discharge,
+defined by its formula over the source rasters. Reading a window evaluates the fused
+kernel only for the tiles the window touches. Tiles are kept in a bounded LRU cache:
+in memory (config.virtual_tile_memory_bytes) and on disk under
+<dir2cache>/virtual_tiles (config.virtual_tile_disk_bytes). Tile keys are built from
+the input fingerprints, unit constants, compute precision and FORMULA_VERSION, so
+edited inputs never serve stale tiles.
+
+Nothing is written to the condition's output folder unless `materialize` is called.
+
+    python -m Module_Services.virtual_rasters <condition> bed_shield 100 --window 0,0,512,512
+    python -m Module_Services.virtual_rasters <condition> bed_shield 100 --materialize
+"""
+import argparse
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+import config
+import fGl
+from Module_Services import (
+    derived_cache,
+    grain_terms,
+    populate_features,
+    raster_io,
+    raster_stats,
+    raster_storage,
+)
+
+
+def _log_law_product(vr: "VirtualRaster", window: raster_io.Window) -> np.ndarray:
+    _, _, nrows, ncols = window
+    out_tb = np.empty((nrows, ncols), dtype=np.float64)
+    out_ts = np.empty((nrows, ncols), dtype=np.float64) if vr.product == "bed_shield" else None
+    populate_features.evaluate_window(vr.ctx, vr.terms, vr.record, window, out_tb, out_ts)
+    return out_ts if out_ts is not None else out_tb
+
+
+# Product -> function(virtual_raster, window) returning the product values of the window.
+FORMULAS: Dict[str, Callable] = {
+    "bed_shear": _log_law_product,
+    "bed_shield": _log_law_product,
+}
+
+
+class TileCache:
+    """Thread-safe LRU of tile arrays in memory, backed by a size-bounded folder of .npy tiles."""
+
+    def __init__(self, memory_bytes: int, disk_bytes: int, folder: str):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.folder = folder
+        self._tiles: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._held = 0
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key + ".npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+        path = self._disk_path(key)
+        if self.disk_bytes <= 0 or not os.path.exists(path):
+            return None
+        try:
+            tile = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, tile)
+        return tile
+
+    def put(self, key: str, tile: np.ndarray):
+        self._remember(key, tile)
+        if self.disk_bytes <= 0:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+        np.save(tmp, tile)
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_writes += 1
+            trim = self._disk_writes % 64 == 0
+        if trim:
+            self.trim_disk()
+
+    def _remember(self, key: str, tile: np.ndarray):
+        tile.setflags(write=False)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return
+            self._tiles[key] = tile
+            self._held += tile.nbytes
+            while self._held > self.memory_bytes and len(self._tiles) > 1:
+                _, dropped = self._tiles.popitem(last=False)
+                self._held -= dropped.nbytes
+
+    def trim_disk(self):
+        """Delete least recently used tile files until the folder fits disk_bytes."""
+        files = []
+        for path in glob.glob(os.path.join(self.folder, "*", "*.npy")):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._held = 0
+
+
+tile_cache = TileCache(
+    config.virtual_tile_memory_bytes,
+    config.virtual_tile_disk_bytes,
+    os.path.join(config.dir2cache, "virtual_tiles"),
+)
+
+
+class VirtualRaster:
+    """One product at one discharge, evaluated on demand over a fixed tile grid."""
+
+    def __init__(self, ctx: dict, record: dict, tile_size: int = None):
+        if ctx["product"] not in FORMULAS:
+            raise ValueError(f"No formula for product '{ctx['product']}'.")
+        self.ctx = ctx
+        self.record = record
+        self.product = ctx["product"]
+        self.grid = ctx["grid"]
+        self.tile_size = max(16, int(tile_size or config.virtual_tile_size))
+        self._terms = None
+        text = "|".join(
+            [
+                self.product,
+                fGl.file_fingerprint(record["depth"]),
+                fGl.file_fingerprint(record["velocity"]),
+                fGl.file_fingerprint(ctx["grain_path"]),
+                repr((ctx["rho_w"], ctx["g"], ctx["s"])),
+                # Tiles computed in float32 never serve a float64 read (compute_precision).
+                np.dtype(ctx["dtype"]).name,
+                f"v{grain_terms.FORMULA_VERSION}",
+                str(self.tile_size),
+            ]
+        )
+        self.key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @property
+    def terms(self):
+        if self._terms is None:
+            self._terms = populate_features.load_context_terms(self.ctx)
+        return self._terms
+
+    @property
+    def shape(self):
+        return self.grid.shape
+
+    def _tile(self, tile_row: int, tile_col: int) -> np.ndarray:
+        key = f"{self.key}_{tile_row}_{tile_col}"
+        tile = tile_cache.get(key)
+        if tile is None:
+            size = self.tile_size
+            row_off, col_off = tile_row * size, tile_col * size
+            window = (row_off, col_off, min(size, self.grid.rows - row_off), min(size, self.grid.cols - col_off))
+            tile = FORMULAS[self.product](self, window)
+            tile_cache.put(key, tile)
+        return tile
+
+    def read(self, window: raster_io.Window = None) -> np.ndarray:
+        """Return the product values of a window (default: the whole raster); NaN = nodata."""
+        row_off, col_off, nrows, ncols = window or (0, 0, self.grid.rows, self.grid.cols)
+        if row_off < 0 or col_off < 0 or row_off + nrows > self.grid.rows or col_off + ncols > self.grid.cols:
+            raise ValueError(f"Window {window} lies outside the {self.grid.rows} x {self.grid.cols} raster.")
+        size = self.tile_size
+        out = np.empty((nrows, ncols), dtype=np.float64)
+        for tile_row in range(row_off // size, (row_off + nrows - 1) // size + 1):
+            for tile_col in range(col_off // size, (col_off + ncols - 1) // size + 1):
+                tile = self._tile(tile_row, tile_col)
+                r0 = max(row_off, tile_row * size)
+                r1 = min(row_off + nrows, tile_row * size + tile.shape[0])
+                c0 = max(col_off, tile_col * size)
+                c1 = min(col_off + ncols, tile_col * size + tile.shape[1])
+                out[r0 - row_off:r1 - row_off, c0 - col_off:c1 - col_off] = tile[
+                    r0 - tile_row * size:r1 - tile_row * size, c0 - tile_col * size:c1 - tile_col * size
+                ]
+        return out
+
+    def read_extent(self, xmin: float, ymin: float, xmax: float, ymax: float) -> np.ndarray:
+        """Return the product values of the cells intersecting a map-unit extent."""
+        grid = self.grid
+        col0 = max(0, int(np.floor((xmin - grid.xmin) / grid.cell_w)))
+        col1 = min(grid.cols, int(np.ceil((xmax - grid.xmin) / grid.cell_w)))
+        row0 = max(0, int(np.floor((grid.ymax - ymax) / grid.cell_h)))
+        row1 = min(grid.rows, int(np.ceil((grid.ymax - ymin) / grid.cell_h)))
+        if row1 <= row0 or col1 <= col0:
+            return np.empty((0, 0), dtype=np.float64)
+        return self.read((row0, col0, row1 - row0, col1 - col0))
+
+    def materialize(self, conn=None, storage_mode: str = None, path: str = None) -> str:
+        """
+        Write the full raster (to the product's usual output path unless `path` is given).
+        With `conn`, the output is also recorded on the condition like a populate run.
+        """
+        out_path = path or populate_features.output_path(self.ctx, self.record)
+        out = np.empty(self.grid.shape, dtype=np.float64)
+        step = self.tile_size
+        for window in raster_io.iter_windows(self.grid.rows, self.grid.cols, step, step):
+            row_off, col_off, nrows, ncols = window
+            out[row_off:row_off + nrows, col_off:col_off + ncols] = self.read(window)
+        stats = raster_stats.RasterStats()
+        raster_storage.save_derived_array(out, out_path, self.record["depth"], storage_mode, stats)
+        if path is None:
+            derived_cache.store(
+                populate_features.derived_cache_key(self.ctx, self.record, storage_mode),
+                out_path,
+                {"condition_name": self.ctx["condition_name"], "q_str": self.record["q_str"], "stats": stats.as_dict()},
+            )
+        if conn is not None and path is None:
+            raster_stats.record_stats(
+                conn, self.ctx["condition_name"], self.product, [(out_path, self.record["q_str"], stats.as_dict())]
+            )
+            populate_features.record_output_path(conn, self.ctx["condition_name"], self.product, out_path)
+        return out_path
+
+
+def open_virtual(conn, condition_name: str, product: str, q_str: str, tile_size: int = None) -> VirtualRaster:
+    """Return the virtual raster of a condition's product at discharge `q_str`."""
+    ctx = populate_features.load_product_context(conn, condition_name, product)
+    return VirtualRaster(ctx, populate_features.find_discharge(ctx, q_str), tile_size)
+
+
+def open_virtual_products(conn, condition_name: str, product: str, tile_size: int = None) -> Dict[str, VirtualRaster]:
+    """Return {q_str: VirtualRaster} for every discharge of a condition (ascending Q)."""
+    ctx = populate_features.load_product_context(conn, condition_name, product)
+    return {record["q_str"]: VirtualRaster(ctx, record, tile_size) for record in ctx["discharges"]}
+
+
+def main(argv=None):
+    from Module_Services import storage
+
+    parser = argparse.ArgumentParser(description="Evaluate a window of a virtual derived raster.")
+    parser.add_argument("condition_name")
+    parser.add_argument("product", choices=sorted(FORMULAS))
+    parser.add_argument("q_str", help="Discharge as written in the depth raster name, e.g. 100 or 1_5.")
+    parser.add_argument("--window", help="row_off,col_off,nrows,ncols (default: whole raster).")
+    parser.add_argument("--materialize", action="store_true", help="Write and record the full raster.")
+    parser.add_argument("--storage-mode", default=None)
+    args = parser.parse_args(argv)
+
+    conn = storage.connect()
+    try:
+        vr = open_virtual(conn, args.condition_name, args.product, args.q_str)
+        if args.materialize:
+            print(vr.materialize(conn, args.storage_mode))
+            return
+        window = tuple(int(v) for v in args.window.split(",")) if args.window else None
+        values = vr.read(window)
+        valid = values[np.isfinite(values)]
+        if valid.size:
+            print(f"{values.shape[0]} x {values.shape[1]} cells, {valid.size} valid, "
+                  f"min {valid.min():.6g}, mean {valid.mean():.6g}, max {valid.max():.6g}")
+        else:
+            print(f"{values.shape[0]} x {values.shape[1]} cells, no valid values")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
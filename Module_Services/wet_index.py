@@ -0,0 +1,128 @@
+"""
+Compressed index of the wetted cells of a depth raster.
+
+At low and moderate flows most cells of a depth raster are dry or NoData, yet a
+per-cell formula only has values where h > 0. A `WetIndex` holds the flat (C-order)
+positions of the wet cells. An engine gathers its inputs into packed 1-D arrays,
+evaluates its formula on those alone, and scatters the results back into a
+full-size output filled with NaN.
+
+The index of a depth raster is built once, strip by strip, and stored as
+<dir2cache>/wet_index/<key>.npy. The key is built from the raster fingerprint and
+the depth threshold. It is always used memory-mapped, and at most MAX_LOADED
+indices stay open per process. Every discharge and product of every engine (shear,
+Shields, morphological units, habitat) shares it:
+
+    index = wet_index.load_wet_index(depth_path, grid)
+    h = index.gather(depth)
+    index.scatter(f(h, index.gather(other)), out)
+"""
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+import fGl
+from Module_Services import raster_io
+
+INDEX_VERSION = 1
+# Indices kept open per process (memory-mapped; least recently used are closed first).
+MAX_LOADED = 16
+
+_ROOT = os.path.join(config.dir2cache, "wet_index")
+_loaded: "OrderedDict[str, WetIndex]" = OrderedDict()
+
+
+class WetIndex:
+    """Flat positions of the cells of a grid whose depth exceeds a threshold."""
+
+    def __init__(self, indices: np.ndarray, shape):
+        self.indices = indices
+        self.shape = tuple(int(n) for n in shape)
+
+    @classmethod
+    def from_depth(cls, depth: np.ndarray, threshold: float = 0.0) -> "WetIndex":
+        """Build the index of an in-memory depth array (NaN is dry)."""
+        return cls(_wet_positions(depth, threshold, 0, _index_dtype(depth.shape)), depth.shape)
+
+    @property
+    def size(self) -> int:
+        return int(self.shape[0] * self.shape[1])
+
+    @property
+    def count(self) -> int:
+        return int(self.indices.size)
+
+    @property
+    def fraction(self) -> float:
+        """Share of wet cells, i.e. the share of the per-cell work that remains."""
+        return self.count / self.size if self.size else 0.0
+
+    def gather(self, array: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """Pack the wet cells of a full-size array (memory-mapped arrays are read sparsely)."""
+        flat = np.asarray(array).reshape(-1)
+        if out is None:
+            return np.take(flat, self.indices)
+        return np.take(flat, self.indices, out=out)
+
+    def scatter(self, values: np.ndarray, out: np.ndarray, fill: float = np.nan) -> np.ndarray:
+        """Write packed values into a contiguous full-size array; dry cells get `fill`."""
+        flat = out.reshape(-1)
+        flat.fill(fill)
+        flat[self.indices] = values
+        return out
+
+
+def _index_dtype(shape):
+    return np.int32 if shape[0] * shape[1] < 2 ** 31 else np.int64
+
+
+def _wet_positions(depth: np.ndarray, threshold: float, offset: int, dtype) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        return (np.flatnonzero(depth > threshold) + offset).astype(dtype, copy=False)
+
+
+def _cache_key(depth_path: str, threshold: float) -> str:
+    text = f"{fGl.file_fingerprint(depth_path)}|{threshold!r}|v{INDEX_VERSION}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _build(path: str, depth_path: str, grid, threshold: float, depth: np.ndarray = None):
+    """Collect wet positions strip by strip (or from a depth array already read) and save them."""
+    dtype = _index_dtype(grid.shape)
+    if depth is not None:
+        indices = _wet_positions(depth, threshold, 0, dtype)
+    else:
+        parts = []
+        for window in raster_io.iter_windows(grid.rows, grid.cols, config.tile_rows):
+            row_off = window[0]
+            strip = raster_io.read_window(depth_path, grid, window)
+            parts.append(_wet_positions(strip, threshold, row_off * grid.cols, dtype))
+        indices = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+    tmp = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp, indices)
+    os.replace(tmp, path)
+
+
+def load_wet_index(depth_path: str, grid=None, threshold: float = 0.0, depth: np.ndarray = None) -> WetIndex:
+    """
+    Return the wet-cell index of a depth raster, building it on first use. Pass `depth`
+    when the full raster has already been read, to avoid reading it again.
+    """
+    key = _cache_key(depth_path, threshold)
+    if key in _loaded:
+        _loaded.move_to_end(key)
+        return _loaded[key]
+    grid = grid or raster_io.RasterGrid.from_raster(depth_path)
+    path = os.path.join(_ROOT, key + ".npy")
+    if not os.path.exists(path):
+        os.makedirs(_ROOT, exist_ok=True)
+        _build(path, depth_path, grid, threshold, depth)
+    # Memory-mapped, also right after building: pages are shared and dropped by the OS.
+    index = WetIndex(np.load(path, mmap_mode="r"), grid.shape)
+    _loaded[key] = index
+    while len(_loaded) > MAX_LOADED:
+        _loaded.popitem(last=False)
+    return index
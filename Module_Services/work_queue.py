@@ -0,0 +1,514 @@
+"""
+PostgreSQL-backed work queue for multi-node raster jobs.
+
+Each row of raster_task is one (condition, product, Q, tile) task. Stateless workers
+on any machine that can reach the river_architect database (config.db_settings, with
+RA_DB_* overrides) claim tasks with SELECT ... FOR UPDATE SKIP LOCKED, evaluate them
+with the fused populate kernel and report the result. While a worker runs, a
+heartbeat thread refreshes raster_worker and the claimed task. Running tasks whose
+heartbeat is older than `stale_after` seconds go back to pending, or to failed after
+MAX_ATTEMPTS attempts.
+
+A discharge split into N tiles is written as .npy parts to "<output>.parts<N>". The
+worker that completes the last tile assembles the raster.
+
+    python -m Module_Services.work_queue enqueue <condition> bed_shield --tiles 4
+    python -m Module_Services.work_queue worker --processes 4 --exit-when-idle
+    python -m Module_Services.work_queue status [<condition>]
+"""
+import argparse
+import multiprocessing
+import os
+import platform
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+import psycopg2
+
+import config
+from Database.work_queue_table import WORK_QUEUE_TABLE_SQL
+from Module_Services import (
+    autotune,
+    derived_cache,
+    pipeline,
+    populate_features,
+    raster_io,
+    raster_stats,
+    raster_storage,
+    shear_kernels,
+)
+
+MAX_ATTEMPTS = 3
+TASK_FIELDS = ("id", "condition_name", "product", "q_str", "tile_index", "tile_count", "storage_mode", "worker_id")
+
+
+def connect():
+    """Open a connection with config.db_settings."""
+    return psycopg2.connect(**config.db_settings)
+
+
+def ensure_work_queue_tables(conn):
+    """Create raster_task and raster_worker if missing."""
+    cur = conn.cursor()
+    cur.execute(WORK_QUEUE_TABLE_SQL)
+    conn.commit()
+    cur.close()
+
+
+def enqueue_product(conn, condition_name: str, product: str, tiles: int = 1, storage_mode: str = None) -> int:
+    """
+    Queue one task per discharge and tile of a product. Finished or failed tasks are
+    reset to pending; pending and running tasks are left alone.
+    Returns the number of tasks submitted.
+    """
+    ensure_work_queue_tables(conn)
+    ctx = populate_features.load_product_context(conn, condition_name, product)
+    tiles = max(1, min(int(tiles), ctx["grid"].rows))
+    rows = [
+        (condition_name, product, record["q_str"], index, tiles, storage_mode)
+        for record in ctx["discharges"]
+        for index in range(tiles)
+    ]
+    cur = conn.cursor()
+    cur.executemany(
+        """
+        INSERT INTO raster_task (condition_name, product, q_str, tile_index, tile_count, storage_mode)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (condition_name, product, q_str, tile_index, tile_count) DO UPDATE SET
+            status = 'pending',
+            storage_mode = EXCLUDED.storage_mode,
+            worker_id = NULL,
+            attempts = 0,
+            heartbeat_at = NULL,
+            result = NULL,
+            error = NULL,
+            finished_at = NULL
+        WHERE raster_task.status IN ('done', 'failed');
+        """,
+        rows,
+    )
+    conn.commit()
+    cur.close()
+    return len(rows)
+
+
+def claim_task(conn, worker_id: str):
+    """Atomically claim the oldest pending task; returns a task dict or None."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE raster_task
+        SET status = 'running', worker_id = %s, attempts = attempts + 1, heartbeat_at = NOW()
+        WHERE id = (
+            SELECT id FROM raster_task
+            WHERE status = 'pending'
+            ORDER BY id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, condition_name, product, q_str, tile_index, tile_count, storage_mode, worker_id;
+        """,
+        (worker_id,),
+    )
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    return dict(zip(TASK_FIELDS, row)) if row else None
+
+
+def requeue_stale(conn, stale_after: float) -> int:
+    """Return running tasks with a lost heartbeat to the queue; returns how many were touched."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE raster_task
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+            worker_id = NULL,
+            error = CONCAT(error, 'heartbeat of worker ', worker_id, ' lost; ')
+        WHERE status = 'running' AND heartbeat_at < NOW() - make_interval(secs => %s)
+        RETURNING id;
+        """,
+        (MAX_ATTEMPTS, float(stale_after)),
+    )
+    count = len(cur.fetchall())
+    conn.commit()
+    cur.close()
+    return count
+
+
+def fail_task(conn, task_id: int, message: str):
+    """Record a task error; the task is retried until MAX_ATTEMPTS."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE raster_task
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+            worker_id = NULL,
+            error = %s
+        WHERE id = %s;
+        """,
+        (MAX_ATTEMPTS, message, task_id),
+    )
+    conn.commit()
+    cur.close()
+
+
+def queue_status(conn, condition_name: str = None):
+    """Return [(condition_name, product, status, count)] for the queue."""
+    ensure_work_queue_tables(conn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT condition_name, product, status, COUNT(*)
+        FROM raster_task
+        WHERE %s IS NULL OR condition_name = %s
+        GROUP BY condition_name, product, status
+        ORDER BY condition_name, product, status;
+        """,
+        (condition_name, condition_name),
+    )
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def _open_task_count(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM raster_task WHERE status IN ('pending', 'running');")
+    count = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return count
+
+
+def _tile_window(grid, tile_index: int, tile_count: int):
+    """Row strip of a tile: tiles split the raster into `tile_count` full-width strips."""
+    rows_per_tile = -(-grid.rows // tile_count)
+    row_off = tile_index * rows_per_tile
+    return row_off, 0, max(0, min(rows_per_tile, grid.rows - row_off)), grid.cols
+
+
+def _compute(ctx, terms, record, window) -> np.ndarray:
+    """Evaluate the product for a window, strip by strip; returns an array shaped like the window."""
+    row_off, col_off, nrows, ncols = window
+    dtype = ctx["dtype"]
+    out_tb = np.empty((nrows, ncols), dtype=dtype)
+    out_ts = np.empty((nrows, ncols), dtype=dtype) if ctx["product"] == "bed_shield" else None
+    tile_rows = min(autotune.plan_for_grid(ctx["grid"], "populate", dtype=dtype).tile_rows, nrows)
+    workspace = shear_kernels.KernelWorkspace((tile_rows, ncols), dtype)
+    strips = [
+        (row_off + sub_off, col_off, sub_rows, ncols)
+        for sub_off, _, sub_rows, _ in raster_io.iter_windows(nrows, ncols, tile_rows)
+    ]
+    # The next strips are read while the current one is evaluated (arcpy reads stay inline).
+    threaded = raster_io.thread_safe(record["depth"]) and raster_io.thread_safe(record["velocity"])
+
+    def read(strip):
+        return populate_features.read_inputs(ctx, record, strip)
+
+    for strip, inputs in pipeline.prefetch(strips, read, threaded=threaded):
+        sub_off, sub_rows = strip[0] - row_off, strip[2]
+        populate_features.evaluate_window(
+            ctx,
+            terms,
+            record,
+            strip,
+            out_tb[sub_off:sub_off + sub_rows],
+            out_ts[sub_off:sub_off + sub_rows] if out_ts is not None else None,
+            workspace,
+            inputs,
+        )
+    return out_ts if out_ts is not None else out_tb
+
+
+def _mark_done(cur, task, result) -> bool:
+    """
+    Mark a claimed task done. Returns False if this worker no longer owns it: its
+    heartbeat was lost and the task was requeued, so the new owner reports it.
+    """
+    cur.execute(
+        """
+        UPDATE raster_task SET status = 'done', result = %s, error = NULL, finished_at = NOW()
+        WHERE id = %s AND worker_id = %s AND status = 'running';
+        """,
+        (result, task["id"], task["worker_id"]),
+    )
+    return cur.rowcount > 0
+
+
+def _complete_tile(conn, task, ctx, record, out_path, parts_dir, part_path) -> str:
+    """Mark a tile done; the worker completing the last tile assembles the output raster."""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT pg_advisory_xact_lock(hashtext(%s));",
+        (f"{task['condition_name']}|{task['product']}|{task['q_str']}|{task['tile_count']}",),
+    )
+    if not _mark_done(cur, task, part_path):
+        conn.commit()
+        cur.close()
+        return part_path
+    cur.execute(
+        """
+        SELECT COUNT(*) FROM raster_task
+        WHERE condition_name = %s AND product = %s AND q_str = %s AND tile_count = %s AND status = 'done';
+        """,
+        (task["condition_name"], task["product"], task["q_str"], task["tile_count"]),
+    )
+    if cur.fetchone()[0] < task["tile_count"]:
+        conn.commit()
+        cur.close()
+        return part_path
+
+    grid = ctx["grid"]
+    full = np.empty(grid.shape, dtype=ctx["dtype"])
+    for index in range(task["tile_count"]):
+        row_off, _, nrows, _ = _tile_window(grid, index, task["tile_count"])
+        full[row_off:row_off + nrows] = np.load(os.path.join(parts_dir, f"{index}.npy"))
+    stats = raster_stats.RasterStats()
+    raster_storage.save_derived_array(full, out_path, record["depth"], task["storage_mode"], stats)
+    cur.execute("UPDATE raster_task SET result = %s WHERE id = %s;", (out_path, task["id"]))
+    cur.close()
+    # Commits the task update together with the output path.
+    populate_features.record_output_path(conn, task["condition_name"], task["product"], out_path)
+    raster_stats.record_stats(conn, task["condition_name"], task["product"], [(out_path, task["q_str"], stats.as_dict())])
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    return out_path
+
+
+def _finish_single(conn, task, out_path, stats) -> str:
+    raster_stats.record_stats(conn, task["condition_name"], task["product"], [(out_path, task["q_str"], stats)])
+    cur = conn.cursor()
+    owned = _mark_done(cur, task, out_path)
+    cur.close()
+    if not owned:
+        conn.commit()
+        return out_path
+    # Commits the task update together with the output path.
+    populate_features.record_output_path(conn, task["condition_name"], task["product"], out_path)
+    return out_path
+
+
+def execute_task(conn, task: dict, contexts: dict) -> str:
+    """Compute one task and report it done; returns the written output or part path."""
+    key = (task["condition_name"], task["product"])
+    if key not in contexts:
+        contexts[key] = populate_features.load_product_context(conn, task["condition_name"], task["product"])
+        populate_features.ensure_output_dir(conn, contexts[key])
+    ctx = contexts[key]
+    record = populate_features.find_discharge(ctx, task["q_str"])
+    terms = populate_features.load_context_terms(ctx)
+    out_path = populate_features.output_path(ctx, record)
+    cache_key = None
+    if task["tile_count"] == 1:
+        cache_key = populate_features.derived_cache_key(ctx, record, task["storage_mode"])
+        if derived_cache.fetch(cache_key, out_path):
+            return _finish_single(conn, task, out_path, derived_cache.entry_info(cache_key).get("stats"))
+    data = _compute(ctx, terms, record, _tile_window(ctx["grid"], task["tile_index"], task["tile_count"]))
+
+    if task["tile_count"] == 1:
+        stats = raster_stats.RasterStats()
+        raster_storage.save_derived_array(data, out_path, record["depth"], task["storage_mode"], stats)
+        derived_cache.store(
+            cache_key,
+            out_path,
+            {"condition_name": task["condition_name"], "q_str": task["q_str"], "stats": stats.as_dict()},
+        )
+        return _finish_single(conn, task, out_path, stats.as_dict())
+
+    # Keyed by tile count: a discharge re-enqueued with another split never mixes parts.
+    parts_dir = f"{out_path}.parts{task['tile_count']}"
+    os.makedirs(parts_dir, exist_ok=True)
+    part_path = os.path.join(parts_dir, f"{task['tile_index']}.npy")
+    tmp_path = part_path + ".tmp.npy"
+    np.save(tmp_path, data)
+    os.replace(tmp_path, part_path)
+    return _complete_tile(conn, task, ctx, record, out_path, parts_dir, part_path)
+
+
+class _Heartbeat(threading.Thread):
+    """Refresh the worker row and its current task on a separate connection."""
+
+    def __init__(self, worker_id: str, interval: float):
+        super().__init__(daemon=True)
+        self.worker_id = worker_id
+        self.interval = interval
+        self.task_id = None
+        self._stop_event = threading.Event()
+        self._conn = connect()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                cur = self._conn.cursor()
+                cur.execute(
+                    "UPDATE raster_worker SET heartbeat_at = NOW(), current_task = %s WHERE worker_id = %s;",
+                    (self.task_id, self.worker_id),
+                )
+                if self.task_id is not None:
+                    cur.execute(
+                        """
+                        UPDATE raster_task SET heartbeat_at = NOW()
+                        WHERE id = %s AND worker_id = %s AND status = 'running';
+                        """,
+                        (self.task_id, self.worker_id),
+                    )
+                self._conn.commit()
+                cur.close()
+            except Exception:
+                try:
+                    self._conn.rollback()
+                except Exception:
+                    pass
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self._conn.close()
+
+
+def run_worker(
+    poll_interval: float = 2.0,
+    heartbeat_interval: float = 10.0,
+    stale_after: float = 60.0,
+    exit_when_idle: bool = False,
+    max_tasks: int = None,
+) -> int:
+    """Claim and run tasks until stopped (or until the queue is empty with `exit_when_idle`)."""
+    worker_id = f"{platform.node()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+    conn = connect()
+    ensure_work_queue_tables(conn)
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO raster_worker (worker_id, host, pid) VALUES (%s, %s, %s) ON CONFLICT (worker_id) DO NOTHING;",
+        (worker_id, platform.node(), os.getpid()),
+    )
+    conn.commit()
+    cur.close()
+
+    heartbeat = _Heartbeat(worker_id, heartbeat_interval)
+    heartbeat.start()
+    contexts = {}
+    processed = 0
+    try:
+        while max_tasks is None or processed < max_tasks:
+            requeue_stale(conn, stale_after)
+            task = claim_task(conn, worker_id)
+            if task is None:
+                if exit_when_idle and _open_task_count(conn) == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+            heartbeat.task_id = task["id"]
+            try:
+                result = execute_task(conn, task, contexts)
+                print(f"[{worker_id}] task {task['id']} ({task['product']} Q{task['q_str']} "
+                      f"tile {task['tile_index'] + 1}/{task['tile_count']}) -> {result}")
+            except Exception as exc:
+                conn.rollback()
+                fail_task(conn, task["id"], f"{type(exc).__name__}: {exc}")
+                contexts.clear()
+                print(f"[{worker_id}] task {task['id']} failed: {exc}")
+            finally:
+                heartbeat.task_id = None
+            processed += 1
+    finally:
+        heartbeat.stop()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM raster_worker WHERE worker_id = %s;", (worker_id,))
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+    return processed
+
+
+def auto_worker_count(conn) -> int:
+    """Worker processes for this machine, planned by autotune from the oldest pending task's rasters."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT condition_name, product, (SELECT COUNT(*) FROM raster_task WHERE status = 'pending')
+        FROM raster_task WHERE status = 'pending' ORDER BY id LIMIT 1;
+        """
+    )
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    if not row:
+        return 1
+    ctx = populate_features.load_product_context(conn, row[0], row[1])
+    plan = autotune.plan_execution(
+        ctx["grid"].rows, ctx["grid"].cols, engine="populate", tasks=row[2], raster_path=ctx["discharges"][0]["depth"]
+    )
+    return plan.workers
+
+
+def run_local_workers(processes: int, **worker_options):
+    """Start `processes` worker processes on this machine and wait for them."""
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=run_worker, kwargs=worker_options) for _ in range(max(1, processes))]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="River Architect distributed raster work queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enq = sub.add_parser("enqueue", help="Queue a product of a condition.")
+    enq.add_argument("condition_name")
+    enq.add_argument("product", choices=sorted(populate_features.PRODUCTS))
+    enq.add_argument("--tiles", type=int, default=1, help="Row strips per discharge.")
+    enq.add_argument("--storage-mode", default=None)
+
+    wrk = sub.add_parser("worker", help="Run worker processes on this machine.")
+    wrk.add_argument("--processes", type=int, default=1, help="0 lets autotune choose from cores and memory.")
+    wrk.add_argument("--poll-interval", type=float, default=2.0)
+    wrk.add_argument("--heartbeat-interval", type=float, default=10.0)
+    wrk.add_argument("--stale-after", type=float, default=60.0)
+    wrk.add_argument("--exit-when-idle", action="store_true")
+
+    st = sub.add_parser("status", help="Show task counts.")
+    st.add_argument("condition_name", nargs="?")
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        options = {
+            "poll_interval": args.poll_interval,
+            "heartbeat_interval": args.heartbeat_interval,
+            "stale_after": args.stale_after,
+            "exit_when_idle": args.exit_when_idle,
+        }
+        if args.processes == 0:
+            conn = connect()
+            try:
+                args.processes = auto_worker_count(conn)
+            finally:
+                conn.close()
+            print(f"Starting {args.processes} worker process(es).")
+        if args.processes > 1:
+            run_local_workers(args.processes, **options)
+        else:
+            run_worker(**options)
+        return
+
+    conn = connect()
+    try:
+        if args.command == "enqueue":
+            count = enqueue_product(conn, args.condition_name, args.product, args.tiles, args.storage_mode)
+            print(f"Queued {count} task(s) for {args.product} of '{args.condition_name}'.")
+        else:
+            for condition_name, product, status, count in queue_status(conn, args.condition_name):
+                print(f"{condition_name:<30} {product:<12} {status:<8} {count:>6}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,3 +10,94 @@ os.makedirs(dir2conditions, exist_ok=True)
 # Unit conversion constant: feet to meters.
 ft2m = 0.3048
 
+
+# Storage mode for derived rasters (shear, Shields): "full", "float32", "int16" or "uint16".
+# See Module_Services/raster_storage.py for the error bound of each mode.
+derived_raster_storage = "full"
+
+# Local cache for derived metadata (raster headers, indexes, precomputed terms); RA_CACHE_DIR moves it.
+dir2cache = os.environ.get("RA_CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+os.makedirs(dir2cache, exist_ok=True)
+
+# PostgreSQL connection for command-line tools; RA_DB_* environment variables override the defaults.
+db_settings = {
+    "dbname": os.environ.get("RA_DB_NAME", "river_architect"),
+    "user": os.environ.get("RA_DB_USER", "postgres"),
+    "password": os.environ.get("RA_DB_PASSWORD", "database"),
+    "host": os.environ.get("RA_DB_HOST", "localhost"),
+    "port": os.environ.get("RA_DB_PORT", "5432"),
+}
+
+# Where conditions, outputs and run metadata live (Module_Services/storage.py): "postgres" uses
+# db_settings; "sqlite" an embedded file needing no server (local/offline runs, benchmarks, tests).
+storage_backend = os.environ.get("RA_STORAGE", "postgres")
+sqlite_path = os.environ.get("RA_SQLITE_PATH", os.path.join(dir2cache, "river_architect.sqlite"))
+
+# Filename stems identifying the discharge of a raster; group "q" holds the number
+# (see fGl.parse_Q_value). Matching is case-insensitive.
+_q_group = r"(?P<q>\d+(?:[._p]\d+)?)"
+discharge_patterns = {
+    "depth": r"^h" + _q_group + r"$",
+    "velocity": r"^[uv]" + _q_group + r"$",
+    "wse": r"^wse" + _q_group + r"$",
+    "velocity_angle": r"^va" + _q_group + r"$",
+}
+
+# Populate engine backend: "fused" (one-pass numpy/numba kernel), "sparse" (the fused kernel on the
+# wet cells only, see Module_Services/wet_index.py) or "arcpy" (map algebra).
+populate_backend = "fused"
+# Compute precision of the fused and sparse backends: "float64" (reference) or "float32" (half the
+# working set; check the error with `python -m Module_Services.compute_precision validate <condition>`).
+compute_precision = "float64"
+# Rows per strip read and evaluated at once by the fused backend (used as is when autotune is off).
+tile_rows = 1024
+# Let Module_Services/autotune.py choose strip height (and local work-queue workers) from cores, memory and geometry.
+autotune = True
+# Target working set of one strip, and the share of available memory the workers may use.
+autotune_strip_bytes = 64 * 1024 ** 2
+autotune_memory_fraction = 0.6
+
+# Overlapped read/compute/write (Module_Services/pipeline.py): strips read ahead of the compute stage,
+# and a writer thread saving one discharge while the next is computed into a second set of buffers.
+# arcpy is not thread-safe: the stages only use threads when the inputs are ESRI ASCII grids.
+pipeline_enabled = True
+pipeline_prefetch = 2
+
+# Content-addressed store of derived rasters shared across conditions (<dir2cache>/derived).
+derived_cache_enabled = True
+# Size limit of the store; least recently used entries are evicted beyond it.
+derived_cache_max_bytes = 20 * 1024 ** 3
+
+# Virtual derived rasters (Module_Services/virtual_rasters.py): tile edge in cells and
+# the in-memory / on-disk tile cache limits.
+virtual_tile_size = 256
+virtual_tile_memory_bytes = 256 * 1024 ** 2
+virtual_tile_disk_bytes = 2 * 1024 ** 3
+
+# Checkpointing of populate runs (Module_Services/checkpoints.py): discharges are always checkpointed.
+# checkpoint_tiles also computes the fused backend into a memory-mapped partial file, so a discharge
+# resumes mid-way (strip progress recorded at most every checkpoint_interval_s). Off by default: the
+# partial file is an extra full-size write of every product; worth it for very large grids.
+checkpoint_tiles = False
+checkpoint_interval_s = 30.0
+
+# Condition comparison (Module_Services/condition_diff.py): tile edge in cells, the absolute difference
+# treated as "no change", and the relative change classed as large.
+diff_tile_size = 512
+diff_tolerance = 1e-6
+diff_large_change = 0.5
+
+# Derived rasters (Module_Services/expressions.py): extra definitions by name, e.g.
+# {"rel_depth": "h / D", "tau_excess": "maximum(ts - 0.047, 0)"}; they can use the built-in ones.
+derived_expressions = {}
+
+# Ingest-time alignment (Module_Services/raster_alignment.py): misaligned inputs of a new condition are
+# resampled onto the DEM grid and cached in <dir2cache>/aligned. Resampling per input kind (NEAREST,
+# BILINEAR or CUBIC) and worker processes (None: one per CPU).
+align_on_ingest = True
+alignment_resampling = {"depth": "BILINEAR", "velocity": "BILINEAR", "grain": "NEAREST"}
+alignment_workers = None
+
+# ESRI ASCII grids (Module_Services/ascii_grid.py) are parsed once into <dir2cache>/ascii; float32 is the
+# precision arcpy reads them in.
+ascii_cache_dtype = "float32"
@@ -31,3 +31,162 @@ def write_Q_str(q_val) -> str:
     except Exception:
         return str(q_val)
 
+
+def file_fingerprint(path: str) -> str:
+    """
+    Return a cheap identity for a file: absolute path, size and modification time.
+    Changes whenever the file is rewritten, without reading its contents.
+    """
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def pid_alive(pid: int) -> bool:
+    """Return True if a process with this id is running on this machine."""
+    if os.name == "nt":
+        import ctypes
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        # PROCESS_QUERY_LIMITED_INFORMATION
+        handle = kernel32.OpenProcess(0x1000, False, int(pid))
+        if not handle:
+            # ERROR_ACCESS_DENIED: the process exists but belongs to another user.
+            return ctypes.get_last_error() == 5
+        try:
+            code = ctypes.c_ulong()
+            # STILL_ACTIVE
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _windows_process_memory():
+    """Return PROCESS_MEMORY_COUNTERS of this process (Windows, without psutil), or None."""
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    # K32GetProcessMemoryInfo: kernel32 export of psapi's GetProcessMemoryInfo (Windows 7+).
+    ok = kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+    return counters if ok else None
+
+
+def _windows_available_memory() -> int:
+    """Return the available physical memory (Windows, without psutil) via GlobalMemoryStatusEx."""
+    import ctypes
+
+    class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [
+            ("dwLength", ctypes.c_ulong),
+            ("dwMemoryLoad", ctypes.c_ulong),
+            ("ullTotalPhys", ctypes.c_ulonglong),
+            ("ullAvailPhys", ctypes.c_ulonglong),
+            ("ullTotalPageFile", ctypes.c_ulonglong),
+            ("ullAvailPageFile", ctypes.c_ulonglong),
+            ("ullTotalVirtual", ctypes.c_ulonglong),
+            ("ullAvailVirtual", ctypes.c_ulonglong),
+            ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+        ]
+
+    status = MEMORYSTATUSEX()
+    status.dwLength = ctypes.sizeof(status)
+    if not ctypes.WinDLL("kernel32").GlobalMemoryStatusEx(ctypes.byref(status)):
+        return 0
+    return int(status.ullAvailPhys)
+
+
+def current_rss_bytes() -> int:
+    """Return the resident memory of this process in bytes (0 if it cannot be determined)."""
+    try:
+        import psutil
+        return int(psutil.Process().memory_info().rss)
+    except ImportError:
+        pass
+    if os.name == "nt":
+        counters = _windows_process_memory()
+        return int(counters.WorkingSetSize) if counters else 0
+    try:
+        with open("/proc/self/statm", "r") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def peak_rss_bytes() -> int:
+    """Return the peak resident memory of this process so far in bytes (0 if unknown)."""
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return int(getattr(info, "peak_wset", 0) or info.rss)
+    except ImportError:
+        pass
+    if os.name == "nt":
+        counters = _windows_process_memory()
+        return int(counters.PeakWorkingSetSize) if counters else 0
+    try:
+        import resource
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def available_memory_bytes() -> int:
+    """Return the memory available to new allocations in bytes (0 if it cannot be determined)."""
+    try:
+        import psutil
+        return int(psutil.virtual_memory().available)
+    except ImportError:
+        pass
+    if os.name == "nt":
+        return _windows_available_memory()
+    try:
+        with open("/proc/meminfo", "r") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return int(os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE"))
+    except (ValueError, AttributeError, OSError):
+        return 0
+
+
+def file_bytes(paths) -> int:
+    """Return the summed size of existing files in `paths`."""
+    return sum(os.path.getsize(p) for p in paths if p and os.path.exists(p))
+
+
+def parse_Q_value(q_str: str):
+    """
+    Convert a discharge string from a filename to a number, or None if it is not numeric.
+    "_" or "p" may stand for the decimal point:
+        "050" -> 50.0, "1_5" -> 1.5, "2p25" -> 2.25
+    """
+    text = (q_str or "").strip().lower().replace("_", ".").replace("p", ".")
+    if not re.fullmatch(r"\d+(\.\d+)?", text):
+        return None
+    return float(text)
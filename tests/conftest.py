@@ -0,0 +1,95 @@
+"""
+Shared fixtures: an embedded SQLite database (Module_Services.storage) and small
+ESRI ASCII rasters, so the services run without a PostgreSQL server.
+
+Modules that exercise raster services need ArcPy and skip themselves without it;
+the storage and discharge catalog tests only need numpy and psycopg2 (for the table
+definitions in Database/). Caches go to a throwaway folder.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("RA_CACHE_DIR", tempfile.mkdtemp(prefix="ra-test-cache-"))
+
+
+def _write_asc(path, array, xmin=0.0, ymin=0.0, cellsize=1.0, nodata=-9999.0):
+    import numpy as np
+
+    data = np.where(np.isfinite(array), array, nodata)
+    with open(path, "w", encoding="ascii") as fh:
+        rows, cols = data.shape
+        fh.write(f"ncols {cols}\nnrows {rows}\nxllcorner {xmin}\nyllcorner {ymin}\n")
+        fh.write(f"cellsize {cellsize}\nNODATA_value {nodata}\n")
+        for row in data:
+            fh.write(" ".join(f"{v:.6f}" for v in row) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def write_asc():
+    """write_asc(path, array, ...) writes an ESRI ASCII grid (NaN as NoData) and returns its path."""
+    return _write_asc
+
+
+@pytest.fixture
+def conn(tmp_path):
+    from Module_Services import storage
+
+    connection = storage.connect("sqlite", str(tmp_path / "river_architect.sqlite"))
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def grids():
+    """
+    Depth, velocity (per Q) and grain arrays of a 6 x 5 reach with dry and NoData cells.
+    Values are exact in float32 and in the 6 decimals written by write_asc, so they
+    read back unchanged.
+    """
+    import numpy as np
+
+    def exact(array):
+        return np.round(array, 6).astype(np.float32).astype(np.float64)
+
+    rng = np.random.default_rng(7)
+    shape = (6, 5)
+    grain = exact(rng.uniform(0.01, 0.1, shape))
+    grain[0, 0] = np.nan
+    depth, velocity = {}, {}
+    for q in (5, 10, 100):
+        h = exact(rng.uniform(0.05, 2.0, shape) * (q / 100.0 + 0.5))
+        h[5, :2] = 0.0  # dry bank
+        h[2, 3] = np.nan
+        depth[q] = h
+        velocity[q] = exact(rng.uniform(0.1, 2.5, shape))
+    return {"depth": depth, "velocity": velocity, "grain": grain}
+
+
+@pytest.fixture
+def condition(conn, tmp_path, write_asc, grids):
+    """A stored SI condition with h5/h10/h100 depth and velocity grids; returns its name."""
+    from Module_Services import storage
+
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    # Listed out of numeric order on purpose.
+    qs = (100, 5, 10)
+    depth = [write_asc(inputs / f"h{q}.asc", grids["depth"][q]) for q in qs]
+    velocity = [write_asc(inputs / f"u{q}.asc", grids["velocity"][q]) for q in qs]
+    storage.Repository(conn).save_condition(
+        "reach",
+        {
+            "depth_rasters": ";".join(depth),
+            "velocity_rasters": ";".join(velocity),
+            "grain_size_raster": write_asc(inputs / "grain.asc", grids["grain"]),
+            "unit": "si",
+            "condition_output_path": str(tmp_path / "reach_outputs"),
+        },
+    )
+    return "reach"
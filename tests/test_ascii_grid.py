@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+import pytest
+
+from Module_Services import ascii_grid
+
+HEADER = "ncols 4\nnrows 3\nxllcenter 0.5\nyllcorner 0.0\ncellsize 1.0\nNODATA_value -9999\n"
+
+
+@pytest.fixture
+def small_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(ascii_grid, "_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(ascii_grid, "_BLOCK_BYTES", 5)  # numbers are cut by block boundaries
+
+
+def test_values_wrap_across_lines_and_blocks(tmp_path, small_blocks):
+    path = tmp_path / "h5.asc"
+    path.write_bytes((HEADER + "1.25 2 3\r\n4 5.5\n  6 -9999 8\t9\n10 11\n\n12.125\n").encode("ascii"))
+    array_path, meta_path = str(tmp_path / "h5.npy"), str(tmp_path / "h5.json")
+    meta = ascii_grid.convert(str(path), array_path, meta_path)
+    expected = np.array([[1.25, 2, 3, 4], [5.5, 6, np.nan, 8], [9, 10, 11, 12.125]])
+    np.testing.assert_array_equal(np.load(array_path), expected.astype(np.float32))
+    assert (meta["rows"], meta["cols"], meta["xmin"], meta["ymax"], meta["nodata"]) == (3, 4, 0.0, 3.0, -9999.0)
+    with open(meta_path, "r", encoding="utf-8") as fh:
+        assert json.load(fh) == meta
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_file()) == ["h5.asc", "h5.json", "h5.npy"]
+
+
+def test_short_grids_are_rejected_without_leftovers(tmp_path, small_blocks):
+    path = tmp_path / "u5.asc"
+    path.write_text(HEADER + "1 2 3 4\n5 6 7 8\n9 10 11\n")
+    with pytest.raises(ValueError, match="holds 11 values"):
+        ascii_grid.convert(str(path), str(tmp_path / "u5.npy"), str(tmp_path / "u5.json"))
+    assert [p.name for p in tmp_path.iterdir() if p.is_file()] == ["u5.asc"]
+
+
+def test_cached_array_is_parsed_once(tmp_path, small_blocks, write_asc, monkeypatch):
+    values = np.arange(12.0).reshape(3, 4)
+    values[1, 2] = np.nan
+    path = write_asc(tmp_path / "h10.asc", values)
+    array, meta = ascii_grid.cached_array(path)
+    np.testing.assert_array_equal(array, values)
+    monkeypatch.setattr(ascii_grid, "convert", None)  # would fail if called
+    again, _ = ascii_grid.cached_array(path)
+    assert again is array
+
+
+def test_open_arrays_are_bounded_and_released_by_clean(tmp_path, small_blocks, write_asc, monkeypatch):
+    monkeypatch.setattr(ascii_grid, "MAX_OPEN", 2)
+    monkeypatch.setattr(ascii_grid, "_open", ascii_grid.OrderedDict())
+    paths = [write_asc(tmp_path / f"h{q}.asc", np.full((2, 2), float(q))) for q in (5, 10, 20)]
+    for path in paths:
+        ascii_grid.cached_array(path)
+    assert list(ascii_grid._open) == paths[1:]
+    (tmp_path / "h20.asc").unlink()
+    assert ascii_grid.clean() > 0
+    assert list(ascii_grid._open) == paths[1:2]
+    assert not [p for p in (tmp_path / "cache").iterdir() if ".tmp" in p.name]
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("arcpy")
+
+import config  # noqa: E402
+from Module_Services import derived_cache  # noqa: E402
+
+
+def test_rasters_sharing_a_stem_are_not_sidecars(tmp_path):
+    for name in ("h1.tif", "h1.tfw", "h1.prj", "h1.tif.aux.xml", "h1.tif.ovr", "h1.5.tif", "h1.5.tfw", "h1.txt"):
+        (tmp_path / name).write_bytes(name.encode("ascii"))
+    files = derived_cache._raster_files(str(tmp_path / "h1.tif"))
+    assert [f[len(str(tmp_path)) + 1:] for f in files] == ["h1.tif", "h1.prj", "h1.tfw", "h1.tif.aux.xml"]
+    before = derived_cache.content_digest(str(tmp_path / "h1.tif"))
+    (tmp_path / "h1.5.tif").write_bytes(b"edited")
+    assert derived_cache.content_digest(str(tmp_path / "h1.tif")) == before
+
+
+def test_the_store_is_scanned_only_past_its_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(derived_cache, "_ROOT", str(tmp_path / "derived"))
+    monkeypatch.setattr(derived_cache, "_stored_bytes", None)
+    monkeypatch.setattr(config, "derived_cache_enabled", True)
+    monkeypatch.setattr(config, "derived_cache_max_bytes", 2500)
+    scans = []
+    entries = derived_cache._entries
+    monkeypatch.setattr(derived_cache, "_entries", lambda: scans.append(1) or entries())
+    for index in range(4):
+        raster = tmp_path / f"tb{index}.tif"
+        raster.write_bytes(b"x" * 1000)
+        derived_cache.store(f"{index:02d}key", str(raster))
+        (tmp_path / "derived" / f"{index:02d}" / f"{index:02d}key" / "entry.json").touch()
+    # One scan to seed the running total, one per eviction (at the third and fourth entry).
+    assert len(scans) == 3
+    assert derived_cache.usage()["entries"] == 2
+    assert derived_cache.fetch("03key", str(tmp_path / "out" / "tb3.tif"))
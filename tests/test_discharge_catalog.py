@@ -0,0 +1,45 @@
+import pytest
+
+from Module_Services import discharge_catalog
+
+
+def test_pairs_by_discharge_in_numeric_order():
+    depth = ["/d/h100.tif", "/d/h5.tif", "/d/h050.tif", "/d/h7p5.tif"]
+    vel = ["/v/u50.tif", "/v/u100.tif", "/v/u7_5.tif", "/v/u005.tif"]
+    records = discharge_catalog.pair_discharges(depth, vel)
+    assert [r["q"] for r in records] == [5.0, 7.5, 50.0, 100.0]
+    assert [r["q_str"] for r in records] == ["5", "7p5", "050", "100"]
+    assert [(r["depth"], r["velocity"]) for r in records] == [
+        ("/d/h5.tif", "/v/u005.tif"),
+        ("/d/h7p5.tif", "/v/u7_5.tif"),
+        ("/d/h050.tif", "/v/u50.tif"),
+        ("/d/h100.tif", "/v/u100.tif"),
+    ]
+
+
+def test_unmatched_discharge_is_reported():
+    with pytest.raises(discharge_catalog.CatalogError, match="Q = 20"):
+        discharge_catalog.pair_discharges(["/d/h10.tif", "/d/h20.tif"], ["/v/u10.tif", "/v/u30.tif"])
+
+
+def test_duplicate_discharge_is_reported():
+    with pytest.raises(discharge_catalog.CatalogError, match="appears twice"):
+        discharge_catalog.pair_discharges(["/d/h10.tif", "/d/h010.tif"], ["/v/u10.tif", "/v/u11.tif"])
+
+
+def test_names_without_discharge_pair_by_position():
+    records = discharge_catalog.pair_discharges(["/d/high.tif", "/d/low.tif"], ["/v/a.tif", "/v/b.tif"])
+    assert [r["q"] for r in records] == [None, None]
+    assert [(r["depth"], r["velocity"]) for r in records] == [("/d/high.tif", "/v/a.tif"), ("/d/low.tif", "/v/b.tif")]
+    with pytest.raises(discharge_catalog.CatalogError, match="count mismatch"):
+        discharge_catalog.pair_discharges(["/d/high.tif"], ["/v/a.tif", "/v/b.tif"])
+
+
+def test_condition_discharges(conn, condition):
+    records = discharge_catalog.condition_discharges(conn, condition)
+    assert [r["q"] for r in records] == [5.0, 10.0, 100.0]
+
+
+def test_rasters_named_for_another_kind_are_rejected():
+    with pytest.raises(discharge_catalog.CatalogError, match="u5.tif is named as a velocity raster, not a depth"):
+        discharge_catalog.pair_discharges(["/d/h10.tif", "/d/u5.tif"], ["/v/u10.tif", "/v/u5.tif"])
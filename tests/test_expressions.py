@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from Module_Services import expressions
+
+CONSTANTS = {"rho_w": 1000.0, "g": 9.81, "s": 2.68, "n": 1.0}
+
+
+def _ops(program, op):
+    return [node for node in program.nodes if node[0] == op]
+
+
+def test_shared_definitions_and_repeated_subexpressions_are_computed_once():
+    us = "where(h > 0, u / (5.75 * log10(log_coef * h)), nan)"
+    program = expressions.compile_expressions(["tb", "ts", f"tb2 = rho_w * ({us}) ** 2"], CONSTANTS)
+    assert len(_ops(program, "log10")) == 1
+    assert program.outputs["tb"] == program.outputs["tb2"]
+    assert program.inputs == ["D", "h", "u"]
+    swapped = expressions.compile_expressions(["a = h * u + 1", "b = 1 + u * h"], {}, {})
+    assert swapped.outputs["a"] == swapped.outputs["b"]
+    assert len(swapped.nodes) == 5
+
+
+def test_constant_subtrees_are_folded():
+    program = expressions.compile_expressions(["x = h * (rho_w * g * (s - 1)) + sqrt(4) * pi / pi"], CONSTANTS)
+    consts = [node[1] for node in _ops(program, "const")]
+    assert consts == pytest.approx([1000.0 * 9.81 * 1.68, 2.0])
+    assert [node[0] for node in program.nodes if node[0] != "const"] == ["input", "mul", "add"]
+    nan_only = expressions.compile_expressions(["y = nan * 2"], {}, {})
+    assert len(nan_only.nodes) == 1 and np.isnan(nan_only.nodes[0][1])
+
+
+def test_evaluate_matches_numpy():
+    h = np.array([[0.0, 0.5], [1.0, np.nan]])
+    u = np.array([[1.0, 0.8], [1.2, 1.0]])
+    D = np.array([[0.05, 0.05], [0.0, 0.05]])
+    program = expressions.compile_expressions(["ts", "froude", "wet = h > 0"], CONSTANTS)
+    out = program.evaluate({"h": h, "u": u, "D": D})
+    with np.errstate(divide="ignore", invalid="ignore"):
+        us = np.where(h > 0, u / (5.75 * np.log10(h * np.where(D > 0, 12.2 / (2 * 2.2 * D), np.nan))), np.nan)
+        ts = 1000.0 * us ** 2 / (1000.0 * 9.81 * 1.68 * D)
+        froude = np.where(h > 0, u / np.sqrt(9.81 * h), np.nan)
+    np.testing.assert_allclose(out["ts"], np.where(np.isfinite(ts), ts, np.nan))
+    np.testing.assert_allclose(out["froude"], froude)
+    np.testing.assert_array_equal(out["wet"], [[0.0, 1.0], [1.0, 0.0]])
+
+
+def test_circular_and_unknown_names_are_rejected():
+    with pytest.raises(expressions.ExpressionError, match="Circular definition: a -> b -> a"):
+        expressions.compile_expressions(["a"], {}, {"a": "b + 1", "b": "a * h"})
+    with pytest.raises(expressions.ExpressionError, match="Unknown name 'q'"):
+        expressions.compile_expressions(["c = q + h"], {}, {})
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("arcpy")
+
+import config  # noqa: E402
+from Module_Services import autotune, derived_cache, populate_features, raster_storage, storage  # noqa: E402
+
+RHO_W, G, S = 1000.0, 9.81, 2.68
+
+
+def reference_log_law(depth, vel, grain, product):
+    """The log-law chain written out as in the original map algebra."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tb = RHO_W * (vel / (5.75 * np.log10(depth * 12.2 / (2 * 2.2 * grain)))) ** 2
+        tb[~(depth > 0)] = np.nan
+        if product == "bed_shear":
+            return tb
+        return tb / (RHO_W * G * (S - 1) * grain)
+
+
+@pytest.mark.parametrize("backend", ["fused", "sparse"])
+@pytest.mark.parametrize("product", ["bed_shear", "bed_shield"])
+def test_matches_reference_formula(conn, condition, grids, monkeypatch, backend, product):
+    # Every run computes: no reuse of rasters derived by another test from the same inputs.
+    monkeypatch.setattr(config, "derived_cache_enabled", False)
+    run = (
+        populate_features.calculate_bed_shear_stress
+        if product == "bed_shear"
+        else populate_features.calculate_bed_shield_stress
+    )
+    outputs = run(condition, conn, storage_mode="full", backend=backend, precision="float64")
+
+    prefix = populate_features.PRODUCTS[product][0]
+    assert [os.path.basename(p) for p in outputs] == [f"{prefix}5.tif", f"{prefix}10.tif", f"{prefix}100.tif"]
+    assert storage.Repository(conn).output_paths(condition, product) == outputs
+    for q, path in zip((5, 10, 100), outputs):
+        expected = reference_log_law(grids["depth"][q], grids["velocity"][q], grids["grain"], product)
+        actual = raster_storage.read_derived_array(path)
+        assert np.array_equal(np.isnan(actual), np.isnan(expected)), q
+        assert np.allclose(actual, expected, rtol=1e-6, equal_nan=True), q
+
+
+def test_rerun_is_served_from_checkpoints(conn, condition, monkeypatch):
+    monkeypatch.setattr(config, "derived_cache_enabled", False)
+    first = populate_features.calculate_bed_shear_stress(condition, conn, backend="fused")
+    mtimes = [os.stat(p).st_mtime_ns for p in first]
+    second = populate_features.resume_product(condition, conn, "bed_shear", backend="fused")
+    assert second == first
+    assert [os.stat(p).st_mtime_ns for p in second] == mtimes
+
+
+def test_strip_checkpoints_leave_no_partial_file(conn, condition, grids, monkeypatch):
+    monkeypatch.setattr(config, "derived_cache_enabled", False)
+    monkeypatch.setattr(config, "checkpoint_tiles", True)
+    outputs = populate_features.calculate_bed_shear_stress(condition, conn, backend="fused")
+    for q, path in zip((5, 10, 100), outputs):
+        assert not os.path.exists(path + ".partial.npy")
+        expected = reference_log_law(grids["depth"][q], grids["velocity"][q], grids["grain"], "bed_shear")
+        assert np.allclose(raster_storage.read_derived_array(path), expected, rtol=1e-6, equal_nan=True)
+
+
+def test_loading_a_context_changes_nothing(conn, condition, tmp_path):
+    repo = storage.Repository(conn)
+    before = repo.get_condition(condition)
+    ctx = populate_features.load_product_context(conn, condition, "bed_shear")
+    assert ctx["out_dir"] == str(tmp_path / "reach_outputs" / "shear rasters")
+    assert repo.get_condition(condition) == before
+    assert not (tmp_path / "reach_outputs").exists()
+    populate_features.ensure_output_dir(conn, ctx)
+    assert os.path.isdir(ctx["out_dir"])
+    assert repo.get_condition(condition)["shear_rasters_folder"] == ctx["out_dir"]
+
+
+def test_autotune_learns_from_computed_strips_only(conn, condition, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "derived_cache_enabled", True)
+    monkeypatch.setattr(config, "autotune", True)
+    monkeypatch.setattr(derived_cache, "_ROOT", str(tmp_path / "derived"))
+    results = []
+    monkeypatch.setattr(autotune, "record_result", lambda plan, pixels, seconds=None: results.append((pixels, seconds)))
+    populate_features.calculate_bed_shear_stress(condition, conn, backend="fused")
+    assert len(results) == 1 and results[0][0] == 3 * 6 * 5 and results[0][1] > 0
+    populate_features.calculate_bed_shear_stress(condition, conn, backend="fused")  # all derived-cache hits
+    assert len(results) == 1
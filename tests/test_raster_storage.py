@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+arcpy = pytest.importorskip("arcpy")
+
+from Module_Services import raster_io, raster_stats, raster_storage  # noqa: E402
+
+
+@pytest.mark.parametrize("mode", ["int16", "uint16"])
+def test_quantization_params_cover_the_code_range(mode):
+    _, lo, hi, _ = raster_storage._INT_LAYOUT[mode]
+    scale, offset, max_err = raster_storage.quantization_params(-3.0, 250.0, mode)
+    assert lo * scale + offset == pytest.approx(-3.0)
+    assert hi * scale + offset == pytest.approx(250.0)
+    assert max_err == pytest.approx(scale / 2)
+    assert raster_storage.quantization_params(4.0, 4.0, mode)[2] == 0.0
+
+
+@pytest.mark.parametrize("mode", ["full", "float32", "int16", "uint16"])
+def test_round_trip(tmp_path, write_asc, mode):
+    values = np.linspace(0.0, 87.5, 30).reshape(6, 5)
+    values[1, 2] = np.nan
+    reference = write_asc(tmp_path / "reference.asc", np.zeros_like(values))
+    path = str(tmp_path / f"tb_{mode}.tif")
+    meta = raster_storage.save_derived_array(values, path, reference, mode)
+    restored = raster_storage.read_derived_array(path)
+
+    assert np.array_equal(np.isnan(restored), np.isnan(values))
+    valid = np.isfinite(values)
+    if mode in ("int16", "uint16"):
+        assert meta["min"] == 0.0 and meta["max"] == 87.5
+        assert np.abs(restored[valid] - values[valid]).max() <= meta["max_abs_error"] * (1 + 1e-9)
+    else:
+        assert meta is None
+        assert np.allclose(restored[valid], values[valid], rtol=2.0 ** -24, atol=0.0)
+    grid = raster_io.RasterGrid.from_raster(reference)
+    assert np.allclose(raster_io.read_window(path, grid, (1, 1, 4, 3)), restored[1:5, 1:4], equal_nan=True)
+    assert not [name for name in tmp_path.iterdir() if name.name.startswith("_tmp")]
+
+
+def test_temp_path_only_removes_leftovers_of_finished_processes(tmp_path):
+    path = str(tmp_path / "tb5.tif")
+    own = os.path.basename(raster_storage._temp_path(path))
+    prefix = own[: own.rindex("-")]
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    finished = tmp_path / f"{prefix}-{child.pid}_tb5.tif"
+    running = tmp_path / f"{prefix}-{os.getppid()}_tb5.tif"
+    for leftover in (finished, running):
+        leftover.write_bytes(b"")
+        (tmp_path / (leftover.name + ".aux.xml")).write_bytes(b"")
+    raster_storage._temp_path(path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [running.name, running.name + ".aux.xml"]
+
+
+@pytest.mark.parametrize("mode", ["full", "int16"])
+def test_saving_a_raster_counts_stats_from_the_written_pixels(tmp_path, write_asc, mode):
+    values = np.linspace(-1.0, 4.0, 30).reshape(6, 5)
+    values[3, 1] = np.nan
+    source = write_asc(tmp_path / "source.asc", values)
+    stats = raster_stats.RasterStats()
+    path = str(tmp_path / f"tb_{mode}.tif")
+    raster_storage.save_derived_raster(arcpy.Raster(source), path, mode, stats)
+    written = stats.as_dict()
+    assert (written["total_count"], written["valid_count"], written["wet_count"]) == (30, 29, 23)
+    assert (written["min"], written["max"]) == pytest.approx((-1.0, 4.0))
+    assert np.allclose(raster_storage.read_derived_array(path), values, atol=1e-3, equal_nan=True)
+
+
+def test_strip_writer_keeps_nothing_when_the_block_fails(tmp_path, write_asc):
+    reference = write_asc(tmp_path / "reference.asc", np.zeros((4, 3)))
+    stats = raster_stats.RasterStats()
+    with pytest.raises(RuntimeError):
+        with raster_storage.StripWriter(str(tmp_path / "tb_diff5.tif"), reference, "int16", stats) as out:
+            out.write(0, np.ones((2, 3)))
+            out.write(2, np.array([[np.nan, 2.0, 3.0], [4.0, 5.0, 6.0]]))
+            raise RuntimeError("interrupted")
+    assert (stats.as_dict()["valid_count"], stats.as_dict()["max"]) == (11, 6.0)
+    assert [p.name for p in tmp_path.iterdir()] == ["reference.asc"]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("arcpy")
+
+from Module_Services import raster_validation  # noqa: E402
+
+WKT = (
+    'PROJCS["NAD_1983_UTM_Zone_10N",GEOGCS["GCS_North_American_1983",DATUM["D_North_American_1983",'
+    'SPHEROID["GRS_1980",6378137.0,298.257222101]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],'
+    'PROJECTION["Transverse_Mercator"],UNIT["Meter",1.0],AUTHORITY["EPSG",26910]]'
+)
+
+
+def test_ascii_headers_are_parsed_without_arcpy(tmp_path, write_asc, monkeypatch):
+    monkeypatch.setattr(raster_validation, "_describe", None)  # would fail if called
+    paths = [write_asc(tmp_path / f"h{q}.asc", np.ones((4, 3)), xmin=10.0, ymin=20.0, cellsize=2.0) for q in (5, 10)]
+    (tmp_path / "h5.prj").write_text(WKT)
+    headers = raster_validation.read_headers(paths)
+    assert headers[paths[0]] == {
+        "xmin": 10.0,
+        "ymin": 20.0,
+        "xmax": 16.0,
+        "ymax": 28.0,
+        "cell_w": 2.0,
+        "cell_h": 2.0,
+        "rows": 4,
+        "cols": 3,
+        "pixel_type": "F32",
+        "nodata": -9999.0,
+        "sr_name": "NAD_1983_UTM_Zone_10N",
+        "sr_code": 26910,
+    }
+    assert (headers[paths[1]]["sr_name"], headers[paths[1]]["sr_code"]) == ("Unknown", 0)
+
+
+def test_validate_condition_rasters(tmp_path, write_asc):
+    grain = write_asc(tmp_path / "grain.asc", np.ones((4, 3)), nodata=-1.0)
+    depth = write_asc(tmp_path / "h5.asc", np.ones((4, 3)))
+    shifted = write_asc(tmp_path / "u5.asc", np.ones((4, 3)), xmin=5.0, nodata=-1.0)
+    errors, warnings = raster_validation.validate_condition_rasters([depth], [shifted], grain_path=grain)
+    assert errors == ["Velocity raster 'u5.asc' extent (5.000, 0.000, 8.000, 4.000) does not match grain size raster."]
+    assert warnings == ["Depth raster 'h5.asc' NoData value -9999 differs from grain size raster (-1)."]
+
+
+def test_cache_drops_changed_rasters(tmp_path, write_asc, monkeypatch):
+    monkeypatch.setattr(raster_validation, "_CACHE_FILE", str(tmp_path / "raster_headers.json"))
+    monkeypatch.setattr(raster_validation, "_cache", None)
+    kept = write_asc(tmp_path / "kept.asc", np.ones((2, 2)))
+    gone = write_asc(tmp_path / "gone.asc", np.ones((2, 2)))
+    raster_validation.read_headers([kept, gone])
+    (tmp_path / "gone.asc").unlink()
+    write_asc(tmp_path / "new.asc", np.ones((2, 2)))
+    raster_validation.read_headers([str(tmp_path / "new.asc")])
+    cached = [key.rsplit("|", 2)[0] for key in raster_validation._load_cache()]
+    assert sorted(cached) == sorted([str(tmp_path / "kept.asc"), str(tmp_path / "new.asc")])
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("arcpy")
+
+import config  # noqa: E402
+from Module_Services import populate_features, raster_storage, sampling  # noqa: E402
+
+# 6 x 5 grid, lower-left corner (0, 0), 1 m cells: row 0 spans y 5..6.
+POINTS = [("gauge", 2.5, 4.5), ("outside", 9.0, 9.0)]
+SQUARE = [(0.0, 6.0), (2.0, 6.0), (2.0, 4.0), (0.0, 4.0)]
+
+
+def test_recorded_outputs(conn, condition, tmp_path):
+    column = populate_features.PRODUCTS["bed_shear"][3]
+    assert sampling.recorded_outputs(conn, condition, column) == {}
+    kept = tmp_path / "tb10.tif"
+    kept.write_bytes(b"")
+    populate_features.record_output_path(conn, condition, "bed_shear", str(kept))
+    populate_features.record_output_path(conn, condition, "bed_shear", str(tmp_path / "tb5.tif"))
+    assert sampling.recorded_outputs(conn, condition, column) == {10.0: str(kept)}
+    with pytest.raises(ValueError):
+        sampling.recorded_outputs(conn, condition, "unit")
+
+
+def test_samples_points_and_polygons(conn, condition, grids):
+    rows = sampling.sample_condition(
+        conn, condition, points=POINTS, polygons=[("bank", SQUARE)], products=("depth", "velocity")
+    )
+    assert len(rows) == 2 * 3 * 3
+    by_key = {(r["feature_id"], r["product"], r["q"]): r for r in rows}
+    for q in (5, 10, 100):
+        for product in ("depth", "velocity"):
+            array = grids[product][q]
+            assert by_key[("gauge", product, float(q))]["value"] == pytest.approx(array[1, 2])
+            assert by_key[("outside", product, float(q))]["value"] is None
+            square = by_key[("bank", product, float(q))]
+            assert square["count"] == 4
+            assert square["mean"] == pytest.approx(array[:2, :2].mean())
+            assert square["max"] == pytest.approx(array[:2, :2].max())
+
+
+def test_samples_recorded_products(conn, condition, monkeypatch):
+    monkeypatch.setattr(config, "derived_cache_enabled", False)
+    outputs = populate_features.calculate_bed_shear_stress(condition, conn, backend="fused")
+    rows = sampling.sample_condition(conn, condition, points=POINTS[:1], products=("bed_shear",))
+    assert [r["q"] for r in rows] == [5.0, 10.0, 100.0]
+    for row, path in zip(rows, outputs):
+        expected = raster_storage.read_derived_array(path)[1, 2]
+        assert np.isfinite(expected)
+        assert row["value"] == pytest.approx(float(expected))
@@ -0,0 +1,94 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from Module_Services import storage
+
+
+def test_translate_rewrites_postgres_sql():
+    sql = storage.translate(
+        "CREATE TABLE t (id BIGSERIAL PRIMARY KEY, qs DOUBLE PRECISION[], at TIMESTAMPTZ DEFAULT NOW());"
+    )
+    assert "INTEGER PRIMARY KEY AUTOINCREMENT" in sql
+    assert "qs RA_JSONARRAY" in sql
+    assert "at RA_TIMESTAMP DEFAULT CURRENT_TIMESTAMP" in sql
+    assert storage.translate("SELECT a FROM t WHERE b = %s FOR UPDATE SKIP LOCKED;") == "SELECT a FROM t WHERE b = ?;"
+    assert storage.translate("SELECT a FROM t WHERE b LIKE 'x%%';") == "SELECT a FROM t WHERE b LIKE 'x%';"
+
+
+def test_translate_leaves_literals_and_comments_alone():
+    sql = "SELECT 'NOW() %s; BOOLEAN', \"for update\" FROM t -- %s NOW()\nWHERE a = %s;"
+    assert storage.translate(sql) == "SELECT 'NOW() %s; BOOLEAN', \"for update\" FROM t -- %s NOW()\nWHERE a = ?;"
+    assert storage._statements("INSERT INTO t VALUES ('a;b'); SELECT 1;") == ["INSERT INTO t VALUES ('a;b')", "SELECT 1"]
+
+
+def test_adapters_stay_on_the_connection(conn):
+    import sqlite3
+
+    assert not [key for key in sqlite3.adapters if key[0] in (list, np.ndarray, np.int64, np.float32)]
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS t (qs DOUBLE PRECISION[], n INTEGER, flag BOOLEAN);")
+    cur.execute("INSERT INTO t (qs, n, flag) VALUES (%s, %s, %s);", ([np.float32(1.5), 2.0], np.int64(3), np.bool_(True)))
+    cur.execute("SELECT qs, n, flag FROM t;")
+    assert cur.fetchone() == ([1.5, 2.0], 3, True)
+    cur.close()
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "CREATE INDEX i ON raster_footprint USING gist (box(point(0, 0), point(1, 1)));",
+        "SELECT pg_try_advisory_lock(%s);",
+        "SELECT NOW() - make_interval(secs => %s);",
+        "SELECT to_jsonb(c) ->> %s FROM condition c;",
+    ],
+)
+def test_translate_rejects_postgres_only_features(sql):
+    with pytest.raises(storage.UnsupportedFeature):
+        storage.translate(sql)
+
+
+def test_upsert_and_added_columns(conn):
+    repo = storage.Repository(conn)
+    repo.save_condition("a", {"unit": "si"})
+    repo.save_condition("a", {"unit": "us", "bed_shear_rasters": "x.tif"})
+    assert repo.list_conditions() == ["a"]
+    record = repo.get_condition("a")
+    assert record["unit"] == "us"
+    assert record["bed_shear_rasters"] == "x.tif"
+    assert repo.get_condition("missing") is None
+
+
+def test_arrays_timestamps_and_for_update(conn):
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS t (id BIGSERIAL PRIMARY KEY, qs DOUBLE PRECISION[], at TIMESTAMPTZ);")
+    cur.execute("INSERT INTO t (qs, at) VALUES (%s, NOW()) RETURNING id;", ([1.5, 10.0],))
+    row_id = cur.fetchone()[0]
+    cur.execute("SELECT qs, at FROM t WHERE id = %s FOR UPDATE;", (row_id,))
+    qs, at = cur.fetchone()
+    cur.close()
+    assert qs == [1.5, 10.0]
+    assert isinstance(at, datetime.datetime) and at.tzinfo is not None
+
+
+def test_on_conflict_do_update(conn):
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v INTEGER);")
+    for value in (1, 2):
+        cur.execute(
+            "INSERT INTO kv (k, v) VALUES (%s, %s) ON CONFLICT (k) DO UPDATE SET v = EXCLUDED.v;", ("key", value)
+        )
+    cur.execute("SELECT COUNT(*), MAX(v) FROM kv;")
+    assert cur.fetchone() == (1, 2)
+    cur.close()
+
+
+def test_copy_database_between_sqlite_files(conn, condition, tmp_path):
+    target = storage.connect("sqlite", str(tmp_path / "copy.sqlite"))
+    try:
+        counts = storage.copy_database(conn, target)
+        assert counts["condition"] == 1
+        assert storage.Repository(target).get_condition(condition) == storage.Repository(conn).get_condition(condition)
+    finally:
+        target.close()
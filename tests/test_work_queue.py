@@ -0,0 +1,113 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("arcpy")
+
+from Module_Services import work_queue  # noqa: E402
+
+
+class StubConnection:
+    """
+    Records the statements run on it. `rows` maps a statement prefix to the rows it returns
+    (and its rowcount); other statements affect one row.
+    """
+
+    def __init__(self, rows=None):
+        self.rows = rows or {}
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+class StubCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        self.conn.executed.append((sql, tuple(params)))
+        self.result = next((rows for prefix, rows in self.conn.rows.items() if sql.startswith(prefix)), None)
+        self.rowcount = 1 if self.result is None else len(self.result)
+        self.result = self.result or []
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return list(self.result)
+
+    def close(self):
+        pass
+
+
+TASK = {"id": 7, "condition_name": "c", "product": "bed_shield", "q_str": "100", "tile_count": 2,
+        "storage_mode": None, "worker_id": "node-1"}
+
+
+def test_claim_task_returns_the_claimed_row():
+    row = (7, "c", "bed_shield", "100", 1, 2, "quantized", "node-1")
+    conn = StubConnection({"UPDATE raster_task SET status = 'running'": [row]})
+    assert work_queue.claim_task(conn, "node-1") == dict(zip(work_queue.TASK_FIELDS, row))
+    sql, params = conn.executed[0]
+    assert "FOR UPDATE SKIP LOCKED" in sql and params == ("node-1",)
+    assert conn.commits == 1
+    assert work_queue.claim_task(StubConnection(), "node-1") is None
+
+
+@pytest.fixture
+def tiles(tmp_path, monkeypatch):
+    written = {}
+    monkeypatch.setattr(work_queue.raster_storage, "save_derived_array",
+                        lambda array, path, reference, mode, stats: written.update({path: array.copy()}))
+    monkeypatch.setattr(work_queue.populate_features, "record_output_path", lambda conn, *args: conn.commit())
+    monkeypatch.setattr(work_queue.raster_stats, "record_stats", lambda *args: None)
+    grid = SimpleNamespace(rows=5, cols=3, shape=(5, 3))
+    ctx = {"grid": grid, "dtype": np.float32}
+    parts_dir = tmp_path / "tb100.tif.parts2"
+    parts_dir.mkdir()
+    full = np.arange(15, dtype=np.float32).reshape(5, 3)
+    for index in range(2):
+        row_off, _, nrows, _ = work_queue._tile_window(grid, index, 2)
+        np.save(parts_dir / f"{index}.npy", full[row_off:row_off + nrows])
+    return SimpleNamespace(ctx=ctx, parts_dir=str(parts_dir), full=full, written=written,
+                           out_path=str(tmp_path / "tb100.tif"))
+
+
+def test_completing_a_tile_waits_for_the_other_tiles(tiles):
+    conn = StubConnection({"SELECT COUNT(*)": [(1,)]})
+    part = os.path.join(tiles.parts_dir, "0.npy")
+    assert work_queue._complete_tile(conn, TASK, tiles.ctx, {"depth": None}, tiles.out_path, tiles.parts_dir,
+                                     part) == part
+    assert [sql.split(" SET")[0].split(" WHERE")[0] for sql, _ in conn.executed] == [
+        "SELECT pg_advisory_xact_lock(hashtext(%s));", "UPDATE raster_task", "SELECT COUNT(*) FROM raster_task"]
+    assert conn.commits == 1 and not tiles.written and os.path.isdir(tiles.parts_dir)
+
+
+def test_the_last_tile_assembles_the_raster(tiles):
+    conn = StubConnection({"SELECT COUNT(*)": [(2,)]})
+    part = os.path.join(tiles.parts_dir, "1.npy")
+    assert work_queue._complete_tile(conn, TASK, tiles.ctx, {"depth": None}, tiles.out_path, tiles.parts_dir,
+                                     part) == tiles.out_path
+    np.testing.assert_array_equal(tiles.written[tiles.out_path], tiles.full)
+    assert conn.executed[-1] == ("UPDATE raster_task SET result = %s WHERE id = %s;", (tiles.out_path, 7))
+    assert conn.commits == 1 and not os.path.exists(tiles.parts_dir)
+
+
+def test_a_requeued_tile_is_left_to_its_new_owner(tiles):
+    conn = StubConnection({"UPDATE raster_task SET status = 'done'": [], "SELECT COUNT(*)": [(2,)]})
+    part = os.path.join(tiles.parts_dir, "1.npy")
+    assert work_queue._complete_tile(conn, TASK, tiles.ctx, {"depth": None}, tiles.out_path, tiles.parts_dir,
+                                     part) == part
+    sql, params = conn.executed[1]
+    assert sql.endswith("WHERE id = %s AND worker_id = %s AND status = 'running';") and params == (part, 7, "node-1")
+    assert len(conn.executed) == 2 and conn.commits == 1 and not tiles.written